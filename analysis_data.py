@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Preloaded analysis artifacts for the IBD RNA-Seq Analysis Platform API
+
+Every CSV the pipeline writes to ANALYSIS_DIR is parsed once into read-only
+NumPy column arrays: numeric columns as float64 and text columns (gene
+symbols, model names) as fixed-width unicode arrays rather than object
+arrays. A table is therefore a handful of array objects whose data buffers
+hold no Python objects, so when gunicorn preloads the app in the master
+process the buffers are shared copy-on-write with every worker and never
+touched by reference counting or the garbage collector.
+"""
+
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+class ResultTable:
+    """Column arrays of one analysis CSV file"""
+
+    def __init__(self, df):
+        """
+        Parameters:
+        -----------
+        df : pd.DataFrame
+            Table to convert; a named index becomes the first column
+        """
+        if df.index.name is not None:
+            df = df.reset_index()
+
+        self.columns = {}
+        for name in df.columns:
+            values = df[name]
+            if pd.api.types.is_numeric_dtype(values) and not pd.api.types.is_bool_dtype(values):
+                array = values.to_numpy(dtype=np.float64)
+            elif pd.api.types.is_bool_dtype(values):
+                array = values.to_numpy(dtype=bool)
+            else:
+                array = values.astype(str).to_numpy(dtype=str)
+            array.setflags(write=False)
+            self.columns[str(name)] = array
+
+    def __len__(self):
+        return len(next(iter(self.columns.values()))) if self.columns else 0
+
+    def __contains__(self, name):
+        return name in self.columns
+
+    def __getitem__(self, name):
+        return self.columns[name]
+
+    def records(self, order=None):
+        """
+        Rows as a list of dicts of plain Python values
+
+        Parameters:
+        -----------
+        order : np.ndarray
+            Row indices to emit, in order (optional)
+        """
+        names = list(self.columns)
+        columns = [self.columns[n] if order is None else self.columns[n][order] for n in names]
+        return [dict(zip(names, row)) for row in zip(*(c.tolist() for c in columns))]
+
+class ScoreMatrix:
+    """Read-only float32 matrix with row and column labels"""
+
+    def __init__(self, df):
+        self.rows = df.index.astype(str).to_numpy(dtype=str)
+        self.columns = df.columns.astype(str).to_numpy(dtype=str)
+        self.values = df.to_numpy(dtype=np.float32)
+        for array in (self.rows, self.columns, self.values):
+            array.setflags(write=False)
+
+def load_table(path, index_col=None):
+    """Read one CSV file into a ResultTable"""
+    return ResultTable(pd.read_csv(path, index_col=index_col))
+
+class AnalysisData:
+    """All analysis tables under the analysis directory"""
+
+    def __init__(self, analysis_dir):
+        self.analysis_dir = Path(analysis_dir)
+        self.differential_expression = {}
+        self.pathway_analysis = {}
+        self.pathway_activity = {}
+        self.model_comparison = None
+        self.potential_targets = None
+        self.reload()
+
+    def reload(self):
+        """Parse every known analysis CSV file"""
+        de_dir = self.analysis_dir / 'differential_expression'
+        pathway_dir = self.analysis_dir / 'pathway_analysis'
+        activity_dir = self.analysis_dir / 'pathway_activity'
+
+        self.differential_expression = {
+            path.name[:-len('_differential_expression.csv')]: load_table(path, index_col=0)
+            for path in sorted(de_dir.glob('*_differential_expression.csv'))
+        }
+        self.pathway_analysis = {
+            path.name[:-len('_pathway_analysis.csv')]: load_table(path)
+            for path in sorted(pathway_dir.glob('*_pathway_analysis.csv'))
+        }
+        self.pathway_activity = {
+            path.name[:-len('_pathway_activity.csv')]: ScoreMatrix(pd.read_csv(path, index_col=0))
+            for path in sorted(activity_dir.glob('*_pathway_activity.csv'))
+        }
+
+        comparison_file = self.analysis_dir / 'model_comparison' / 'mouse_model_human_comparison.csv'
+        self.model_comparison = load_table(comparison_file) if comparison_file.exists() else None
+
+        # identify_potential_targets writes to the output directory it is given
+        target_files = sorted(self.analysis_dir.rglob('potential_targets.csv')) if self.analysis_dir.is_dir() else []
+        self.potential_targets = load_table(target_files[0]) if target_files else None
@@ -6,32 +6,279 @@ Backend API for IBD RNA-Seq Analysis Platform
 import os
 import sys
 import json
+import time
+import hashlib
+import threading
 import pandas as pd
 import numpy as np
+from collections import OrderedDict
+from functools import wraps
 from pathlib import Path
-from flask import Flask, request, jsonify, send_from_directory
+from flask import Flask, Response, request, jsonify, send_from_directory, stream_with_context
 from flask_cors import CORS
 
+from analysis_data import AnalysisData
+from expression_store import ExpressionStore
+from gene_search import build_gene_search_index
+from response_formats import JSON_MIMETYPE, available_mimetypes, encode_columns
+from volcano_lod import volcano_lod
+from knockout_engine import load_network
+from knockout_screen import KnockoutScreen, DEFAULT_TARGETS, screen_executor
+from gene_sets import load_gene_sets
+from static_assets import AssetManifest, IMMUTABLE_CACHE_CONTROL, REVALIDATE_CACHE_CONTROL
+from metrics import instrument_app
+from request_profiler import install_profiler
+
 # Define base directories
 BASE_DIR = Path(__file__).resolve().parent
 DATA_DIR = BASE_DIR / 'data'
 ANALYSIS_DIR = BASE_DIR / 'analysis'
 WEB_DIR = BASE_DIR / 'web'
+EXPRESSION_STORE_DIR = ANALYSIS_DIR / 'expression_store'
+ANNOTATION_DIR = DATA_DIR / 'annotations'
+NETWORK_FILE = DATA_DIR / 'networks' / 'regulatory_network.tsv'
+GENE_SET_DIR = DATA_DIR / 'gene_sets'
+
+# Genes that are always searchable, even before annotations are downloaded
+DEFAULT_SEARCH_GENES = [
+    'IL1B', 'TNF', 'IL6', 'IL17A', 'IFNG', 'FOXP3', 'RORC', 'TBX21', 'GATA3', 'IL10',
+    'IL23A', 'IL12B', 'TGFB1', 'STAT3', 'STAT1', 'NFKB1', 'RELA', 'MAPK1', 'MAPK3', 'JAK1',
+    'JAK2', 'TLR4', 'TLR2', 'MYD88', 'NLRP3', 'IL18', 'IL1A', 'IL4', 'IL5', 'IL13',
+    'CCL2', 'CCL5', 'CXCL8', 'CXCL10', 'CCR2', 'CCR5', 'CXCR3', 'CD4', 'CD8A', 'CD19',
+    'CD3E', 'CD14', 'CD68', 'ITGAM', 'ITGAX', 'PTGS2', 'NOS2', 'ARG1', 'MRC1', 'IL1RN'
+]
+
+# Precompress and fingerprint the frontend assets once at server start
+static_manifest = AssetManifest(WEB_DIR)
+
+# Open the memory-mapped expression store (shared across workers via the page cache)
+expression_store = ExpressionStore(EXPRESSION_STORE_DIR)
+
+# Parse the analysis tables once; with gunicorn's preload_app this happens in the
+# master process and the read-only arrays are shared with every forked worker
+analysis_data = AnalysisData(ANALYSIS_DIR)
+
+# Build the gene search index once at server start
+gene_search_index = build_gene_search_index(
+    DEFAULT_SEARCH_GENES,
+    annotation_dir=ANNOTATION_DIR,
+    extra_symbols=[gene for model in expression_store.models.values() for gene in model.genes.tolist()]
+)
+
+# Regulatory network for knockout simulation, built-in network if no file exists
+regulatory_network = load_network(NETWORK_FILE)
+
+# Gene set collection (GMT files), packed as bitsets for overlap queries
+gene_set_collection = load_gene_sets(GENE_SET_DIR)
+
+# Models served by the API
+MODEL_NAMES = {
+    'cd45rb': 'CD45RBHigh T cell',
+    'acute_dss': 'Acute DSS',
+    'chronic_dss': 'Chronic DSS',
+    'il10ko': 'IL-10KO',
+    'human_uc': 'Human UC',
+    'human_cd': 'Human CD'
+}
+
+# Largest number of gene search results per request
+MAX_SEARCH_RESULTS = 100
+
+# Number of genes looked up per block when streaming expression data
+STREAM_BLOCK_SIZE = 256
+
+# Knockout screen limits; each API worker process shares one small screen pool
+MAX_SCREEN_COMBINATIONS = 5_000_000
+SCREEN_WORKERS = int(os.environ.get('KNOCKOUT_SCREEN_WORKERS', 0)) or max(1, min(4, (os.cpu_count() or 1) // 2))
+
+# Analysis directories the API reads; writes elsewhere (stage cache, figures) keep cached responses
+SERVED_ANALYSIS_DIRS = ('differential_expression', 'pathway_analysis', 'pathway_activity', 'model_comparison',
+                        EXPRESSION_STORE_DIR.name)
+
+# Response cache settings
+RESPONSE_CACHE_MAX_BYTES = 64 * 1024 * 1024
+ANALYSIS_CHECK_INTERVAL = 2.0  # Seconds between checks for changed analysis files
 
 # Create Flask app
 app = Flask(__name__, static_folder=str(WEB_DIR))
 CORS(app)  # Enable CORS for all routes
+metrics_registry = instrument_app(app)  # Per-route metrics exposed at /metrics
+install_profiler(app)  # Opt-in per-request profiling via X-Profile-Token
+
+class ResponseCache:
+    """Byte-size-bounded LRU cache of rendered responses"""
+
+    def __init__(self, max_bytes):
+        self.max_bytes = max_bytes
+        self.current_bytes = 0
+        self.entries = OrderedDict()
+        self.lock = threading.Lock()
+
+    def get(self, key):
+        """Return the cached entry for a key and mark it as recently used"""
+        with self.lock:
+            entry = self.entries.get(key)
+            if entry is not None:
+                self.entries.move_to_end(key)
+            return entry
+
+    def put(self, key, entry):
+        """Store an entry, evicting least recently used entries to stay within budget"""
+        size = len(entry['body'])
+        if size > self.max_bytes:
+            return
+        with self.lock:
+            old = self.entries.pop(key, None)
+            if old is not None:
+                self.current_bytes -= len(old['body'])
+            self.entries[key] = entry
+            self.current_bytes += size
+            while self.current_bytes > self.max_bytes:
+                _, evicted = self.entries.popitem(last=False)
+                self.current_bytes -= len(evicted['body'])
+
+    def clear(self):
+        """Drop every entry"""
+        with self.lock:
+            self.entries.clear()
+            self.current_bytes = 0
+
+response_cache = ResponseCache(RESPONSE_CACHE_MAX_BYTES)
+analysis_state = {'version': None, 'checked_at': 0.0, 'lock': threading.Lock()}
+screen_state = {'executor': None, 'lock': threading.Lock()}
+
+def shared_screen_executor():
+    """This process's knockout screen pool, started on first use (after the gunicorn fork)"""
+    if SCREEN_WORKERS == 1:
+        return None
+    with screen_state['lock']:
+        if screen_state['executor'] is None:
+            screen_state['executor'] = screen_executor(regulatory_network, SCREEN_WORKERS)
+        return screen_state['executor']
+
+def analysis_files_version():
+    """Fingerprint of the served analysis files (paths, sizes and modification times)"""
+    digest = hashlib.sha1()
+    for directory in SERVED_ANALYSIS_DIRS:
+        for root, dirs, files in os.walk(ANALYSIS_DIR / directory):
+            dirs.sort()
+            for name in sorted(files):
+                path = os.path.join(root, name)
+                try:
+                    stat = os.stat(path)
+                except OSError:
+                    continue  # Removed between listing and stat (e.g., a temporary file or old store version)
+                digest.update(f"{path}:{stat.st_size}:{stat.st_mtime_ns}".encode())
+    return digest.hexdigest()
+
+def current_analysis_version():
+    """Return the analysis version, reloading the data and clearing the response cache when files change"""
+    if time.monotonic() - analysis_state['checked_at'] >= ANALYSIS_CHECK_INTERVAL:
+        with analysis_state['lock']:
+            # Threads that waited for the lock find the check already done
+            now = time.monotonic()
+            if now - analysis_state['checked_at'] >= ANALYSIS_CHECK_INTERVAL:
+                version = analysis_files_version()
+                if version != analysis_state['version']:
+                    if analysis_state['version'] is not None:
+                        expression_store.reload()
+                        analysis_data.reload()
+                    # Published only once the reloaded data is in place
+                    analysis_state['version'] = version
+                    response_cache.clear()
+                analysis_state['checked_at'] = now
+    return analysis_state['version']
+
+def positive_int(value):
+    """A JSON integer or digit string as a positive int, or None if it is neither"""
+    if isinstance(value, str) and value.strip().isdigit():
+        value = int(value)
+    if not isinstance(value, int) or isinstance(value, bool) or value < 1:
+        return None
+    return value
+
+def negotiated_mimetype():
+    """Pick the response media type from the Accept header (JSON by default)"""
+    return request.accept_mimetypes.best_match(available_mimetypes(), default=JSON_MIMETYPE)
+
+def columnar_response(mimetype, rows, columns, metadata=None, row_name='row'):
+    """Build a binary response from row labels and named float columns"""
+    chunks = encode_columns(mimetype, rows, columns, metadata, row_name=row_name)
+    response = Response(chunks, mimetype=mimetype)
+    response.headers['Vary'] = 'Accept'
+    return response
+
+def cached_response(view):
+    """Serve a read-only endpoint from the response cache with strong ETags"""
+    @wraps(view)
+    def wrapper(*args, **kwargs):
+        # Key on endpoint, normalized query parameters and analysis version
+        params = tuple(sorted(
+            (key, tuple(value.strip() for value in request.args.getlist(key)))
+            for key in request.args
+        ))
+        key = (request.endpoint, params, negotiated_mimetype(), current_analysis_version())
+        
+        entry = response_cache.get(key)
+        cache_status = 'HIT'
+        if entry is None:
+            cache_status = 'MISS'
+            response = app.make_response(view(*args, **kwargs))
+            if response.status_code != 200:
+                return response
+            body = response.get_data()
+            entry = {
+                'body': body,
+                'etag': hashlib.sha256(body).hexdigest(),
+                'mimetype': response.mimetype
+            }
+            response_cache.put(key, entry)
+        
+        # Conditional requests for an unchanged payload get an empty 304
+        if request.if_none_match.contains(entry['etag']):
+            response = app.response_class(status=304)
+        else:
+            response = app.response_class(entry['body'], mimetype=entry['mimetype'])
+        response.set_etag(entry['etag'])
+        response.headers['Cache-Control'] = 'no-cache'
+        response.headers['Vary'] = 'Accept'
+        response.headers['X-Cache'] = cache_status
+        return response
+    return wrapper
+
+def serve_static_asset(path):
+    """Serve a precompressed static asset, falling back to the file system"""
+    asset, immutable = static_manifest.lookup(path)
+    if asset is None:
+        return send_from_directory(app.static_folder, path)
+    
+    # Pick the best precompressed variant for this client
+    encoding = asset.select_encoding(request.accept_encodings)
+    etag = asset.etag(encoding)
+    
+    if request.if_none_match.contains(etag):
+        response = app.response_class(status=304)
+    else:
+        response = app.response_class(asset.variants[encoding], mimetype=asset.mimetype)
+        if encoding != 'identity':
+            response.headers['Content-Encoding'] = encoding
+    
+    # Fingerprinted names never change content, so they can be cached forever
+    response.set_etag(etag)
+    response.headers['Cache-Control'] = IMMUTABLE_CACHE_CONTROL if immutable else REVALIDATE_CACHE_CONTROL
+    response.headers['Vary'] = 'Accept-Encoding'
+    return response
 
 # Define routes
 @app.route('/')
 def index():
     """Serve the main HTML page"""
-    return send_from_directory(app.static_folder, 'index.html')
+    return serve_static_asset('index.html')
 
 @app.route('/<path:path>')
 def static_files(path):
     """Serve static files"""
-    return send_from_directory(app.static_folder, path)
+    return serve_static_asset(path)
 
 @app.route('/api/gene_expression', methods=['GET'])
 def get_gene_expression():
@@ -40,18 +287,53 @@ def get_gene_expression():
     genes = request.args.get('genes', '').split(',')
     models = request.args.get('models', '').split(',')
     
-    # In a real implementation, this would query the database or load from files
-    # For demonstration, we'll return simulated data
-    
-    # Load gene expression data from analysis directory
+    # Load gene expression data from the expression store
     try:
-        # Simulate loading data from files
-        data = simulate_gene_expression_data(genes, models)
+        mimetype = negotiated_mimetype()
+        if mimetype != JSON_MIMETYPE:
+            model_ids, values, errors = load_gene_expression_arrays(genes, models)
+            columns = {}
+            for j, model_id in enumerate(model_ids):
+                columns[f"{model_id}:value"] = values[:, j]
+                columns[f"{model_id}:error"] = errors[:, j]
+            metadata = {'models': {m: MODEL_NAMES[m] for m in model_ids}}
+            return columnar_response(mimetype, genes, columns, metadata, row_name='gene')
+        
+        data = load_gene_expression_data(genes, models)
         return jsonify(data)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/gene_expression', methods=['POST'])
+def stream_gene_expression():
+    """Stream gene expression data for a large gene list as NDJSON (one gene per line)"""
+    # Get request body: {"genes": [...], "models": [...]}
+    body = request.get_json(silent=True) or {}
+    genes = body.get('genes')
+    models = body.get('models') or list(MODEL_NAMES)
+    
+    if not isinstance(genes, list) or not all(isinstance(g, str) for g in genes):
+        return jsonify({'error': "Request body must contain a 'genes' list of gene symbols"}), 400
+    if not isinstance(models, list) or not all(isinstance(m, str) for m in models):
+        return jsonify({'error': "'models' must be a list of model identifiers"}), 400
+    
+    def generate():
+        # Look genes up block by block so memory stays flat and rows arrive early
+        for start in range(0, len(genes), STREAM_BLOCK_SIZE):
+            block = genes[start:start + STREAM_BLOCK_SIZE]
+            data = load_gene_expression_data(block, models)
+            for gene in block:
+                row = {'gene': gene, 'values': {}, 'errors': {}}
+                for model_id, model_data in data['models'].items():
+                    if gene in model_data['values']:
+                        row['values'][model_id] = model_data['values'][gene]
+                        row['errors'][model_id] = model_data['errors'][gene]
+                yield json.dumps(row) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
 @app.route('/api/pathway_analysis', methods=['GET'])
+@cached_response
 def get_pathway_analysis():
     """Get pathway analysis data for specified pathway and models"""
     # Get query parameters
@@ -69,7 +351,43 @@ def get_pathway_analysis():
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/pathway_activity', methods=['GET'])
+@cached_response
+def get_pathway_activity():
+    """Get the per-sample pathway activity matrix of a model for heatmaps"""
+    # Get query parameters (pathway names may contain commas, so use repeated 'pathways' or '|' separators)
+    model = request.args.get('model', '')
+    pathways = [p for value in request.args.getlist('pathways') for p in value.split('|') if p]
+    
+    activity = analysis_data.pathway_activity.get(model)
+    if activity is None:
+        return jsonify({
+            'error': f"No pathway activity for model: {model}",
+            'models': sorted(analysis_data.pathway_activity)
+        }), 404
+    
+    try:
+        rows = np.flatnonzero(np.isin(activity.rows, pathways)) if pathways else np.arange(len(activity.rows))
+        names = activity.rows[rows].tolist()
+        values = activity.values[rows]
+        
+        mimetype = negotiated_mimetype()
+        if mimetype != JSON_MIMETYPE:
+            columns = {sample: values[:, i] for i, sample in enumerate(activity.columns.tolist())}
+            return columnar_response(mimetype, names, columns, {'model': model}, row_name='pathway')
+        
+        data = {
+            'model': model,
+            'pathways': names,
+            'samples': activity.columns.tolist(),
+            'values': values.tolist()
+        }
+        return jsonify(data)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/model_comparison', methods=['GET'])
+@cached_response
 def get_model_comparison():
     """Get model comparison data"""
     # In a real implementation, this would query the database or load from files
@@ -77,13 +395,21 @@ def get_model_comparison():
     
     # Load model comparison data from analysis directory
     try:
-        # Simulate loading data from files
-        data = simulate_model_comparison_data()
+        data = load_model_comparison_data()
+        
+        mimetype = negotiated_mimetype()
+        if mimetype != JSON_MIMETYPE:
+            metrics = [k for k in data['models'][0] if k not in ('id', 'name')]
+            columns = {k: np.array([m[k] for m in data['models']], dtype=np.float32) for k in metrics}
+            metadata = {'names': [m['name'] for m in data['models']]}
+            return columnar_response(mimetype, [m['id'] for m in data['models']], columns, metadata, row_name='model')
+        
         return jsonify(data)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
 @app.route('/api/target_validation', methods=['GET'])
+@cached_response
 def get_target_validation():
     """Get target validation data"""
     # In a real implementation, this would query the database or load from files
@@ -91,30 +417,324 @@ def get_target_validation():
     
     # Load target validation data from analysis directory
     try:
-        # Simulate loading data from files
-        data = simulate_target_validation_data()
+        data = load_target_validation_data()
         return jsonify(data)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/volcano', methods=['GET'])
+@cached_response
+def get_volcano():
+    """Get volcano plot data with significant genes exact and the rest binned"""
+    # Get query parameters
+    comparison = request.args.get('comparison', '')
+    zoom = request.args.get('zoom', 0, type=int)
+    label_genes = [g for g in request.args.get('genes', '').split(',') if g]
+    bounds = [request.args.get(k, type=float) for k in ('x_min', 'x_max', 'y_min', 'y_max')]
+    viewport = bounds if all(b is not None for b in bounds) else None
+    
+    table = analysis_data.differential_expression.get(comparison)
+    if table is None:
+        return jsonify({
+            'error': f"Unknown comparison: {comparison}",
+            'comparisons': sorted(analysis_data.differential_expression)
+        }), 404
+    
+    try:
+        lod = volcano_lod(table['gene'], table['log2FoldChange'], table['pvalue'],
+                          zoom=zoom, viewport=viewport, label_genes=label_genes)
+        points, bins = lod['points'], lod['bins']
+        metadata = {k: v for k, v in lod.items() if k not in ('points', 'bins')}
+        metadata['comparison'] = comparison
+        
+        mimetype = negotiated_mimetype()
+        if mimetype != JSON_MIMETYPE:
+            # Exact points first (count 1), then density bins with empty labels
+            n_points = len(points['gene'])
+            metadata['n_points'] = n_points
+            rows = points['gene'].tolist() + [''] * len(bins['count'])
+            columns = {
+                'log2FoldChange': np.concatenate([points['log2FoldChange'], bins['log2FoldChange']]),
+                'neg_log10_pvalue': np.concatenate([points['neg_log10_pvalue'], bins['neg_log10_pvalue']]),
+                'count': np.concatenate([np.ones(n_points), bins['count']])
+            }
+            return columnar_response(mimetype, rows, columns, metadata, row_name='gene')
+        
+        data = {
+            **metadata,
+            'points': {k: v.tolist() for k, v in points.items()},
+            'bins': {k: v.tolist() for k, v in bins.items()}
+        }
+        return jsonify(data)
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
 @app.route('/api/search_gene', methods=['GET'])
 def search_gene():
     """Search for a gene in the database"""
     # Get query parameters
     query = request.args.get('query', '')
+    limit = positive_int(request.args.get('limit', '10'))
+    mode = request.args.get('mode', 'auto')
+    max_distance = request.args.get('max_distance', 2, type=int)
     
-    # In a real implementation, this would query the database
-    # For demonstration, we'll return simulated data
+    if mode not in ('auto', 'prefix', 'fuzzy'):
+        return jsonify({'error': f"Unknown search mode: {mode}"}), 400
+    if limit is None or limit > MAX_SEARCH_RESULTS:
+        return jsonify({'error': f"limit must be an integer from 1 to {MAX_SEARCH_RESULTS}"}), 400
     
-    # Simulate gene search
+    # Search the prebuilt gene index
     try:
-        # Simulate searching for genes
-        data = simulate_gene_search(query)
+        data = {
+            'query': query,
+            'mode': mode
+        }
+        
+        if mode != 'fuzzy':
+            data['results'] = gene_search_index.search(query, limit=limit)
+        
+        # Typo-tolerant lookup, also used when an auto search finds nothing
+        if mode == 'fuzzy' or (mode == 'auto' and query and not data['results']):
+            matches = gene_search_index.fuzzy_search(query, max_distance=max_distance, limit=limit)
+            data['results'] = [symbol for symbol, _ in matches]
+            data['distances'] = [distance for _, distance in matches]
+        
         return jsonify(data)
     except Exception as e:
         return jsonify({'error': str(e)}), 500
 
+@app.route('/api/knockout', methods=['GET', 'POST'])
+def simulate_knockout():
+    """Simulate a batch of gene knockouts on the regulatory network"""
+    # GET: genes=NFKB1,TNF+IL6 (one knockout per comma, '+' or space combines genes)
+    # POST: {"knockouts": [["NFKB1"], ["TNF", "IL6"]], "top": 25}
+    if request.method == 'POST':
+        payload = request.get_json(silent=True)
+        payload = payload if isinstance(payload, dict) else {}
+        knockouts = payload.get('knockouts', [])
+        top = payload.get('top', 25)
+    else:
+        knockouts = [k.replace('+', ' ').split() for k in request.args.get('genes', '').split(',') if k.strip()]
+        top = request.args.get('top', '25')
+    
+    # Each knockout is a gene symbol or a list of symbols knocked out together
+    if not isinstance(knockouts, list) or not all(
+            isinstance(k, str) or (isinstance(k, list) and all(isinstance(g, str) for g in k)) for k in knockouts):
+        return jsonify({'error': 'knockouts must be a list of gene symbols or lists of gene symbols'}), 400
+    top = positive_int(top)
+    if top is None:
+        return jsonify({'error': 'top must be a positive integer'}), 400
+    
+    knockouts = [[k] if isinstance(k, str) else k for k in knockouts]
+    knockouts = [[g.strip().upper() for g in k if g.strip()] for k in knockouts]
+    if not knockouts or not all(knockouts):
+        return jsonify({'error': 'No knockouts given'}), 400
+    
+    try:
+        effects, iterations, converged = regulatory_network.propagate(knockouts)
+        data = {
+            'iterations': iterations,
+            'converged': converged,
+            'results': regulatory_network.summarize(effects, knockouts, top=top)
+        }
+        return jsonify(data)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/knockout_screen', methods=['POST'])
+def knockout_screen():
+    """Screen regulator knockout combinations, streaming progress and the top-N as NDJSON"""
+    # Get request body: {"size": 2, "targets": [...], "candidates": [...], "top": 20}
+    body = request.get_json(silent=True)
+    body = body if isinstance(body, dict) else {}
+    targets = body.get('targets') or DEFAULT_TARGETS
+    candidates = body.get('candidates') or None
+    size = positive_int(body.get('size', 2))
+    top = positive_int(body.get('top', 20))
+    
+    if size is None:
+        return jsonify({'error': 'size must be a positive integer'}), 400
+    if top is None:
+        return jsonify({'error': 'top must be a positive integer'}), 400
+    for name, genes in (('targets', targets), ('candidates', candidates or [])):
+        if not isinstance(genes, list) or not all(isinstance(g, str) for g in genes):
+            return jsonify({'error': f"{name} must be a list of gene symbols"}), 400
+    
+    try:
+        screen = KnockoutScreen(
+            regulatory_network,
+            size=size,
+            targets=[g.strip().upper() for g in targets],
+            candidates=[g.strip().upper() for g in candidates] if candidates else None,
+            top=top,
+            workers=SCREEN_WORKERS,
+            executor=shared_screen_executor()
+        )
+    except ValueError as e:
+        return jsonify({'error': str(e)}), 400
+    if screen.total_combinations > MAX_SCREEN_COMBINATIONS:
+        return jsonify({
+            'error': f"Screen of {screen.total_combinations} combinations exceeds the limit of {MAX_SCREEN_COMBINATIONS}"
+        }), 400
+    
+    def generate():
+        yield json.dumps({
+            'total_combinations': screen.total_combinations,
+            'total_blocks': screen.total_blocks,
+            'candidates': len(screen.candidates),
+            'targets': screen.targets
+        }) + '\n'
+        for completed, total in screen.run():
+            yield json.dumps({'completed_blocks': completed, 'total_blocks': total}) + '\n'
+        for result in screen.results():
+            yield json.dumps(result) + '\n'
+    
+    return Response(stream_with_context(generate()), mimetype='application/x-ndjson')
+
+@app.route('/api/gene_sets', methods=['GET'])
+@cached_response
+def get_gene_sets():
+    """List gene sets, or the gene sets containing a gene"""
+    # Get query parameters
+    gene = request.args.get('gene', '').strip()
+    
+    try:
+        if gene:
+            names = gene_set_collection.sets_containing(gene)
+        else:
+            names = gene_set_collection.names.tolist()
+        rows = [gene_set_collection.set_index[name] for name in names]
+        data = {
+            'gene': gene or None,
+            'gene_sets': names,
+            'sizes': gene_set_collection.sizes[rows].tolist()
+        }
+        return jsonify(data)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+@app.route('/api/gene_set_overlap', methods=['GET'])
+@cached_response
+def get_gene_set_overlap():
+    """Get the pairwise overlap matrix of the specified gene sets"""
+    # Get query parameters (set names may contain commas, so use repeated 'sets' or '|' separators)
+    names = [n for value in request.args.getlist('sets') for n in value.split('|') if n]
+    
+    unknown = [n for n in names if n not in gene_set_collection.set_index]
+    if not names or unknown:
+        return jsonify({'error': f"Unknown gene sets: {', '.join(unknown)}" if unknown else 'No gene sets given'}), 400
+    
+    try:
+        rows = np.array([gene_set_collection.set_index[n] for n in names])
+        overlaps = gene_set_collection.overlap_matrix(rows)
+        sizes = gene_set_collection.sizes[rows]
+        union = sizes[:, None] + sizes[None, :] - overlaps
+        data = {
+            'gene_sets': names,
+            'sizes': sizes.tolist(),
+            'overlap': overlaps.tolist(),
+            'jaccard': np.divide(overlaps, union, out=np.zeros(overlaps.shape), where=union > 0).tolist()
+        }
+        return jsonify(data)
+    except Exception as e:
+        return jsonify({'error': str(e)}), 500
+
+# Helper functions to load data
+def load_gene_expression_data(genes, models):
+    """Load gene expression data from the memory-mapped expression store"""
+    # Models without a built store fall back to simulated data
+    missing_models = [m for m in models if m in MODEL_NAMES and m not in expression_store]
+    data = simulate_gene_expression_data(genes, missing_models)
+    
+    for model_id in models:
+        if model_id in MODEL_NAMES and model_id in expression_store:
+            # One fancy-index slice of the memory-mapped matrix per model
+            found_genes, means, stds = expression_store.summarize(genes, model_id)
+            found_genes = found_genes.tolist()
+            
+            data['models'][model_id] = {
+                'name': MODEL_NAMES[model_id],
+                'values': dict(zip(found_genes, means.tolist())),
+                'errors': dict(zip(found_genes, stds.tolist()))
+            }
+    
+    return data
+
+def load_gene_expression_arrays(genes, models):
+    """Load gene expression data as gene x model float32 matrices (NaN where missing)"""
+    model_ids = [m for m in models if m in MODEL_NAMES]
+    values = np.full((len(genes), len(model_ids)), np.nan, dtype=np.float32)
+    errors = np.full((len(genes), len(model_ids)), np.nan, dtype=np.float32)
+    
+    # Store-backed models are filled with one slice per model
+    stored = [j for j, m in enumerate(model_ids) if m in expression_store]
+    if stored:
+        means, stds = expression_store.summary_matrix(genes, [model_ids[j] for j in stored])
+        values[:, stored] = means
+        errors[:, stored] = stds
+    
+    # Models without a built store fall back to simulated data
+    missing = [j for j, m in enumerate(model_ids) if m not in expression_store]
+    if missing:
+        data = simulate_gene_expression_data(genes, [model_ids[j] for j in missing])
+        for j in missing:
+            model_data = data['models'][model_ids[j]]
+            values[:, j] = [model_data['values'][g] for g in genes]
+            errors[:, j] = [model_data['errors'][g] for g in genes]
+    
+    return model_ids, values, errors
+
+def load_model_comparison_data():
+    """Load model comparison data from the preloaded analysis tables"""
+    table = analysis_data.model_comparison
+    if table is None:
+        return simulate_model_comparison_data()
+    
+    # Highest overall similarity first
+    order = np.argsort(-table['overall_similarity_score'], kind='stable')
+    models = []
+    for row in table.records(order):
+        model_id = row.pop('model')
+        models.append({'id': model_id, 'name': MODEL_NAMES.get(model_id, model_id), **row})
+    
+    return {'models': models}
+
+def load_target_validation_data():
+    """Load target validation data from the preloaded analysis tables"""
+    table = analysis_data.potential_targets
+    if table is None:
+        return simulate_target_validation_data()
+    
+    # Highest overall target score first
+    order = np.argsort(-table['overall_target_score'], kind='stable')
+    return {'targets': table.records(order)}
+
 # Helper functions to simulate data
+def stable_uniforms(model_id, genes, n):
+    """
+    Uniform (0, 1) draws per gene taken from a SHA-256 of the model and gene
+    
+    Parameters:
+    -----------
+    model_id : str
+        Model identifier
+    genes : list
+        Gene symbols (case and surrounding whitespace are ignored)
+    n : int
+        Draws per gene (at most 4)
+    
+    Returns:
+    --------
+    np.ndarray
+        genes x n array of draws
+    """
+    digests = b''.join(hashlib.sha256(f"{model_id}:{gene.strip().upper()}".encode()).digest() for gene in genes)
+    bits = np.frombuffer(digests, dtype='<u8').reshape(len(genes), 4)[:, :n]
+    # The top 53 bits as a float, offset by half a step so 0 is never drawn
+    return ((bits >> np.uint64(11)).astype(np.float64) + 0.5) * 2.0 ** -53
+
 def simulate_gene_expression_data(genes, models):
     """Simulate gene expression data for demonstration"""
     # Define model names
@@ -133,39 +753,32 @@ def simulate_gene_expression_data(genes, models):
         'models': {}
     }
     
-    # Generate random data for each model
-    np.random.seed(42)  # For reproducibility
+    # Base values for different models
+    base_values = {
+        'cd45rb': 7.0,
+        'acute_dss': 6.5,
+        'chronic_dss': 7.2,
+        'il10ko': 8.0,
+        'human_uc': 6.8,
+        'human_cd': 7.5
+    }
     
     for model_id in models:
         if model_id in model_names:
             model_name = model_names[model_id]
             
-            # Create model data
-            model_data = {
-                'name': model_name,
-                'values': {},
-                'errors': {}
-            }
-            
-            # Generate random values for each gene
-            for gene in genes:
-                # Base values for different models
-                base_values = {
-                    'cd45rb': 7.0,
-                    'acute_dss': 6.5,
-                    'chronic_dss': 7.2,
-                    'il10ko': 8.0,
-                    'human_uc': 6.8,
-                    'human_cd': 7.5
-                }
-                
-                # Generate random value based on model
-                base = base_values.get(model_id, 7.0)
-                model_data['values'][gene] = base + np.random.normal(0, 1.0)
-                model_data['errors'][gene] = 0.2 + np.random.uniform(0, 0.8)
+            # Draws depend only on model and gene, so a gene gets the same values in
+            # every request and in every block of a streamed response
+            draws = stable_uniforms(model_id, genes, 3)
+            normal = np.sqrt(-2.0 * np.log(draws[:, 0])) * np.cos(2.0 * np.pi * draws[:, 1])  # Box-Muller
+            base = base_values.get(model_id, 7.0)
             
             # Add model data to result
-            data['models'][model_id] = model_data
+            data['models'][model_id] = {
+                'name': model_name,
+                'values': dict(zip(genes, (base + normal).tolist())),
+                'errors': dict(zip(genes, (0.2 + 0.8 * draws[:, 2]).tolist()))
+            }
     
     return data
 
@@ -419,31 +1032,6 @@ def simulate_target_validation_data():
     
     return data
 
-def simulate_gene_search(query):
-    """Simulate gene search for demonstration"""
-    # Define a list of genes
-    all_genes = [
-        'IL1B', 'TNF', 'IL6', 'IL17A', 'IFNG', 'FOXP3', 'RORC', 'TBX21', 'GATA3', 'IL10',
-        'IL23A', 'IL12B', 'TGFB1', 'STAT3', 'STAT1', 'NFKB1', 'RELA', 'MAPK1', 'MAPK3', 'JAK1',
-        'JAK2', 'TLR4', 'TLR2', 'MYD88', 'NLRP3', 'IL18', 'IL1A', 'IL4', 'IL5', 'IL13',
-        'CCL2', 'CCL5', 'CXCL8', 'CXCL10', 'CCR2', 'CCR5', 'CXCR3', 'CD4', 'CD8A', 'CD19',
-        'CD3E', 'CD14', 'CD68', 'ITGAM', 'ITGAX', 'PTGS2', 'NOS2', 'ARG1', 'MRC1', 'IL1RN'
-    ]
-    
-    # Filter genes based on query
-    if query:
-        filtered_genes = [gene for gene in all_genes if query.upper() in gene]
-    else:
-        filtered_genes = all_genes
-    
-    # Create simulated data
-    data = {
-        'query': query,
-        'results': filtered_genes[:10]  # Return top 10 results
-    }
-    
-    return data
-
 # Main function
 if __name__ == '__main__':
     # Check if port is provided as command line argument
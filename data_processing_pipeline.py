@@ -5,26 +5,55 @@ Data processing pipeline for IBD RNA-seq web interface
 
 import os
 import sys
+import argparse
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
 import seaborn as sns
 from pathlib import Path
+from concurrent.futures import FIRST_COMPLETED, ProcessPoolExecutor, wait
 from sklearn.decomposition import PCA
 from sklearn.preprocessing import StandardScaler
 from scipy.stats import pearsonr, spearmanr
 
+from gene_sets import load_gene_sets
+from enrichment import over_representation, gsea, ssgsea
+from differential_expression import (DEFAULT_MEMORY_LIMIT, ConditionStatistics, LinearModelFit, all_pairs,
+                                     contrast_tests, design_matrix, log_expression, read_csv_gene_blocks,
+                                     read_csv_sample_blocks, results_frame, stream_condition_statistics)
+from expression_store import GENES_FILE, MATRIX_FILE, ModelMatrix, build_model_store
+from single_cell import counts_per_million, filter_genes, pseudobulk, read_10x_mtx
+from stage_cache import CACHE_DIR_NAME, StageCache, code_version
+
 # Define base directories
 BASE_DIR = Path('/home/ubuntu/rna_seq_interface')
 DATA_DIR = BASE_DIR / 'data'
 MOUSE_PROCESSED_DIR = DATA_DIR / 'mouse' / 'processed'
 HUMAN_PROCESSED_DIR = DATA_DIR / 'human' / 'processed'
 ANALYSIS_DIR = BASE_DIR / 'analysis'
+GENE_SET_DIR = DATA_DIR / 'gene_sets'
+
+# Modules the stages import (directly or through each other), whose source is
+# part of every cached stage's code version
+CODE_DIR = Path(__file__).resolve().parent
+CODE_FILES = [CODE_DIR / name for name in ('differential_expression.py', 'enrichment.py', 'expression_store.py',
+                                           'gene_sets.py', 'single_cell.py', 'stage_cache.py')]
+
+# Memory ceiling in bytes for the statistics and activity stages of
+# single-cell datasets and of datasets marked 'chunked'
+DE_MEMORY_LIMIT = int(os.environ.get('DE_MEMORY_LIMIT', DEFAULT_MEMORY_LIMIT))
+
+# Gene set collection parsed by this process and the GMT files it came from
+gene_set_state = {'key': None, 'collection': None}
 
 # Ensure analysis directory exists
 os.makedirs(ANALYSIS_DIR, exist_ok=True)
+os.makedirs(ANALYSIS_DIR / 'expression', exist_ok=True)
+os.makedirs(ANALYSIS_DIR / 'model_expression', exist_ok=True)
+os.makedirs(ANALYSIS_DIR / 'pseudobulk', exist_ok=True)
 os.makedirs(ANALYSIS_DIR / 'differential_expression', exist_ok=True)
 os.makedirs(ANALYSIS_DIR / 'pathway_analysis', exist_ok=True)
+os.makedirs(ANALYSIS_DIR / 'pathway_activity', exist_ok=True)
 os.makedirs(ANALYSIS_DIR / 'model_comparison', exist_ok=True)
 os.makedirs(ANALYSIS_DIR / 'figures', exist_ok=True)
 
@@ -33,22 +62,34 @@ MOUSE_DATASETS = {
     'acute_dss': {
         'geo_id': 'GSE252812',
         'description': 'Acute DSS-induced colitis model',
-        'type': 'bulk_rnaseq'
+        'type': 'bulk_rnaseq',
+        'conditions': ['Control', 'DSS'],
+        'n_samples': 10,
+        'seed': 42
     },
     'acute_chronic_dss': {
         'geo_id': 'GSE264408',
         'description': 'Acute and chronic DSS-induced colitis model',
-        'type': 'single_cell_rnaseq'
+        'type': 'single_cell_rnaseq',
+        'conditions': ['Control', 'Acute_DSS', 'Chronic_DSS'],
+        'n_samples': 15,
+        'seed': 43
     },
     'il10ko': {
         'geo_id': 'GSE107810',
         'description': 'IL-10 knockout model',
-        'type': 'microarray'
+        'type': 'microarray',
+        'conditions': ['WT', 'IL10KO'],
+        'n_samples': 12,
+        'seed': 44
     },
     'cd45rb_tcell': {
         'geo_id': 'GSE27302',
         'description': 'CD45RBHigh T cell transfer model',
-        'type': 'microarray'
+        'type': 'microarray',
+        'conditions': ['Control', 'Week2', 'Week4', 'Week6'],
+        'n_samples': 16,
+        'seed': 45
     }
 }
 
@@ -56,10 +97,32 @@ HUMAN_DATASETS = {
     'human_ibd': {
         'geo_id': 'GSE235236',
         'description': 'Human UC and CD bulk RNA-seq dataset',
-        'type': 'bulk_rnaseq'
+        'type': 'bulk_rnaseq',
+        'conditions': ['Control', 'UC', 'CD'],
+        'n_samples': 20,
+        'seed': 46,
+        'design': ['sex', 'batch']
     }
 }
 
+# Levels of the simulated covariates a dataset's 'design' can adjust for
+SIMULATED_COVARIATES = {
+    'sex': ['F', 'M'],
+    'batch': ['Batch1', 'Batch2'],
+    'time_point': ['Day0', 'Day7', 'Day14']
+}
+
+# Models served by the API (api_server.MODEL_NAMES): the dataset each one is
+# exported from and the conditions of the samples it keeps (None for all)
+API_MODELS = {
+    'cd45rb': ('cd45rb_tcell', None),
+    'acute_dss': ('acute_dss', None),
+    'chronic_dss': ('acute_chronic_dss', ['Control', 'Chronic_DSS']),
+    'il10ko': ('il10ko', None),
+    'human_uc': ('human_ibd', ['Control', 'UC']),
+    'human_cd': ('human_ibd', ['Control', 'CD'])
+}
+
 def generate_simulated_expression_data(n_genes=1000, n_samples=10, seed=42):
     """
     Generate simulated expression data for demonstration purposes
@@ -95,7 +158,7 @@ def generate_simulated_expression_data(n_genes=1000, n_samples=10, seed=42):
     
     return df
 
-def generate_simulated_metadata(n_samples=10, condition_labels=None, seed=42):
+def generate_simulated_metadata(n_samples=10, condition_labels=None, seed=42, covariates=()):
     """
     Generate simulated metadata for demonstration purposes
     
@@ -107,6 +170,8 @@ def generate_simulated_metadata(n_samples=10, condition_labels=None, seed=42):
         List of condition labels to use
     seed : int
         Random seed for reproducibility
+    covariates : iterable
+        Columns of SIMULATED_COVARIATES to add (e.g., 'sex', 'batch')
     
     Returns:
     --------
@@ -130,12 +195,84 @@ def generate_simulated_metadata(n_samples=10, condition_labels=None, seed=42):
         'condition': conditions
     })
     
+    # Drawn after the conditions, so a seed gives the same conditions with or without covariates
+    for covariate in covariates:
+        metadata[covariate] = np.random.choice(SIMULATED_COVARIATES[covariate], size=n_samples)
+    
     # Set sample_id as index
     metadata.set_index('sample_id', inplace=True)
     
     return metadata
 
-def perform_differential_expression_analysis(expression_data, metadata, output_dir, comparison_name):
+def save_expression_matrix(expression_data, output_dir, model_name):
+    """
+    Save an expression matrix as <model_name>_expression.csv
+    
+    Parameters:
+    -----------
+    expression_data : pd.DataFrame
+        Expression data with genes as rows and samples as columns
+    output_dir : Path
+        Directory to save results
+    model_name : str
+        Dataset identifier (e.g., 'acute_chronic_dss') or, for the API
+        expression store, a key of API_MODELS (e.g., 'chronic_dss')
+    
+    Returns:
+    --------
+    Path
+        Path of the saved CSV file
+    """
+    output_file = output_dir / f"{model_name}_expression.csv"
+    expression_data.to_csv(output_file)
+    
+    print(f"Saved expression matrix to {output_file}")
+    
+    return output_file
+
+def load_single_cell_pseudobulk(matrix_dir, output_dir, model_name, min_cells=10):
+    """
+    Aggregate a sparse single-cell dataset into pseudobulk samples
+    
+    Parameters:
+    -----------
+    matrix_dir : Path
+        10x MatrixMarket directory that also holds cell_metadata.csv (one row
+        per barcode with sample, cell_type and condition columns)
+    output_dir : Path
+        Directory to save the pseudobulk counts and group metadata
+    model_name : str
+        Model identifier (e.g., 'acute_chronic_dss')
+    min_cells : int
+        Minimum number of cells for a pseudobulk sample to be kept
+    
+    Returns:
+    --------
+    tuple
+        Counts-per-million expression (genes x pseudobulk samples) and metadata
+        with one row per pseudobulk sample
+    """
+    print(f"Aggregating single-cell data for {model_name} into pseudobulk samples...")
+    
+    # The cell matrix stays sparse; only the genes x groups sums are dense
+    matrix, genes, barcodes = read_10x_mtx(matrix_dir)
+    matrix, genes = filter_genes(matrix, genes)
+    cell_metadata = pd.read_csv(Path(matrix_dir) / 'cell_metadata.csv', index_col=0).reindex(barcodes)
+    counts, metadata = pseudobulk(matrix, genes, cell_metadata, min_cells=min_cells)
+    
+    print(f"Aggregated {matrix.shape[1]} cells ({matrix.nnz / max(1, matrix.shape[0] * matrix.shape[1]):.1%} non-zero) "
+          f"into {counts.shape[1]} pseudobulk samples")
+    
+    # Save results to file
+    counts.to_csv(output_dir / f"{model_name}_pseudobulk_counts.csv")
+    metadata.to_csv(output_dir / f"{model_name}_pseudobulk_metadata.csv")
+    
+    print(f"Saved pseudobulk counts and metadata to {output_dir}")
+    
+    # Library size is normalized per pseudobulk sample, after the raw counts are summed
+    return counts_per_million(counts), metadata
+
+def perform_differential_expression_analysis(expression_data, metadata, output_dir, comparison_name, method='moderated'):
     """
     Perform differential expression analysis between conditions
     
@@ -149,6 +286,8 @@ def perform_differential_expression_analysis(expression_data, metadata, output_d
         Directory to save results
     comparison_name : str
         Name of the comparison (e.g., 'UC_vs_Control')
+    method : str
+        'moderated' (empirical-Bayes moderated t) or 'welch'
     
     Returns:
     --------
@@ -157,9 +296,6 @@ def perform_differential_expression_analysis(expression_data, metadata, output_d
     """
     print(f"Performing differential expression analysis for {comparison_name}...")
     
-    # In a real implementation, this would use DESeq2, limma, or similar
-    # For demonstration, we'll simulate differential expression results
-    
     # Get unique conditions
     conditions = metadata['condition'].unique()
     
@@ -167,48 +303,131 @@ def perform_differential_expression_analysis(expression_data, metadata, output_d
         print(f"Error: Need at least 2 conditions for differential expression analysis, found {len(conditions)}")
         return None
     
-    # Get samples for each condition
-    condition1_samples = metadata[metadata['condition'] == conditions[0]].index
-    condition2_samples = metadata[metadata['condition'] == conditions[1]].index
-    
-    # Calculate mean expression for each condition
-    condition1_mean = expression_data[condition1_samples].mean(axis=1)
-    condition2_mean = expression_data[condition2_samples].mean(axis=1)
+    # Reduce the matrix to per-condition statistics and test conditions[1] against conditions[0]
+    statistics = condition_statistics(expression_data, metadata)
+    test = contrast_tests(statistics, [(conditions[0], conditions[1])], method=method)[(conditions[0], conditions[1])]
+    results = results_frame(expression_data.index, test)
     
-    # Calculate log2 fold change
-    log2fc = np.log2(condition2_mean + 1) - np.log2(condition1_mean + 1)
+    # Save results to file
+    output_file = output_dir / f"{comparison_name}_differential_expression.csv"
+    results.to_csv(output_file)
     
-    # Simulate p-values
-    np.random.seed(42)
-    p_values = np.random.beta(0.3, 1.0, size=len(expression_data))
+    print(f"Saved differential expression results to {output_file}")
     
-    # Calculate adjusted p-values (simulated)
-    adj_p_values = np.minimum(p_values * 1.5, 1.0)
+    return results
+
+def condition_statistics(expression_data, metadata):
+    """Per-condition sufficient statistics of the samples present in both tables"""
+    samples = metadata.index.intersection(expression_data.columns)
+    return ConditionStatistics.from_matrix(
+        expression_data[samples].to_numpy(dtype=np.float64),
+        metadata.loc[samples, 'condition'].to_numpy(),
+        conditions=list(metadata['condition'].unique())
+    )
+
+def save_contrast_results(tests, genes, output_dir, model_name):
+    """Write each contrast's results as <model>_<compared>_vs_<reference>_differential_expression.csv"""
+    all_results = {}
+    for (reference, compared), test in tests.items():
+        comparison_name = f"{model_name}_{compared}_vs_{reference}"
+        results = results_frame(genes, test)
+        
+        # Save results to file
+        output_file = output_dir / f"{comparison_name}_differential_expression.csv"
+        results.to_csv(output_file)
+        all_results[comparison_name] = results
     
-    # Create results DataFrame
-    results = pd.DataFrame({
-        'gene': expression_data.index,
-        'log2FoldChange': log2fc,
-        'pvalue': p_values,
-        'padj': adj_p_values,
-        'baseMean': (condition1_mean + condition2_mean) / 2
-    })
+    print(f"Saved differential expression results for {len(all_results)} contrasts to {output_dir}")
     
-    # Set gene as index
-    results.set_index('gene', inplace=True)
+    return all_results
+
+def chunked_condition_statistics(expression_path, metadata, memory_limit=DE_MEMORY_LIMIT):
+    """
+    Per-condition statistics of an expression matrix read in blocks under a memory ceiling
     
-    # Sort by adjusted p-value
-    results = results.sort_values('padj')
+    Parameters:
+    -----------
+    expression_path : Path
+        Expression CSV file (genes as rows, streamed in row blocks) or an
+        expression store model directory (memory-mapped matrix.npy)
+    metadata : pd.DataFrame
+        Metadata with samples as rows
+    memory_limit : int
+        Memory ceiling in bytes for each block of the matrix and its working copies
     
-    # Save results to file
-    output_file = output_dir / f"{comparison_name}_differential_expression.csv"
-    results.to_csv(output_file)
+    Returns:
+    --------
+    tuple
+        Gene identifiers as they appear in the input, and their ConditionStatistics
+    """
+    conditions = list(metadata['condition'].unique())
+    expression_path = Path(expression_path)
+    
+    if expression_path.is_dir():
+        # Memory-mapped store: gene blocks, or Welford sample blocks for very wide matrices
+        # (samples missing from the metadata match no condition and are ignored)
+        store = ModelMatrix(expression_path)
+        sample_conditions = metadata['condition'].reindex(store.samples).fillna('').astype(str).to_numpy()
+        statistics = stream_condition_statistics(
+            store.matrix, sample_conditions, [str(c) for c in conditions], memory_limit=memory_limit
+        )
+        # The store's lookup keys are normalized symbols; report the original identifiers
+        return np.asarray(store.labels), statistics
+    
+    header = pd.read_csv(expression_path, nrows=0).columns[1:]
+    samples = [sample for sample in header if sample in metadata.index]
+    sample_conditions = metadata.loc[samples, 'condition'].to_numpy()
+    gene_blocks, parts = [], []
+    for block_genes, values in read_csv_gene_blocks(expression_path, samples, memory_limit=memory_limit):
+        gene_blocks.append(block_genes)
+        parts.append(ConditionStatistics.from_matrix(values, sample_conditions, conditions))
+    return np.concatenate(gene_blocks), ConditionStatistics.concatenate(parts)
+
+def fit_linear_model(expression_data, metadata, covariates, reference):
+    """
+    Fit condition and covariates for every gene with one QR factorization
     
-    print(f"Saved differential expression results to {output_file}")
+    Parameters:
+    -----------
+    expression_data : pd.DataFrame
+        Expression data with genes as rows and samples as columns
+    metadata : pd.DataFrame
+        Metadata with samples as rows
+    covariates : iterable
+        Metadata columns to adjust for; categorical columns are treatment
+        coded, numeric ones used as they are, and missing ones skipped
+    reference : str
+        Reference condition
     
-    return results
+    Returns:
+    --------
+    tuple
+        LinearModelFit, its design matrix and the untransformed genes x
+        samples values in design row order
+    """
+    samples = metadata.index.intersection(expression_data.columns)
+    metadata = metadata.loc[samples]
+    present = [c for c in covariates if c in metadata.columns]
+    factors = ['condition'] + [c for c in present if not pd.api.types.is_numeric_dtype(metadata[c])]
+    numeric = [c for c in present if pd.api.types.is_numeric_dtype(metadata[c])]
+    design = design_matrix(metadata, factors=factors, covariates=numeric, reference_levels={'condition': reference})
+    
+    # One QR factorization and one matrix product fit every gene
+    values = expression_data[samples].to_numpy(dtype=np.float64)
+    return LinearModelFit(log_expression(values), design), design, values
+
+def pipeline_gene_sets():
+    """The GENE_SET_DIR collection, parsed once per process and again only when its GMT files change"""
+    key = [str(GENE_SET_DIR)]
+    for path in sorted(GENE_SET_DIR.glob('*.gmt')):
+        stat = path.stat()
+        key.append((path.name, stat.st_size, stat.st_mtime_ns))
+    if gene_set_state['key'] != key:
+        gene_set_state['collection'] = load_gene_sets(GENE_SET_DIR)
+        gene_set_state['key'] = key
+    return gene_set_state['collection']
 
-def perform_pathway_analysis(de_results, output_dir, comparison_name):
+def perform_pathway_analysis(de_results, output_dir, comparison_name, gene_sets=None, padj_threshold=0.05):
     """
     Perform pathway analysis on differential expression results
     
@@ -220,6 +439,10 @@ def perform_pathway_analysis(de_results, output_dir, comparison_name):
         Directory to save results
     comparison_name : str
         Name of the comparison (e.g., 'UC_vs_Control')
+    gene_sets : GeneSetCollection
+        Gene sets to test (optional, defaults to pipeline_gene_sets())
+    padj_threshold : float
+        Adjusted p-value cutoff for the significant gene list
     
     Returns:
     --------
@@ -228,48 +451,110 @@ def perform_pathway_analysis(de_results, output_dir, comparison_name):
     """
     print(f"Performing pathway analysis for {comparison_name}...")
     
-    # In a real implementation, this would use tools like clusterProfiler, GSEA, or similar
-    # For demonstration, we'll simulate pathway analysis results
-    
-    # Define some example pathways
-    pathways = [
-        "Inflammatory response",
-        "Cytokine signaling",
-        "T cell activation",
-        "B cell receptor signaling",
-        "NF-kB signaling",
-        "TNF signaling",
-        "IL-17 signaling",
-        "Toll-like receptor signaling",
-        "JAK-STAT signaling",
-        "MAPK signaling"
-    ]
+    if gene_sets is None:
+        gene_sets = pipeline_gene_sets()
     
-    # Simulate pathway analysis results
-    np.random.seed(42)
+    # Test the significant genes against every gene set, with all tested genes as the universe
+    significant_genes = de_results.index[de_results['padj'] < padj_threshold]
+    results = over_representation(gene_sets, significant_genes, de_results.index)
     
-    # Create results DataFrame
-    results = pd.DataFrame({
-        'pathway': pathways,
-        'pvalue': np.random.beta(0.3, 1.0, size=len(pathways)),
-        'gene_count': np.random.randint(5, 50, size=len(pathways)),
-        'enrichment_score': np.random.uniform(1.5, 4.0, size=len(pathways))
-    })
+    # Save results to file
+    output_file = output_dir / f"{comparison_name}_pathway_analysis.csv"
+    results.to_csv(output_file, index=False)
     
-    # Calculate adjusted p-values (simulated)
-    results['padj'] = np.minimum(results['pvalue'] * 1.5, 1.0)
+    print(f"Saved pathway analysis results to {output_file} ({len(results)} gene sets tested)")
     
-    # Sort by adjusted p-value
-    results = results.sort_values('padj')
+    return results
+
+def perform_gsea(de_results, output_dir, comparison_name, gene_sets=None, n_permutations=1000, seed=42, workers=None):
+    """
+    Perform preranked gene set enrichment analysis on differential expression results
+    
+    Parameters:
+    -----------
+    de_results : pd.DataFrame
+        Differential expression results
+    output_dir : Path
+        Directory to save results
+    comparison_name : str
+        Name of the comparison (e.g., 'UC_vs_Control')
+    gene_sets : GeneSetCollection
+        Gene sets to test (optional, defaults to pipeline_gene_sets())
+    n_permutations : int
+        Number of gene permutations
+    seed : int
+        Random seed (results do not depend on the number of workers)
+    workers : int
+        Worker processes for the permutation batches
+    
+    Returns:
+    --------
+    pd.DataFrame
+        GSEA results
+    """
+    print(f"Performing GSEA for {comparison_name}...")
+    
+    if gene_sets is None:
+        gene_sets = pipeline_gene_sets()
+    
+    # Rank genes by the test statistic, or by signed -log10 p-value
+    if 'stat' in de_results.columns:
+        ranking = de_results['stat']
+    else:
+        ranking = np.sign(de_results['log2FoldChange']) * -np.log10(de_results['pvalue'].clip(lower=1e-300))
+    results = gsea(gene_sets, ranking, n_permutations=n_permutations, seed=seed, workers=workers)
     
     # Save results to file
-    output_file = output_dir / f"{comparison_name}_pathway_analysis.csv"
+    output_file = output_dir / f"{comparison_name}_gsea.csv"
     results.to_csv(output_file, index=False)
     
-    print(f"Saved pathway analysis results to {output_file}")
+    print(f"Saved GSEA results to {output_file}")
     
     return results
 
+def compute_pathway_activity(expression_data, output_dir, model_name, gene_sets=None):
+    """
+    Compute per-sample pathway activity scores (ssGSEA) for one model
+    
+    Parameters:
+    -----------
+    expression_data : pd.DataFrame or iterable
+        Expression data with genes as rows and samples as columns, or an
+        iterable of such frames for consecutive blocks of samples
+    output_dir : Path
+        Directory to save results
+    model_name : str
+        Model identifier used by the API (e.g., 'acute_dss')
+    gene_sets : GeneSetCollection
+        Gene sets to score (optional, defaults to pipeline_gene_sets())
+    
+    Returns:
+    --------
+    pd.DataFrame
+        Activity scores with pathways as rows and samples as columns
+    """
+    print(f"Computing pathway activity for {model_name}...")
+    
+    if gene_sets is None:
+        gene_sets = pipeline_gene_sets()
+    
+    if isinstance(expression_data, pd.DataFrame):
+        activity = ssgsea(gene_sets, expression_data)
+    else:
+        # Samples are scored independently; only the final scaling needs them all
+        activity = pd.concat([ssgsea(gene_sets, block, normalize=False) for block in expression_data], axis=1)
+        span = activity.to_numpy().max() - activity.to_numpy().min() if activity.size else 0.0
+        if span > 0:
+            activity /= span
+    
+    # Save results to file
+    output_file = output_dir / f"{model_name}_pathway_activity.csv"
+    activity.to_csv(output_file)
+    
+    print(f"Saved pathway activity ({activity.shape[0]} pathways x {activity.shape[1]} samples) to {output_file}")
+    
+    return activity
+
 def compare_mouse_models_to_human(mouse_expression_data, human_expression_data, output_dir):
     """
     Compare mouse models to human IBD data
@@ -436,48 +721,416 @@ def identify_potential_targets(de_results_dict, pathway_results_dict, output_dir
     
     return results
 
-def main():
-    """Main function to run the data processing pipeline"""
-    print("Starting data processing pipeline...")
-    
-    # For demonstration purposes, we'll use simulated data
-    # In a real implementation, this would load the actual processed data
+
+class Stage:
+    """One node of the pipeline graph: a module-level function and the stages whose results it consumes"""
+    
+    def __init__(self, name, function, args=(), dependencies=(), outputs=(), input_files=()):
+        """
+        Parameters:
+        -----------
+        name : str
+            Stage name, '<kind>' or '<kind>:<model>[:<comparison>]' (e.g., 'de:acute_dss:DSS_vs_Control')
+        function : callable
+            Called as function(inputs, *args), where inputs maps each dependency name to its result
+        args : tuple
+            Extra (picklable) arguments
+        dependencies : list
+            Names of the stages that must finish first
+        outputs : list
+            Files the stage writes (the stage cache requires them to exist)
+        input_files : list
+            Files the stage reads directly (hashed into its cache key)
+        """
+        self.name = name
+        self.function = function
+        self.args = tuple(args)
+        self.dependencies = list(dependencies)
+        self.outputs = list(outputs)
+        self.input_files = list(input_files)
+    
+    def run(self, inputs):
+        return self.function(inputs, *self.args)
+
+def is_chunked(dataset_info):
+    """Whether a dataset's stages read its saved expression matrix in blocks"""
+    return dataset_info['type'] == 'single_cell_rnaseq' or dataset_info.get('chunked', False)
+
+def loaded_expression(expression):
+    """The expression DataFrame of a load stage result, read back from the saved matrix for chunked datasets"""
+    if isinstance(expression, Path):
+        return pd.read_csv(expression, index_col=0, float_precision='round_trip')
+    return expression
+
+def load_model_stage(inputs, model_name, dataset_info, processed_dir):
+    """
+    Load (or simulate) one model's expression data and metadata and save its expression matrix
     
-    # Generate simulated expression data for mouse models
-    mouse_expression_data = {}
-    mouse_metadata = {}
+    Chunked datasets return the saved matrix's path in place of the
+    DataFrame, so neither the stage cache nor the worker processes of later
+    stages ever receive the whole matrix.
+    """
+    if dataset_info['type'] == 'single_cell_rnaseq' and (processed_dir / 'cell_metadata.csv').exists():
+        # Single-cell data: aggregate cells into (sample, cell type, condition) pseudobulk samples
+        expression_data, metadata = load_single_cell_pseudobulk(processed_dir, ANALYSIS_DIR / 'pseudobulk', model_name)
+    else:
+        # In a real implementation, this would load the actual processed data
+        print(f"Generating simulated data for {dataset_info['description']}...")
+        expression_data = generate_simulated_expression_data(n_genes=1000, n_samples=dataset_info['n_samples'],
+                                                             seed=dataset_info['seed'])
+        metadata = generate_simulated_metadata(n_samples=dataset_info['n_samples'],
+                                               condition_labels=dataset_info['conditions'], seed=dataset_info['seed'],
+                                               covariates=dataset_info.get('design', ()))
+    
+    output_file = save_expression_matrix(expression_data, ANALYSIS_DIR / 'model_expression', model_name)
+    if is_chunked(dataset_info):
+        return output_file, metadata
+    
+    return expression_data, metadata
+
+def export_stage(inputs, api_model, conditions):
+    """Save the samples the API serves as one model and rebuild that model's expression store"""
+    (expression, metadata), = inputs.values()
+    expression_data = loaded_expression(expression)
+    if conditions is not None:
+        samples = metadata.index[metadata['condition'].isin(conditions)]
+        expression_data = expression_data[samples.intersection(expression_data.columns)]
+    output_file = save_expression_matrix(expression_data, ANALYSIS_DIR / 'expression', api_model)
+    build_model_store(expression_data, ANALYSIS_DIR / 'expression_store', api_model)
+    return output_file
+
+def statistics_stage(inputs):
+    """Per-condition sufficient statistics shared by all of a model's contrasts"""
+    (expression_data, metadata), = inputs.values()
+    return expression_data.index, condition_statistics(expression_data, metadata)
+
+def chunked_statistics_stage(inputs, memory_limit):
+    """Per-condition statistics streamed from the saved expression matrix in blocks under a memory ceiling"""
+    (expression_file, metadata), = inputs.values()
+    return chunked_condition_statistics(expression_file, metadata, memory_limit)
+
+def contrast_stage(inputs, model_name, reference, compared):
+    """Test one contrast from the model's condition statistics"""
+    (genes, statistics), = inputs.values()
+    tests = contrast_tests(statistics, [(reference, compared)])
+    results, = save_contrast_results(tests, genes, ANALYSIS_DIR / 'differential_expression', model_name).values()
+    return results
+
+def design_stage(inputs, covariates, reference):
+    """Linear model of condition and covariates shared by all of a model's contrasts"""
+    (expression, metadata), = inputs.values()
+    expression_data = loaded_expression(expression)
+    fit, design, _ = fit_linear_model(expression_data, metadata, covariates, reference)
+    # Mean untransformed expression per condition, for the same baseMean as contrast_stage
+    conditions = metadata.loc[design.index, 'condition'].astype(str)
+    condition_means = expression_data[design.index].T.groupby(conditions).mean().T
+    return expression_data.index, fit, condition_means
+
+def design_contrast_stage(inputs, model_name, reference, compared):
+    """Test one covariate-adjusted contrast from the model's linear model"""
+    (genes, fit, condition_means), = inputs.values()
+    # condition[<level>] coefficients are differences from the reference level, which has none
+    contrast = {f"condition[{condition}]": weight for condition, weight in ((compared, 1.0), (reference, -1.0))
+                if f"condition[{condition}]" in fit.coefficient_names}
+    test = fit.test(contrast)
+    test['baseMean'] = ((condition_means[reference] + condition_means[compared]) / 2).to_numpy()
+    results, = save_contrast_results({(reference, compared): test}, genes, ANALYSIS_DIR / 'differential_expression',
+                                     model_name).values()
+    return results
+
+def pathway_stage(inputs, comparison_name):
+    """Over-representation analysis of one contrast"""
+    de_results, = inputs.values()
+    return perform_pathway_analysis(de_results, ANALYSIS_DIR / 'pathway_analysis', comparison_name,
+                                    gene_sets=pipeline_gene_sets())
+
+def gsea_stage(inputs, comparison_name):
+    """Preranked GSEA of one contrast (in-process: the stage pool already provides the parallelism)"""
+    de_results, = inputs.values()
+    return perform_gsea(de_results, ANALYSIS_DIR / 'pathway_analysis', comparison_name,
+                        gene_sets=pipeline_gene_sets(), workers=1)
+
+def activity_stage(inputs, model_name, memory_limit):
+    """Per-sample pathway activity of one model, a block of samples at a time for chunked datasets"""
+    (expression, _), = inputs.values()
+    if isinstance(expression, Path):
+        expression = read_csv_sample_blocks(expression, memory_limit)
+    return compute_pathway_activity(expression, ANALYSIS_DIR / 'pathway_activity', model_name,
+                                    gene_sets=pipeline_gene_sets())
+
+def comparison_stage(inputs, mouse_models, human_models):
+    """Compare every mouse model with the samples of every human dataset"""
+    mouse_expression_data = {model: loaded_expression(inputs[f"load:{model}"][0]) for model in mouse_models}
+    # Prefix the sample names so datasets that reuse them stay apart
+    human_expression_data = pd.concat([loaded_expression(inputs[f"load:{model}"][0]).add_prefix(f"{model}_")
+                                       for model in human_models], axis=1)
+    return compare_mouse_models_to_human(mouse_expression_data, human_expression_data,
+                                         ANALYSIS_DIR / 'model_comparison')
+
+def targets_stage(inputs):
+    """Rank validation targets from every contrast and its pathway results"""
+    de_results_dict = {name.split(':', 1)[1].replace(':', '_'): result
+                       for name, result in inputs.items() if name.startswith('de:')}
+    pathway_results_dict = {name.split(':', 1)[1].replace(':', '_'): result
+                            for name, result in inputs.items() if name.startswith('pathway:')}
+    return identify_potential_targets(de_results_dict, pathway_results_dict, ANALYSIS_DIR / 'model_comparison')
+
+def build_stages(mouse_datasets=MOUSE_DATASETS, human_datasets=HUMAN_DATASETS, memory_limit=DE_MEMORY_LIMIT):
+    """
+    Build the pipeline's stage graph
+    
+    Each model gets load, statistics and activity stages, and each of its
+    condition pairs gets de, pathway and gsea stages. Only 'compare' (all load
+    stages) and 'targets' (all de and pathway stages) join the models. An
+    'export' stage per API_MODELS entry writes what the API serves for it.
+    The load stage of single-cell and 'chunked' datasets hands on the path of
+    the saved expression matrix rather than the matrix itself; their
+    statistics stage reads it in gene blocks and their activity stage in
+    sample blocks, each fitting in memory_limit bytes. Single-cell cells are
+    aggregated from the sparse matrix, so only pseudobulk samples are dense.
+    Export, design and compare stages read a chunked matrix whole. Datasets with
+    a 'design' (covariates such as sex, batch or time_point) replace the
+    statistics stage with a linear model stage, and their de stages test
+    covariate-adjusted contrasts.
     
-    for model_name, model_info in MOUSE_DATASETS.items():
-        print(f"Generating simulated data for {model_info['description']}...")
-        
-        # Generate expression data
-        if model_name == 'acute_dss':
-            # Acute DSS model: control vs. DSS
-            expression_data = generate_simulated_expression_data(n_genes=1000, n_samples=10, seed=42)
-            metadata = generate_simulated_metadata(n_samples=10, condition_labels=['Control', 'DSS'], seed=42)
-        
-        elif model_name == 'acute_chronic_dss':
-            # Acute and chronic DSS model: control vs. acute DSS vs. chronic DSS
-            expression_data = generate_simulated_expression_data(n_genes=1000, n_samples=15, seed=43)
-            metadata = generate_simulated_metadata(n_samples=15, condition_labels=['Control', 'Acute_DSS', 'Chronic_DSS'], seed=43)
-        
-        elif model_name == 'il10ko':
-            # IL-10KO model: WT vs. IL-10KO
-            expression_data = generate_simulated_expression_data(n_genes=1000, n_samples=12, seed=44)
-            metadata = generate_simulated_metadata(n_samples=12, condition_labels=['WT', 'IL10KO'], seed=44)
-        
-        elif model_name == 'cd45rb_tcell':
-            # CD45RBHigh T cell transfer model: control vs. T cell transfer at different time points
-            expression_data = generate_simulated_expression_data(n_genes=1000, n_samples=16, seed=45)
-            metadata = generate_simulated_metadata(n_samples=16, condition_labels=['Control', 'Week2', 'Week4', 'Week6'], seed=45)
+    Returns:
+    --------
+    dict
+        Stages keyed by name, in a valid serial order
+    """
+    stages = {}
+    
+    def add(name, function, args=(), dependencies=(), outputs=(), input_files=()):
+        stages[name] = Stage(name, function, args, dependencies, outputs, input_files)
+    
+    gene_set_files = sorted(GENE_SET_DIR.glob('*.gmt'))
+    # A chunked load stage's result is only a path, so the stages reading the
+    # saved matrix hash its content themselves
+    matrix_files = {}
+    datasets = [(name, info, MOUSE_PROCESSED_DIR / name) for name, info in mouse_datasets.items()]
+    datasets += [(name, info, HUMAN_PROCESSED_DIR / name) for name, info in human_datasets.items()]
+    
+    for model_name, dataset_info, processed_dir in datasets:
+        raw_files = []
+        if dataset_info['type'] == 'single_cell_rnaseq' and processed_dir.is_dir():
+            raw_files = sorted(path for path in processed_dir.iterdir() if path.is_file())
+        expression_file = ANALYSIS_DIR / 'model_expression' / f"{model_name}_expression.csv"
+        matrix_files[model_name] = [expression_file] if is_chunked(dataset_info) else []
+        add(f"load:{model_name}", load_model_stage, (model_name, dataset_info, processed_dir),
+            outputs=[expression_file], input_files=raw_files)
+        if 'design' in dataset_info:
+            de_function, de_input = design_contrast_stage, f"design:{model_name}"
+            add(de_input, design_stage, (list(dataset_info['design']), dataset_info['conditions'][0]),
+                [f"load:{model_name}"], input_files=matrix_files[model_name])
+        else:
+            de_function, de_input = contrast_stage, f"statistics:{model_name}"
+            if is_chunked(dataset_info):
+                add(de_input, chunked_statistics_stage, (memory_limit,), [f"load:{model_name}"],
+                    input_files=matrix_files[model_name])
+            else:
+                add(de_input, statistics_stage, dependencies=[f"load:{model_name}"])
+        add(f"activity:{model_name}", activity_stage, (model_name, memory_limit), [f"load:{model_name}"],
+            [ANALYSIS_DIR / 'pathway_activity' / f"{model_name}_pathway_activity.csv"],
+            gene_set_files + matrix_files[model_name])
         
-        # Store data
-        mouse_expression_data[model_name] = expression_data
-        mouse_metadata[model_name] = metadata
+        for reference, compared in all_pairs(dataset_info['conditions']):
+            contrast = f"{model_name}:{compared}_vs_{reference}"
+            comparison_name = f"{model_name}_{compared}_vs_{reference}"
+            add(f"de:{contrast}", de_function, (model_name, reference, compared), [de_input],
+                [ANALYSIS_DIR / 'differential_expression' / f"{comparison_name}_differential_expression.csv"])
+            add(f"pathway:{contrast}", pathway_stage, (comparison_name,), [f"de:{contrast}"],
+                [ANALYSIS_DIR / 'pathway_analysis' / f"{comparison_name}_pathway_analysis.csv"], gene_set_files)
+            add(f"gsea:{contrast}", gsea_stage, (comparison_name,), [f"de:{contrast}"],
+                [ANALYSIS_DIR / 'pathway_analysis' / f"{comparison_name}_gsea.csv"], gene_set_files)
+    
+    for api_model, (model_name, conditions) in API_MODELS.items():
+        if f"load:{model_name}" in stages:
+            add(f"export:{api_model}", export_stage, (api_model, conditions), [f"load:{model_name}"],
+                [ANALYSIS_DIR / 'expression' / f"{api_model}_expression.csv"] +
+                [ANALYSIS_DIR / 'expression_store' / api_model / name for name in (MATRIX_FILE, GENES_FILE)],
+                matrix_files[model_name])
+    
+    if human_datasets:
+        add('compare', comparison_stage, (list(mouse_datasets), list(human_datasets)),
+            [f"load:{model}" for model in list(mouse_datasets) + list(human_datasets)],
+            [ANALYSIS_DIR / 'model_comparison' / 'mouse_model_human_comparison.csv',
+             ANALYSIS_DIR / 'figures' / 'mouse_model_comparison.png'],
+            [path for model in list(mouse_datasets) + list(human_datasets) for path in matrix_files[model]])
+    add('targets', targets_stage,
+        dependencies=[name for name in stages if name.startswith(('de:', 'pathway:'))],
+        outputs=[ANALYSIS_DIR / 'model_comparison' / 'potential_targets.csv',
+                 ANALYSIS_DIR / 'figures' / 'potential_targets.png'])
+    
+    return stages
+
+def select_stages(stages, targets=None):
+    """
+    Names of the stages needed for a set of targets
+    
+    Parameters:
+    -----------
+    stages : dict
+        Stages keyed by name
+    targets : list
+        Stage names or prefixes: 'de' selects every de stage, 'de:acute_dss'
+        every contrast of that model, and a bare model name every stage of
+        that model (optional, defaults to every stage)
+    
+    Returns:
+    --------
+    set
+        The matching stages and everything they depend on
+    """
+    if not targets:
+        return set(stages)
+    
+    selected = set()
+    for target in targets:
+        matches = [name for name in stages
+                   if name == target or name.startswith(f"{target}:") or target in name.split(':')[1:2]]
+        if not matches:
+            raise ValueError(f"Unknown stage target: {target}")
+        selected.update(matches)
+    
+    # Add every upstream stage
+    frontier = list(selected)
+    while frontier:
+        for dependency in stages[frontier.pop()].dependencies:
+            if dependency not in selected:
+                selected.add(dependency)
+                frontier.append(dependency)
+    return selected
+
+def run_stages(stages, targets=None, jobs=1, cache=None):
+    """
+    Run the selected stages, each as soon as its inputs are ready
     
-    # Generate simulated expression data for human IBD
-    human_expression_data = generate_simulated_expression_data(n_genes=1000, n_samples=20, seed=46)
-    human_metadata = generate_simulated_metadata(n_samples=20, condition_labels=['Control', 'UC', 'CD'], seed=46)
+    Parameters:
+    -----------
+    stages : dict
+        Stages keyed by name
+    targets : list
+        Stage targets (see select_stages)
+    jobs : int
+        Worker processes; 1 runs every stage in this process
+    cache : StageCache
+        Skip stages whose inputs, parameters and code are unchanged (optional)
     
+    Returns:
+    --------
+    tuple
+        Results keyed by stage name, and the set of stages that failed or
+        were skipped because an input failed
+    """
+    selected = select_stages(stages, targets)
+    pending = {name: set(stage.dependencies) for name, stage in stages.items() if name in selected}
+    results, failed, running, keys = {}, set(), {}, {}
+    executor = ProcessPoolExecutor(max_workers=jobs) if jobs > 1 else None
+    
+    def finish(name, run):
+        try:
+            results[name] = run()
+        except Exception as e:
+            print(f"Stage {name} failed: {e}")
+            failed.add(name)
+            return
+        if cache is not None:
+            cache.save(name, keys[name], results[name], stages[name].outputs)
+    
+    try:
+        while pending or running:
+            for name in [name for name, dependencies in pending.items() if dependencies & failed]:
+                print(f"Skipping stage {name}: an input stage failed")
+                failed.add(name)
+                del pending[name]
+            
+            ready = [name for name, dependencies in pending.items() if dependencies.issubset(results)]
+            if not ready and not running:
+                if pending:
+                    raise ValueError(f"Stage graph has a cycle through: {', '.join(sorted(pending))}")
+                break
+            
+            for name in ready:
+                del pending[name]
+                stage = stages[name]
+                if cache is not None:
+                    keys[name] = cache.key(name, stage.args, stage.dependencies, stage.input_files)
+                    try:
+                        results[name] = cache.load(name, keys[name])
+                        print(f"Stage {name} is up to date")
+                        continue
+                    except KeyError:
+                        pass
+                inputs = {dependency: results[dependency] for dependency in stage.dependencies}
+                if executor is None:
+                    finish(name, lambda: stage.run(inputs))
+                else:
+                    running[executor.submit(stage.function, inputs, *stage.args)] = name
+            
+            if running:
+                done, _ = wait(running, return_when=FIRST_COMPLETED)
+                for future in done:
+                    finish(running.pop(future), future.result)
+    finally:
+        if executor is not None:
+            executor.shutdown(cancel_futures=True)
+    
+    return results, failed
+
+def positive_int(value):
+    """argparse type for an integer of at least 1"""
+    try:
+        number = int(value)
+    except ValueError:
+        raise argparse.ArgumentTypeError(f"invalid int value: {value!r}") from None
+    if number < 1:
+        raise argparse.ArgumentTypeError(f"must be at least 1, got {number}")
+    return number
+
+def main():
+    """Main function to run the data processing pipeline"""
+    parser = argparse.ArgumentParser(description='Run the IBD RNA-seq data processing pipeline')
+    parser.add_argument('targets', nargs='*',
+                        help="Stages to run with their inputs, e.g. 'de', 'de:acute_dss', 'il10ko', 'targets' "
+                             "(default: every stage)")
+    parser.add_argument('-j', '--jobs', type=positive_int, default=os.cpu_count() or 1,
+                        help='Stages run concurrently in worker processes (default: CPU count)')
+    parser.add_argument('--memory-limit', type=positive_int, metavar='MB',
+                        default=max(1, DE_MEMORY_LIMIT // 1024 ** 2),
+                        help='Memory ceiling for the blocks that the statistics and activity stages of '
+                             'single-cell and chunked datasets read '
+                             '(default: DE_MEMORY_LIMIT or 2048)')
+    parser.add_argument('--list', action='store_true', help='List the selected stages and exit')
+    parser.add_argument('--force', action='store_true', help='Rerun the selected stages even if they are up to date')
+    args = parser.parse_args()
+    
+    stages = build_stages(memory_limit=args.memory_limit * 1024 ** 2)
+    try:
+        selected = select_stages(stages, args.targets)
+    except ValueError as e:
+        parser.error(str(e))
+    
+    if args.list:
+        for name in (name for name in stages if name in selected):
+            dependencies = ', '.join(stages[name].dependencies)
+            print(f"{name}" + (f"  <- {dependencies}" if dependencies else ''))
+        return
+    
+    print(f"Starting data processing pipeline ({len(selected)} stages, {args.jobs} jobs)...")
+    
+    # Parse the gene sets before the stage pool forks, so its workers inherit them
+    if any(name.startswith(('pathway:', 'gsea:', 'activity:')) for name in selected):
+        pipeline_gene_sets()
+    
+    version = code_version(CODE_FILES, [sys.modules[__name__]])
+    cache = StageCache(ANALYSIS_DIR / CACHE_DIR_NAME, version, enabled=not args.force)
+    results, failed = run_stages(stages, args.targets, jobs=args.jobs, cache=cache)
+    
+    if failed:
+        print(f"Data processing pipeline finished with {len(failed)} failed stages: {', '.join(sorted(failed))}")
+        sys.exit(1)
+    
+    print(f"Data processing pipeline completed successfully ({len(results)} stages)")
 
-(Content truncated due to size limit. Use line ranges to read in chunks)
\ No newline at end of file
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,523 @@
+#!/usr/bin/env python3
+"""
+Differential expression statistics for the IBD RNA-Seq Analysis Platform
+
+Expression values are tested on the log2(x + 1) scale with whole-matrix NumPy
+operations. The matrix is reduced once to per-condition sufficient statistics
+(count, sum and sum of squares per gene, via indicator-matrix products), and
+every pairwise or user-specified contrast is derived from those statistics
+for all genes at once, without rescanning the matrix.
+
+Matrices that do not fit in memory are reduced to the same statistics block
+by block under a memory ceiling: in gene blocks (rows of a CSV file or of a
+memory-mapped matrix), or in sample blocks merged with Welford/Chan
+accumulators (count, mean, M2) when a single gene row is too large.
+
+Designs with covariates (sex, batch, time point) are fitted as a linear model
+for every gene at once: the design matrix is factored once with QR, one
+matrix product gives all coefficients and residual variances, and contrasts
+are arbitrary linear combinations of the coefficients.
+
+The default moderated t-test shrinks the per-gene variances towards a common
+prior whose degrees of freedom and scale are estimated from all genes
+(limma's empirical Bayes, fitted by the method of moments on log variances);
+Welch's t-test is available as an alternative. P-values are corrected with
+Benjamini-Hochberg.
+"""
+
+import itertools
+import numpy as np
+import pandas as pd
+from scipy import stats
+from scipy.linalg import solve_triangular
+from scipy.special import digamma, polygamma
+
+from enrichment import benjamini_hochberg
+
+# Supported tests
+METHODS = ('moderated', 'welch')
+
+# Default memory ceiling for streaming statistics, and the working copies of a
+# block held at once (values, log values, squared log values, product output)
+DEFAULT_MEMORY_LIMIT = 2 * 1024 ** 3
+BLOCK_WORKING_COPIES = 4
+
+def log_expression(values):
+    """log2(x + 1) of an expression matrix as float64"""
+    return np.log2(np.asarray(values, dtype=np.float64) + 1.0)
+
+def trigamma_inverse(x, iterations=50):
+    """Solve trigamma(y) = x for y > 0 by Newton's method (as in limma)"""
+    x = float(x)
+    if x > 1e7:
+        return 1.0 / np.sqrt(x)
+    if x < 1e-6:
+        return 1.0 / x
+    y = 0.5 + 1.0 / x
+    for _ in range(iterations):
+        tri = polygamma(1, y)
+        step = tri * (1 - tri / x) / polygamma(2, y)
+        y += step
+        if -step / y < 1e-8:
+            break
+    return y
+
+def fit_variance_prior(variances, df):
+    """
+    Estimate the scaled inverse chi-square prior of the gene variances
+
+    Parameters:
+    -----------
+    variances : np.ndarray
+        Per-gene residual variances
+    df : np.ndarray or float
+        Residual degrees of freedom of each variance
+
+    Returns:
+    --------
+    tuple
+        Prior degrees of freedom d0 (np.inf if the variances show no excess
+        spread) and prior variance s0^2
+    """
+    df = np.broadcast_to(np.asarray(df, dtype=np.float64), np.shape(variances))
+    usable = (variances > 0) & np.isfinite(variances) & (df > 0)
+    if usable.sum() < 2:
+        return np.inf, float(np.mean(variances[usable])) if usable.any() else 0.0
+
+    # Moments of log s^2, corrected for the sampling spread of each variance
+    half_df = df[usable] / 2
+    e = np.log(variances[usable]) - digamma(half_df) + np.log(half_df)
+    e_mean = e.mean()
+    e_var = e.var(ddof=1) - polygamma(1, half_df).mean()
+    if e_var <= 0:
+        return np.inf, float(np.exp(e_mean))
+    d0 = 2 * trigamma_inverse(e_var)
+    return d0, float(np.exp(e_mean + digamma(d0 / 2) - np.log(d0 / 2)))
+
+def squeeze_variances(variances, df):
+    """
+    Empirical-Bayes posterior variances and their total degrees of freedom
+
+    Returns:
+    --------
+    tuple
+        Posterior variances, posterior degrees of freedom, prior (d0, s0^2)
+    """
+    d0, s0_sq = fit_variance_prior(variances, df)
+    if np.isinf(d0):
+        return np.full(np.shape(variances), s0_sq), np.full(np.shape(variances), np.inf), (d0, s0_sq)
+    posterior = (d0 * s0_sq + df * variances) / (d0 + df)
+    return posterior, df + d0, (d0, s0_sq)
+
+def t_test_pvalues(t, df):
+    """Two-sided p-values of t statistics (normal where df is infinite)"""
+    df = np.broadcast_to(df, np.shape(t))
+    return np.where(np.isinf(df), 2 * stats.norm.sf(np.abs(t)), 2 * stats.t.sf(np.abs(t), np.where(np.isinf(df), 1, df)))
+
+class ConditionStatistics:
+    """Per-condition sufficient statistics of log2(x + 1) expression for every gene"""
+
+    def __init__(self, conditions, counts, sums, sums_sq, base_sums):
+        """
+        Parameters:
+        -----------
+        conditions : list
+            Condition labels, one per statistics column
+        counts : np.ndarray
+            Number of samples per condition
+        sums : np.ndarray
+            genes x conditions sums of log expression
+        sums_sq : np.ndarray
+            genes x conditions sums of squared log expression
+        base_sums : np.ndarray
+            genes x conditions sums of untransformed expression (for baseMean)
+        """
+        self.conditions = list(conditions)
+        self.index = {c: i for i, c in enumerate(self.conditions)}
+        self.counts = np.asarray(counts, dtype=np.float64)
+        self.sums = sums
+        self.sums_sq = sums_sq
+        self.base_sums = base_sums
+
+    @classmethod
+    def from_matrix(cls, values, sample_conditions, conditions=None):
+        """
+        Compute the statistics with one indicator-matrix product per moment
+
+        Parameters:
+        -----------
+        values : np.ndarray
+            Untransformed expression, genes x samples
+        sample_conditions : np.ndarray
+            Condition label of each sample
+        conditions : list
+            Conditions to keep, in order (optional, defaults to order of appearance)
+        """
+        sample_conditions = np.asarray(sample_conditions)
+        if conditions is None:
+            conditions = list(pd.unique(sample_conditions))
+        indicator = (sample_conditions[:, None] == np.asarray(conditions)[None, :]).astype(np.float64)
+        values = np.asarray(values, dtype=np.float64)
+        logged = log_expression(values)
+        return cls(conditions, indicator.sum(axis=0), logged @ indicator, (logged * logged) @ indicator,
+                   values @ indicator)
+
+    @classmethod
+    def concatenate(cls, parts):
+        """Stack statistics of consecutive gene blocks"""
+        return cls(parts[0].conditions, parts[0].counts,
+                   np.concatenate([p.sums for p in parts]),
+                   np.concatenate([p.sums_sq for p in parts]),
+                   np.concatenate([p.base_sums for p in parts]))
+
+    def means(self):
+        """genes x conditions means of log expression"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            return self.sums / self.counts
+
+    def variances(self):
+        """genes x conditions sample variances of log expression"""
+        with np.errstate(divide='ignore', invalid='ignore'):
+            squares = np.maximum(self.sums_sq - self.sums ** 2 / self.counts, 0.0)
+            return squares / (self.counts - 1)
+
+    def residual_variance(self):
+        """
+        Variance pooled over every condition (the one-way ANOVA residual)
+
+        Returns:
+        --------
+        tuple
+            Per-gene residual variance and its degrees of freedom
+        """
+        used = self.counts > 0
+        with np.errstate(divide='ignore', invalid='ignore'):
+            squares = np.maximum(self.sums_sq[:, used] - self.sums[:, used] ** 2 / self.counts[used], 0.0)
+        df = self.counts[used].sum() - used.sum()
+        return squares.sum(axis=1) / max(df, 1), float(df)
+
+    def base_mean(self, reference, compared):
+        """Average of the two conditions' mean untransformed expression"""
+        i, j = self.index[reference], self.index[compared]
+        return (self.base_sums[:, i] / self.counts[i] + self.base_sums[:, j] / self.counts[j]) / 2
+
+class WelfordAccumulator:
+    """Per-condition count, mean and M2 of log expression, merged over sample blocks"""
+
+    def __init__(self, n_genes, conditions):
+        self.conditions = list(conditions)
+        self.counts = np.zeros(len(self.conditions))
+        self.means = np.zeros((n_genes, len(self.conditions)))
+        self.m2 = np.zeros((n_genes, len(self.conditions)))
+        self.base_sums = np.zeros((n_genes, len(self.conditions)))
+
+    def update(self, values, sample_conditions):
+        """
+        Merge one block of samples
+
+        Parameters:
+        -----------
+        values : np.ndarray
+            Untransformed expression, genes x block samples
+        sample_conditions : np.ndarray
+            Condition label of each sample in the block
+        """
+        values = np.asarray(values, dtype=np.float64)
+        logged = log_expression(values)
+        for i, condition in enumerate(self.conditions):
+            mask = sample_conditions == condition
+            n_block = mask.sum()
+            if n_block == 0:
+                continue
+            block = logged[:, mask]
+            block_mean = block.mean(axis=1)
+            block_m2 = ((block - block_mean[:, None]) ** 2).sum(axis=1)
+
+            # Chan et al. pairwise update of the running mean and M2
+            n_total = self.counts[i] + n_block
+            delta = block_mean - self.means[:, i]
+            self.means[:, i] += delta * n_block / n_total
+            self.m2[:, i] += block_m2 + delta ** 2 * self.counts[i] * n_block / n_total
+            self.counts[i] = n_total
+            self.base_sums[:, i] += values[:, mask].sum(axis=1)
+
+    def statistics(self):
+        """Convert to ConditionStatistics (sum = n * mean, sum of squares = M2 + n * mean^2)"""
+        sums = self.means * self.counts
+        return ConditionStatistics(self.conditions, self.counts.copy(), sums,
+                                   self.m2 + sums * self.means, self.base_sums.copy())
+
+def rows_per_block(memory_limit, row_length, bytes_per_value=8):
+    """Number of rows of the given length whose working copies fit in the memory limit"""
+    return max(1, int(memory_limit // (max(1, row_length) * bytes_per_value * BLOCK_WORKING_COPIES)))
+
+def read_csv_gene_blocks(path, samples, memory_limit=DEFAULT_MEMORY_LIMIT):
+    """
+    Stream a genes x samples expression CSV in blocks of rows
+
+    Parameters:
+    -----------
+    path : Path
+        CSV file with genes as rows (first column) and samples as columns
+    samples : list
+        Sample columns to read, in order
+    memory_limit : int
+        Memory ceiling in bytes for one block and its working copies
+
+    Yields:
+    -------
+    tuple
+        Gene labels and genes x samples values of each block
+    """
+    block_genes = rows_per_block(memory_limit, len(samples))
+    samples = [str(s) for s in samples]
+    gene_column = pd.read_csv(path, nrows=0).columns[0]
+    for chunk in pd.read_csv(path, index_col=0, usecols=[gene_column] + samples, chunksize=block_genes):
+        yield chunk.index.to_numpy(), chunk[samples].to_numpy(dtype=np.float64)
+
+def read_csv_sample_blocks(path, memory_limit=DEFAULT_MEMORY_LIMIT):
+    """
+    Stream a genes x samples expression CSV in blocks of columns
+
+    Parameters:
+    -----------
+    path : Path
+        CSV file with genes as rows (first column) and samples as columns
+    memory_limit : int
+        Memory ceiling in bytes for one block and its working copies
+
+    Yields:
+    -------
+    pd.DataFrame
+        Every gene for one block of samples
+    """
+    header = pd.read_csv(path, nrows=0).columns
+    gene_column, samples = header[0], [str(s) for s in header[1:]]
+    n_genes = len(pd.read_csv(path, usecols=[gene_column]))
+    block_samples = rows_per_block(memory_limit, n_genes)
+    # Each block parses the whole file but only keeps its own columns
+    for start in range(0, len(samples), block_samples):
+        block = samples[start:start + block_samples]
+        yield pd.read_csv(path, index_col=0, usecols=[gene_column] + block, float_precision='round_trip')[block]
+
+def stream_condition_statistics(matrix, sample_conditions, conditions=None, memory_limit=DEFAULT_MEMORY_LIMIT):
+    """
+    Per-condition statistics of a large genes x samples array under a memory ceiling
+
+    Parameters:
+    -----------
+    matrix : array-like
+        genes x samples matrix supporting slicing (e.g., np.memmap)
+    sample_conditions : np.ndarray
+        Condition label of each column
+    conditions : list
+        Conditions to keep, in order (optional, defaults to order of appearance)
+    memory_limit : int
+        Memory ceiling in bytes for one block and its working copies
+
+    Returns:
+    --------
+    ConditionStatistics
+        Statistics for every gene
+    """
+    sample_conditions = np.asarray(sample_conditions)
+    if conditions is None:
+        conditions = list(pd.unique(sample_conditions))
+    n_genes, n_samples = matrix.shape
+
+    # Gene blocks read whole rows; fall back to sample blocks if even one row is too large
+    if n_samples * 8 * BLOCK_WORKING_COPIES <= memory_limit:
+        block_genes = rows_per_block(memory_limit, n_samples)
+        return ConditionStatistics.concatenate([
+            ConditionStatistics.from_matrix(matrix[start:start + block_genes], sample_conditions, conditions)
+            for start in range(0, n_genes, block_genes)
+        ])
+
+    accumulator = WelfordAccumulator(n_genes, conditions)
+    block_samples = rows_per_block(memory_limit, n_genes)
+    for start in range(0, n_samples, block_samples):
+        accumulator.update(matrix[:, start:start + block_samples], sample_conditions[start:start + block_samples])
+    return accumulator.statistics()
+
+def all_pairs(conditions):
+    """Every (reference, compared) pair of conditions, in order of appearance"""
+    return list(itertools.combinations(conditions, 2))
+
+def contrast_tests(statistics, contrasts, method='moderated'):
+    """
+    Test every gene for each contrast using only the sufficient statistics
+
+    Parameters:
+    -----------
+    statistics : ConditionStatistics
+        Per-condition statistics
+    contrasts : list
+        (reference, compared) condition pairs; log2FoldChange is compared - reference
+    method : str
+        'moderated' (empirical-Bayes t on the variance pooled over all
+        conditions, fitted once for every contrast) or 'welch'
+
+    Returns:
+    --------
+    dict
+        (reference, compared) -> dict of 'log2FoldChange', 'stat', 'pvalue',
+        'padj' and 'baseMean' arrays
+    """
+    if method not in METHODS:
+        raise ValueError(f"Unknown differential expression method: {method}")
+    for reference, compared in contrasts:
+        for condition in (reference, compared):
+            if statistics.counts[statistics.index[condition]] < 2:
+                raise ValueError(f"Condition {condition} needs at least 2 samples")
+
+    means, variances = statistics.means(), statistics.variances()
+    if method == 'moderated':
+        residual, residual_df = statistics.residual_variance()
+        posterior, df, _ = squeeze_variances(residual, residual_df)
+
+    results = {}
+    for reference, compared in contrasts:
+        i, j = statistics.index[reference], statistics.index[compared]
+        n1, n2 = statistics.counts[i], statistics.counts[j]
+        log2fc = means[:, j] - means[:, i]
+        with np.errstate(divide='ignore', invalid='ignore'):
+            if method == 'welch':
+                se_sq1, se_sq2 = variances[:, i] / n1, variances[:, j] / n2
+                t = log2fc / np.sqrt(se_sq1 + se_sq2)
+                contrast_df = (se_sq1 + se_sq2) ** 2 / (se_sq1 ** 2 / (n1 - 1) + se_sq2 ** 2 / (n2 - 1))
+            else:
+                t = log2fc / np.sqrt(posterior * (1 / n1 + 1 / n2))
+                contrast_df = df
+
+        # Genes without any variance (e.g., all zero) are reported as untestable
+        t = np.where(np.isfinite(t), t, np.nan)
+        pvalues = np.where(np.isnan(t), np.nan, t_test_pvalues(np.nan_to_num(t), np.nan_to_num(contrast_df, nan=1.0)))
+        results[(reference, compared)] = {
+            'log2FoldChange': log2fc,
+            'stat': t,
+            'pvalue': pvalues,
+            'padj': benjamini_hochberg(pvalues),
+            'baseMean': statistics.base_mean(reference, compared)
+        }
+    return results
+
+def design_matrix(metadata, factors=('condition',), covariates=(), reference_levels=None):
+    """
+    Treatment-coded design matrix with an intercept
+
+    Parameters:
+    -----------
+    metadata : pd.DataFrame
+        Metadata with samples as rows
+    factors : iterable
+        Categorical columns; each level except the reference gets a
+        coefficient named '<column>[<level>]'
+    covariates : iterable
+        Numeric columns used as they are
+    reference_levels : dict
+        Reference level per factor (optional, defaults to the first level seen)
+
+    Returns:
+    --------
+    pd.DataFrame
+        Samples x coefficients design matrix
+    """
+    reference_levels = reference_levels or {}
+    columns = {'Intercept': np.ones(len(metadata))}
+    for factor in factors:
+        values = metadata[factor].astype(str)
+        levels = list(pd.unique(values))
+        reference = str(reference_levels.get(factor, levels[0]))
+        for level in levels:
+            if level != reference:
+                columns[f"{factor}[{level}]"] = (values == level).to_numpy(dtype=np.float64)
+    for covariate in covariates:
+        columns[covariate] = metadata[covariate].to_numpy(dtype=np.float64)
+    return pd.DataFrame(columns, index=metadata.index)
+
+class LinearModelFit:
+    """Per-gene least-squares fit of one design matrix, factored once with QR"""
+
+    def __init__(self, values, design):
+        """
+        Parameters:
+        -----------
+        values : np.ndarray
+            log2(x + 1) expression, genes x samples (in design row order)
+        design : pd.DataFrame
+            Samples x coefficients design matrix
+        """
+        X = design.to_numpy(dtype=np.float64)
+        n_samples, n_coefficients = X.shape
+        Q, R = np.linalg.qr(X)
+        if np.linalg.matrix_rank(R) < n_coefficients:
+            raise ValueError('Design matrix is not of full rank; drop confounded covariates')
+        if n_samples <= n_coefficients:
+            raise ValueError('Design matrix needs more samples than coefficients')
+
+        # effects = Y Q holds each gene's projection on the column space, so the
+        # coefficients are one triangular solve and the residual sum of squares
+        # is what the projection leaves over
+        effects = values @ Q
+        self.coefficient_names = list(design.columns)
+        self.coefficients = solve_triangular(R, effects.T).T
+        residual_ss = np.maximum(np.einsum('ij,ij->i', values, values) - np.einsum('ij,ij->i', effects, effects), 0.0)
+        self.df = float(n_samples - n_coefficients)
+        self.residual_variance = residual_ss / self.df
+        R_inverse = solve_triangular(R, np.eye(n_coefficients))
+        self.unscaled_covariance = R_inverse @ R_inverse.T
+        self.posterior_variance, self.posterior_df, self.prior = squeeze_variances(self.residual_variance, self.df)
+
+    def contrast_vector(self, contrast):
+        """Weights over the coefficients for a name, a {name: weight} dict or a weight vector"""
+        if isinstance(contrast, str):
+            contrast = {contrast: 1.0}
+        if isinstance(contrast, dict):
+            unknown = [name for name in contrast if name not in self.coefficient_names]
+            if unknown:
+                raise ValueError(f"Unknown coefficients: {', '.join(unknown)}")
+            return np.array([contrast.get(name, 0.0) for name in self.coefficient_names], dtype=np.float64)
+        return np.asarray(contrast, dtype=np.float64)
+
+    def test(self, contrast, moderated=True):
+        """
+        Test a linear combination of coefficients for every gene
+
+        Parameters:
+        -----------
+        contrast : str, dict or np.ndarray
+            Coefficient name, {name: weight} dict or weight vector
+        moderated : bool
+            Use the empirical-Bayes posterior variances (otherwise ordinary t)
+
+        Returns:
+        --------
+        dict
+            'log2FoldChange', 'stat', 'pvalue' and 'padj' arrays
+        """
+        weights = self.contrast_vector(contrast)
+        estimate = self.coefficients @ weights
+        scale = float(weights @ self.unscaled_covariance @ weights)
+        variance, df = ((self.posterior_variance, self.posterior_df) if moderated
+                        else (self.residual_variance, self.df))
+        with np.errstate(divide='ignore', invalid='ignore'):
+            t = estimate / np.sqrt(variance * scale)
+        t = np.where(np.isfinite(t), t, np.nan)
+        pvalues = np.where(np.isnan(t), np.nan, t_test_pvalues(np.nan_to_num(t), df))
+        return {
+            'log2FoldChange': estimate,
+            'stat': t,
+            'pvalue': pvalues,
+            'padj': benjamini_hochberg(pvalues)
+        }
+
+def results_frame(genes, test):
+    """DE result table with the pipeline's output columns, sorted by padj"""
+    results = pd.DataFrame({
+        'gene': genes,
+        'log2FoldChange': test['log2FoldChange'],
+        'pvalue': test['pvalue'],
+        'padj': test['padj'],
+        'baseMean': test['baseMean']
+    })
+    return results.set_index('gene').sort_values('padj')
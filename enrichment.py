@@ -0,0 +1,453 @@
+#!/usr/bin/env python3
+"""
+Gene set enrichment statistics for the IBD RNA-Seq Analysis Platform
+
+Over-representation analysis tests a significant gene list against every set
+of a GeneSetCollection in one pass: overlap and set sizes within the tested
+universe come from bitset popcounts, the hypergeometric upper tail is summed
+in log space for all sets at once, and p-values are corrected with
+Benjamini-Hochberg.
+
+Preranked GSEA computes running-sum enrichment scores from each set's hit
+positions in the ranked gene list. Under gene permutation the null
+distribution depends only on the set size, so each permutation batch draws
+one random ordering per permutation and scores its sorted prefixes for every
+distinct set size. Batches are seeded by (seed, batch index) and can run on a
+process pool without changing the result.
+
+Single-sample GSEA scores every set in every sample of an expression matrix
+from one argsort per chunk of samples. The ssGSEA score, the running sum
+integrated over all ranks, reduces to per-set sums of rank weights, which are
+sparse membership-matrix products over the whole chunk at once.
+"""
+
+import os
+
+import numpy as np
+import pandas as pd
+import scipy.sparse as sp
+from concurrent.futures import ProcessPoolExecutor
+from scipy.special import gammaln, logsumexp
+
+from gene_sets import popcount
+
+# Gene set size limits (within the tested universe) for enrichment tests
+MIN_SET_SIZE = 5
+MAX_SET_SIZE = 500
+
+# Sets whose tail sums are evaluated together, and tail terms added per step
+TAIL_CHUNK_SIZE = 2048
+TAIL_BLOCK_SIZE = 32
+
+# Gene set size limits and permutation settings for GSEA
+GSEA_MIN_SET_SIZE = 15
+GSEA_MAX_SET_SIZE = 500
+GSEA_PERMUTATIONS = 1000
+GSEA_BATCH_SIZE = 100
+GSEA_SET_CHUNK_SIZE = 4096
+
+# ssGSEA rank weight exponent and samples ranked together
+SSGSEA_ALPHA = 0.25
+SSGSEA_CHUNK_SIZE = 256
+
+# Tail terms more than this far (natural log) below the running sum are dropped
+TAIL_LOG_CUTOFF = 50.0
+
+def benjamini_hochberg(pvalues, log=False):
+    """
+    Benjamini-Hochberg adjusted p-values
+
+    Parameters:
+    -----------
+    pvalues : np.ndarray
+        Raw p-values (natural-log p-values if log is True); NaNs are ignored
+    log : bool
+        Whether the input and output are natural-log p-values
+
+    Returns:
+    --------
+    np.ndarray
+        Adjusted p-values in the input order
+    """
+    values = np.asarray(pvalues, dtype=np.float64)
+    adjusted = np.full(values.shape, np.nan)
+    valid = np.flatnonzero(~np.isnan(values))
+    n = len(valid)
+    if n == 0:
+        return adjusted
+
+    # Scale by n / rank from the largest p-value down and keep the running minimum
+    order = valid[np.argsort(values[valid], kind='stable')[::-1]]
+    ranks = np.arange(n, 0, -1, dtype=np.float64)
+    if log:
+        scaled = values[order] + np.log(n / ranks)
+        adjusted[order] = np.minimum(np.minimum.accumulate(scaled), 0.0)
+    else:
+        scaled = values[order] * (n / ranks)
+        adjusted[order] = np.minimum(np.minimum.accumulate(scaled), 1.0)
+    return adjusted
+
+def log_binomial(n, k):
+    """Natural log of the binomial coefficient C(n, k)"""
+    return gammaln(n + 1) - gammaln(k + 1) - gammaln(n - k + 1)
+
+def hypergeom_log_sf(overlap, population, set_sizes, draws, chunk_size=TAIL_CHUNK_SIZE):
+    """
+    Natural log of P(X >= overlap) for X ~ Hypergeometric, for many sets at once
+
+    Parameters:
+    -----------
+    overlap : np.ndarray
+        Observed overlap of each set with the drawn genes
+    population : int
+        Universe size
+    set_sizes : np.ndarray
+        Size of each set within the universe
+    draws : int
+        Number of drawn (significant) genes
+    chunk_size : int
+        Sets whose tails are summed together
+
+    Returns:
+    --------
+    np.ndarray
+        Log upper-tail probabilities (0 where the tail is the whole support)
+    """
+    overlap = np.asarray(overlap, dtype=np.int64)
+    set_sizes = np.asarray(set_sizes, dtype=np.int64)
+    support_min = np.maximum(0, draws - (population - set_sizes))
+    support_max = np.minimum(set_sizes, draws)
+
+    log_sf = np.zeros(len(overlap))
+    log_sf[overlap > support_max] = -np.inf
+    rows = np.flatnonzero((overlap > support_min) & (overlap <= support_max))
+    log_total = log_binomial(population, draws)
+
+    # Sum the pmf upward from the observed overlap in blocks of terms. Past the
+    # mode the terms only shrink, so a row is done once its latest term is
+    # negligible next to the running sum
+    for start in range(0, len(rows), chunk_size):
+        chunk = rows[start:start + chunk_size]
+        K = set_sizes[chunk, None]
+        top = support_max[chunk, None]
+        mode = (draws + 1) * (K + 1) // (population + 2)
+        total = np.full(len(chunk), -np.inf)
+        for offset in range(0, int((top - overlap[chunk, None]).max()) + 1, TAIL_BLOCK_SIZE):
+            x = overlap[chunk, None] + offset + np.arange(TAIL_BLOCK_SIZE)[None, :]
+            in_support = x <= top
+            x = np.minimum(x, top)
+            log_pmf = np.where(in_support, log_binomial(K, x) + log_binomial(population - K, draws - x) - log_total,
+                               -np.inf)
+            total = np.logaddexp(total, logsumexp(log_pmf, axis=1))
+            last = log_pmf[:, -1]
+            done = ~in_support[:, -1] | ((x[:, -1] >= mode[:, 0]) & (last < total - TAIL_LOG_CUTOFF))
+            if done.all():
+                break
+        log_sf[chunk] = np.minimum(total, 0.0)
+    return log_sf
+
+def over_representation(collection, genes, universe, min_size=MIN_SET_SIZE, max_size=MAX_SET_SIZE):
+    """
+    Hypergeometric over-representation test of a gene list against every gene set
+
+    Parameters:
+    -----------
+    collection : GeneSetCollection
+        Gene sets to test
+    genes : iterable
+        Significant gene symbols
+    universe : iterable
+        Every gene that was tested (e.g., the DE result index)
+    min_size : int
+        Skip sets with fewer members in the universe
+    max_size : int
+        Skip sets with more members in the universe
+
+    Returns:
+    --------
+    pd.DataFrame
+        One row per tested set with pathway, pvalue, gene_count,
+        enrichment_score (fold enrichment), set_size and padj, sorted by padj
+    """
+    # Genes outside every set carry no information, so the universe is restricted to set members
+    universe_bits, population = collection.encode(universe)
+    query_bits, _ = collection.encode(genes)
+    query_bits &= universe_bits
+    draws = int(popcount(query_bits).sum())
+
+    set_sizes = collection.overlap_counts(universe_bits)
+    overlap = collection.overlap_counts(query_bits)
+    tested = np.flatnonzero((set_sizes >= min_size) & (set_sizes <= max_size))
+
+    log_p = hypergeom_log_sf(overlap[tested], population, set_sizes[tested], draws)
+    log_padj = benjamini_hochberg(log_p, log=True)
+    expected = set_sizes[tested] * draws / max(population, 1)
+
+    results = pd.DataFrame({
+        'pathway': collection.names[tested],
+        'pvalue': np.exp(log_p),
+        'gene_count': overlap[tested],
+        'enrichment_score': np.divide(overlap[tested], expected, out=np.zeros(len(tested)), where=expected > 0),
+        'set_size': set_sizes[tested],
+        'padj': np.exp(log_padj)
+    })
+    return results.sort_values(['padj', 'pvalue'], kind='stable').reset_index(drop=True)
+
+def running_sum_scores(positions, sizes, weights):
+    """
+    GSEA enrichment scores from sorted hit positions
+
+    Parameters:
+    -----------
+    positions : np.ndarray
+        (rows x max_size) ranked positions of each set's genes, ascending,
+        padded on the right beyond each row's size
+    sizes : np.ndarray
+        Number of valid positions per row
+    weights : np.ndarray
+        Absolute ranking metric of every ranked gene
+
+    Returns:
+    --------
+    np.ndarray
+        Signed maximum deviation of the running sum per row
+    """
+    n_genes = len(weights)
+    positions = np.asarray(positions, dtype=np.int64)
+    valid = np.arange(positions.shape[1])[None, :] < np.asarray(sizes)[:, None]
+    hit_weights = np.where(valid, weights[np.minimum(positions, n_genes - 1)], 0.0)
+
+    # The running sum peaks right after a hit and bottoms out right before one
+    total = hit_weights.sum(axis=1, keepdims=True)
+    total[total == 0] = 1.0
+    hits_after = np.cumsum(hit_weights, axis=1) / total
+    hits_before = hits_after - hit_weights / total
+    n_misses = np.maximum(n_genes - np.asarray(sizes), 1)[:, None]
+    misses_before = (positions - np.arange(positions.shape[1])[None, :]) / n_misses
+
+    top = np.where(valid, hits_after - misses_before, -np.inf).max(axis=1, initial=0.0)
+    bottom = np.where(valid, hits_before - misses_before, np.inf).min(axis=1, initial=0.0)
+    return np.where(top >= -bottom, top, bottom)
+
+def null_scores_batch(weights, set_sizes, batch_index, batch_size, seed):
+    """
+    Enrichment scores of random gene sets for one permutation batch
+
+    Parameters:
+    -----------
+    weights : np.ndarray
+        Absolute ranking metric of every ranked gene
+    set_sizes : np.ndarray
+        Distinct set sizes to score
+    batch_index : int
+        Index of the batch, combined with the seed for its random stream
+    batch_size : int
+        Permutations in the batch
+    seed : int
+        Base random seed
+
+    Returns:
+    --------
+    np.ndarray
+        (sizes x batch_size) null enrichment scores
+    """
+    rng = np.random.default_rng([seed, batch_index])
+    orderings = rng.permuted(np.tile(np.arange(len(weights)), (batch_size, 1)), axis=1)
+    scores = np.empty((len(set_sizes), batch_size))
+    for i, size in enumerate(set_sizes):
+        positions = np.sort(orderings[:, :size], axis=1)
+        scores[i] = running_sum_scores(positions, np.full(batch_size, size), weights)
+    return scores
+
+def _null_scores_batch(args):
+    return null_scores_batch(*args)
+
+def gsea(collection, ranking, n_permutations=GSEA_PERMUTATIONS, seed=42, workers=None,
+         batch_size=GSEA_BATCH_SIZE, min_size=GSEA_MIN_SET_SIZE, max_size=GSEA_MAX_SET_SIZE, weight=1.0):
+    """
+    Preranked gene set enrichment analysis with gene permutations
+
+    Parameters:
+    -----------
+    collection : GeneSetCollection
+        Gene sets to test
+    ranking : pd.Series
+        Ranking metric indexed by gene symbol (e.g., signed -log10 p-value)
+    n_permutations : int
+        Number of random gene sets scored per set size
+    seed : int
+        Base random seed; batch b uses the stream (seed, b)
+    workers : int
+        Worker processes for the permutation batches (defaults to the CPU count)
+    batch_size : int
+        Permutations drawn together as one matrix
+    min_size : int
+        Skip sets with fewer ranked members
+    max_size : int
+        Skip sets with more ranked members
+    weight : float
+        Exponent applied to the ranking metric in the running sum
+
+    Returns:
+    --------
+    pd.DataFrame
+        pathway, enrichment_score, nes, pvalue, padj and set_size, sorted by padj
+    """
+    ranking = ranking[~ranking.isna()]
+    ranking = ranking.groupby(ranking.index.astype(str).str.upper()).max().sort_values(ascending=False)
+    weights = np.abs(ranking.to_numpy(dtype=np.float64)) ** weight
+
+    # Ranked position of every collection gene (-1 if not ranked)
+    position_of = np.full(len(collection.genes), -1, dtype=np.int64)
+    ranked = [(collection.gene_ids.get(g), i) for i, g in enumerate(ranking.index)]
+    ranked = [(g, i) for g, i in ranked if g is not None]
+    if ranked:
+        ids, ranks = zip(*ranked)
+        position_of[list(ids)] = list(ranks)
+
+    # Ranked member positions per set, sorted within each set
+    set_of_member = np.repeat(np.arange(len(collection)), np.diff(collection.indptr))
+    member_positions = position_of[collection.indices]
+    keep = member_positions >= 0
+    set_of_member, member_positions = set_of_member[keep], member_positions[keep]
+    order = np.lexsort((member_positions, set_of_member))
+    set_of_member, member_positions = set_of_member[order], member_positions[order]
+    sizes = np.bincount(set_of_member, minlength=len(collection))
+    starts = np.concatenate([[0], np.cumsum(sizes)[:-1]])
+    tested = np.flatnonzero((sizes >= min_size) & (sizes <= max_size))
+
+    # Observed scores, a chunk of padded sets at a time
+    observed = np.empty(len(tested))
+    for start in range(0, len(tested), GSEA_SET_CHUNK_SIZE):
+        chunk = tested[start:start + GSEA_SET_CHUNK_SIZE]
+        width = int(sizes[chunk].max()) if len(chunk) else 0
+        columns = np.arange(width)[None, :]
+        index = np.minimum(starts[chunk, None] + columns, len(member_positions) - 1)
+        positions = np.where(columns < sizes[chunk, None], member_positions[index], len(weights))
+        observed[start:start + len(chunk)] = running_sum_scores(positions, sizes[chunk], weights)
+
+    # Null scores per distinct set size, one task per permutation batch
+    distinct_sizes, size_row = np.unique(sizes[tested], return_inverse=True)
+    n_batches = -(-n_permutations // batch_size)
+    tasks = [(weights, distinct_sizes, b, min(batch_size, n_permutations - b * batch_size), seed)
+             for b in range(n_batches)]
+    workers = workers or os.cpu_count() or 1
+    if workers == 1 or n_batches == 1 or not len(tested):
+        batches = [null_scores_batch(*task) for task in tasks]
+    else:
+        with ProcessPoolExecutor(max_workers=min(workers, n_batches)) as executor:
+            batches = list(executor.map(_null_scores_batch, tasks))
+    null = np.concatenate(batches, axis=1) if batches else np.zeros((len(distinct_sizes), 0))
+
+    # Sign-specific normalization and p-values against the null of the same set size
+    positive = null >= 0
+    positive_mean = np.divide(np.where(positive, null, 0).sum(axis=1), positive.sum(axis=1),
+                              out=np.ones(len(distinct_sizes)), where=positive.any(axis=1))
+    negative_mean = np.divide(np.where(~positive, -null, 0).sum(axis=1), (~positive).sum(axis=1),
+                              out=np.ones(len(distinct_sizes)), where=(~positive).any(axis=1))
+    null_rows = null[size_row]
+    is_up = observed >= 0
+    nes = np.where(is_up, observed / positive_mean[size_row], observed / negative_mean[size_row])
+    as_extreme = np.where(is_up[:, None], null_rows >= observed[:, None], null_rows <= observed[:, None])
+    same_sign = np.where(is_up[:, None], null_rows >= 0, null_rows < 0)
+    pvalues = (as_extreme.sum(axis=1) + 1) / (same_sign.sum(axis=1) + 1)
+
+    results = pd.DataFrame({
+        'pathway': collection.names[tested],
+        'enrichment_score': observed,
+        'nes': nes,
+        'pvalue': pvalues,
+        'set_size': sizes[tested],
+        'padj': benjamini_hochberg(pvalues)
+    })
+    return results.sort_values(['padj', 'pvalue'], kind='stable').reset_index(drop=True)
+
+def membership_matrix(collection, genes):
+    """
+    Sparse (sets x genes) 0/1 membership matrix over an arbitrary gene order
+
+    Parameters:
+    -----------
+    collection : GeneSetCollection
+        Gene sets
+    genes : iterable
+        Gene symbols defining the matrix columns
+
+    Returns:
+    --------
+    scipy.sparse.csr_matrix
+        Membership of each gene (column) in each set (row)
+    """
+    column_of = np.full(len(collection.genes), -1, dtype=np.int64)
+    for column, gene in enumerate(str(g).upper() for g in genes):
+        gene_id = collection.gene_ids.get(gene)
+        if gene_id is not None:
+            column_of[gene_id] = column
+    set_of_member = np.repeat(np.arange(len(collection)), np.diff(collection.indptr))
+    columns = column_of[collection.indices]
+    keep = columns >= 0
+    return sp.csr_matrix(
+        (np.ones(keep.sum()), (set_of_member[keep], columns[keep])),
+        shape=(len(collection), len(genes))
+    )
+
+def ssgsea(collection, expression, alpha=SSGSEA_ALPHA, chunk_size=SSGSEA_CHUNK_SIZE,
+           min_size=MIN_SET_SIZE, max_size=MAX_SET_SIZE, normalize=True):
+    """
+    Per-sample pathway activity scores (single-sample GSEA)
+
+    Parameters:
+    -----------
+    collection : GeneSetCollection
+        Gene sets to score
+    expression : pd.DataFrame
+        Expression data with genes as rows and samples as columns
+    alpha : float
+        Exponent of the rank weights
+    chunk_size : int
+        Samples ranked and scored together
+    min_size : int
+        Skip sets with fewer measured members
+    max_size : int
+        Skip sets with more measured members
+    normalize : bool
+        Divide all scores by their overall range, as in GSVA's ssgsea
+
+    Returns:
+    --------
+    pd.DataFrame
+        Activity scores with gene sets as rows and samples as columns
+    """
+    membership = membership_matrix(collection, expression.index)
+    sizes = np.asarray(membership.sum(axis=1)).ravel()
+    tested = np.flatnonzero((sizes >= min_size) & (sizes <= max_size))
+    membership, sizes = membership[tested], sizes[tested]
+
+    values = expression.to_numpy(dtype=np.float64)
+    n_genes, n_samples = values.shape
+    scores = np.empty((len(tested), n_samples))
+
+    for start in range(0, n_samples, chunk_size):
+        chunk = values[:, start:start + chunk_size]
+
+        # Rank n_genes for the highest expression down to 1 for the lowest
+        order = np.argsort(-chunk, axis=0, kind='stable')
+        ranks = np.empty_like(chunk)
+        np.put_along_axis(ranks, order, np.arange(n_genes, 0, -1, dtype=np.float64)[:, None], axis=0)
+        weights = ranks ** alpha
+
+        # Integrated running sum: a hit at rank r stays in the hit sum for r
+        # steps, a miss at rank r for r steps of the miss sum
+        hit_weight = membership @ weights
+        hit_area = membership @ (ranks * weights)
+        hit_ranks = membership @ ranks
+        hit_term = np.divide(hit_area, hit_weight, out=np.zeros_like(hit_area), where=hit_weight > 0)
+        miss_term = (n_genes * (n_genes + 1) / 2 - hit_ranks) / np.maximum(n_genes - sizes, 1)[:, None]
+        scores[:, start:start + chunk.shape[1]] = hit_term - miss_term
+
+    if normalize and scores.size:
+        span = scores.max() - scores.min()
+        if span > 0:
+            scores /= span
+
+    return pd.DataFrame(scores, index=pd.Index(collection.names[tested], name='pathway'), columns=expression.columns)
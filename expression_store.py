@@ -0,0 +1,238 @@
+#!/usr/bin/env python3
+"""
+Memory-mapped columnar expression store for the IBD RNA-Seq Analysis Platform
+
+Each model is stored as one float32 gene x sample matrix (``matrix.npy``) with
+rows sorted by gene symbol, next to a sorted symbol array (``genes.npy``) that
+doubles as the gene -> row offset index, and the original identifiers of
+those rows (``labels.npy``). The arrays are opened with ``mmap_mode='r'`` so
+every gunicorn worker shares the same pages through the OS page cache instead
+of holding a private DataFrame.
+
+Every build writes a new hidden version directory (``.<model_id>.<suffix>``)
+and then points the ``<model_id>`` symlink at it with a single rename, so a
+reader opens either the old or the new version, never a mix of the two.
+"""
+
+import os
+import sys
+import json
+import shutil
+import tempfile
+import numpy as np
+import pandas as pd
+from pathlib import Path
+
+# Define base directories
+BASE_DIR = Path(__file__).resolve().parent
+ANALYSIS_DIR = BASE_DIR / 'analysis'
+EXPRESSION_DIR = ANALYSIS_DIR / 'expression'
+STORE_DIR = ANALYSIS_DIR / 'expression_store'
+
+# File names inside each model directory
+MATRIX_FILE = 'matrix.npy'
+GENES_FILE = 'genes.npy'
+LABELS_FILE = 'labels.npy'
+SAMPLES_FILE = 'samples.json'
+
+def normalize_symbols(symbols):
+    """Normalize gene symbols so mouse and human queries share one key space"""
+    return np.char.upper(np.char.strip(np.asarray(symbols, dtype=str)))
+
+def build_model_store(expression_data, store_dir, model_id):
+    """
+    Write one model's expression matrix to the memory-mapped store
+
+    Parameters:
+    -----------
+    expression_data : pd.DataFrame
+        Expression data with genes as rows and samples as columns
+    store_dir : Path
+        Root directory of the expression store
+    model_id : str
+        Model identifier used by the API (e.g., 'acute_dss')
+
+    Returns:
+    --------
+    Path
+        Symlink to the directory holding the model's store files
+    """
+    store_dir = Path(store_dir)
+    os.makedirs(store_dir, exist_ok=True)
+    version_dir = Path(tempfile.mkdtemp(prefix=f".{model_id}.", dir=store_dir))
+
+    # Normalize symbols, drop duplicates and sort rows by symbol
+    symbols = normalize_symbols(expression_data.index)
+    _, first_rows = np.unique(symbols, return_index=True)
+    first_rows.sort()
+    symbols = symbols[first_rows]
+    labels = np.asarray(expression_data.index, dtype=str)[first_rows]
+    values = expression_data.to_numpy(dtype=np.float32)[first_rows]
+    order = np.argsort(symbols, kind='stable')
+
+    # Readers never see this version until the symlink points at it
+    with open(version_dir / MATRIX_FILE, 'wb') as f:
+        np.save(f, np.ascontiguousarray(values[order]))
+    with open(version_dir / GENES_FILE, 'wb') as f:
+        np.save(f, symbols[order])
+    with open(version_dir / LABELS_FILE, 'wb') as f:
+        np.save(f, labels[order])
+    with open(version_dir / SAMPLES_FILE, 'w') as f:
+        json.dump([str(s) for s in expression_data.columns], f)
+    os.chmod(version_dir, 0o755)  # mkdtemp creates it readable by its owner only
+
+    model_dir = store_dir / model_id
+    if model_dir.is_dir() and not model_dir.is_symlink():
+        # Store written before versioning: move it aside so the symlink can take its place
+        os.rename(model_dir, store_dir / f".{model_id}.unversioned")
+    tmp_link = store_dir / f"{version_dir.name}.link"
+    os.symlink(version_dir.name, tmp_link)
+    os.replace(tmp_link, model_dir)
+
+    # Readers that still map an old version keep their open files
+    for old_dir in store_dir.glob(f".{model_id}.*"):
+        if old_dir.is_dir() and not old_dir.is_symlink() and old_dir != version_dir:
+            shutil.rmtree(old_dir, ignore_errors=True)
+
+    return model_dir
+
+def build_store_from_csv(expression_dir=EXPRESSION_DIR, store_dir=STORE_DIR):
+    """
+    Build the store from ``<model_id>_expression.csv`` pipeline outputs
+
+    Parameters:
+    -----------
+    expression_dir : Path
+        Directory containing the exported expression CSV files
+    store_dir : Path
+        Root directory of the expression store
+
+    Returns:
+    --------
+    list
+        Model identifiers that were written
+    """
+    built = []
+    for csv_file in sorted(Path(expression_dir).glob('*_expression.csv')):
+        model_id = csv_file.name[:-len('_expression.csv')]
+        print(f"Building expression store for {model_id}...")
+        expression_data = pd.read_csv(csv_file, index_col=0)
+        build_model_store(expression_data, store_dir, model_id)
+        built.append(model_id)
+    return built
+
+class ModelMatrix:
+    """Read-only view of one model's memory-mapped expression matrix"""
+
+    def __init__(self, model_dir):
+        # Resolve the symlink once so every file comes from the same version
+        model_dir = Path(model_dir).resolve()
+        self.matrix = np.load(model_dir / MATRIX_FILE, mmap_mode='r')
+        self.genes = np.load(model_dir / GENES_FILE, mmap_mode='r')
+        # Stores written before labels were kept only have the normalized symbols
+        labels_file = model_dir / LABELS_FILE
+        self.labels = np.load(labels_file, mmap_mode='r') if labels_file.exists() else self.genes
+        with open(model_dir / SAMPLES_FILE) as f:
+            self.samples = json.load(f)
+
+    def lookup(self, symbols):
+        """
+        Map normalized gene symbols to row offsets
+
+        Returns:
+        --------
+        tuple of np.ndarray
+            Row offsets and a boolean mask of which symbols were found
+        """
+        # Keep the query's own width so long symbols are never truncated into a match
+        symbols = np.asarray(symbols, dtype=str)
+        if len(self.genes) == 0:
+            return np.zeros(len(symbols), dtype=np.intp), np.zeros(len(symbols), dtype=bool)
+        rows = np.searchsorted(self.genes, symbols)
+        rows = np.minimum(rows, len(self.genes) - 1)
+        found = self.genes[rows] == symbols
+        return rows, found
+
+    def rows(self, symbols):
+        """Return the expression rows and found mask for the given symbols"""
+        rows, found = self.lookup(symbols)
+        return self.matrix[rows[found]], found
+
+class ExpressionStore:
+    """Collection of per-model memory-mapped expression matrices"""
+
+    def __init__(self, store_dir=STORE_DIR):
+        self.store_dir = Path(store_dir)
+        self.models = {}
+        self.reload()
+
+    def reload(self):
+        """Open every model directory that contains a complete store"""
+        models = {}
+        if self.store_dir.is_dir():
+            for model_dir in sorted(self.store_dir.iterdir()):
+                if model_dir.name.startswith('.'):
+                    continue  # Version directories are reached through their model's symlink
+                if (model_dir / MATRIX_FILE).exists() and (model_dir / GENES_FILE).exists():
+                    models[model_dir.name] = ModelMatrix(model_dir)
+        self.models = models
+
+    def __contains__(self, model_id):
+        return model_id in self.models
+
+    def summarize(self, genes, model_id):
+        """
+        Per-gene mean and standard deviation across samples for one model
+
+        Parameters:
+        -----------
+        genes : list
+            Gene symbols as requested by the client
+        model_id : str
+            Model identifier
+
+        Returns:
+        --------
+        tuple
+            Requested symbols that were found, their means and their standard deviations
+        """
+        model = self.models[model_id]
+        genes = np.asarray(genes, dtype=str)
+        block, found = model.rows(normalize_symbols(genes))
+        means = block.mean(axis=1, dtype=np.float64)
+        stds = block.std(axis=1, dtype=np.float64)
+        return genes[found], means, stds
+
+    def summary_matrix(self, genes, model_ids):
+        """
+        Gene x model matrices of means and standard deviations
+
+        Parameters:
+        -----------
+        genes : list
+            Gene symbols as requested by the client
+        model_ids : list
+            Model identifiers present in the store
+
+        Returns:
+        --------
+        tuple of np.ndarray
+            float32 means and standard deviations, NaN where a gene is missing
+        """
+        symbols = normalize_symbols(genes)
+        means = np.full((len(symbols), len(model_ids)), np.nan, dtype=np.float32)
+        stds = np.full((len(symbols), len(model_ids)), np.nan, dtype=np.float32)
+        for j, model_id in enumerate(model_ids):
+            block, found = self.models[model_id].rows(symbols)
+            means[found, j] = block.mean(axis=1, dtype=np.float64)
+            stds[found, j] = block.std(axis=1, dtype=np.float64)
+        return means, stds
+
+# Main function
+if __name__ == '__main__':
+    # Optional arguments: expression CSV directory and store directory
+    expression_dir = Path(sys.argv[1]) if len(sys.argv) > 1 else EXPRESSION_DIR
+    store_dir = Path(sys.argv[2]) if len(sys.argv) > 2 else STORE_DIR
+
+    models = build_store_from_csv(expression_dir, store_dir)
+    print(f"Built expression store for {len(models)} models in {store_dir}")
@@ -0,0 +1,352 @@
+#!/usr/bin/env python3
+"""
+Gene symbol search index for the IBD RNA-Seq Analysis Platform
+
+The index is built once at server start from gene symbols and their aliases.
+Prefix matches come from binary search over a sorted key array and substring
+matches from an n-gram posting index, so autocomplete never scans the whole
+vocabulary. Results are ranked exact match, then prefix, then substring.
+"""
+
+import csv
+import numpy as np
+from bisect import bisect_left
+from pathlib import Path
+
+# Length of the n-grams used by the substring index
+NGRAM_SIZE = 3
+
+# Largest edit distance accepted by fuzzy lookups
+MAX_EDIT_DISTANCE = 2
+
+def normalize_query(text):
+    """Normalize a symbol or query to the index key space"""
+    return str(text).strip().upper()
+
+def read_gene_info(path):
+    """
+    Read symbols and aliases from an NCBI ``gene_info`` style TSV file
+
+    Parameters:
+    -----------
+    path : Path
+        File with ``Symbol`` and ``Synonyms`` columns (synonyms separated by '|')
+
+    Returns:
+    --------
+    dict
+        Mapping of gene symbol to list of aliases
+    """
+    genes = {}
+    with open(path, newline='') as f:
+        reader = csv.DictReader(f, delimiter='\t')
+        for row in reader:
+            symbol = (row.get('Symbol') or '').strip()
+            if not symbol:
+                continue
+            synonyms = (row.get('Synonyms') or '').strip()
+            aliases = [] if synonyms in ('', '-') else synonyms.split('|')
+            genes.setdefault(symbol, []).extend(aliases)
+    return genes
+
+def iter_ngrams(key):
+    """Yield the distinct n-grams of a key for every length up to NGRAM_SIZE"""
+    grams = set()
+    for size in range(1, NGRAM_SIZE + 1):
+        for i in range(len(key) - size + 1):
+            grams.add(key[i:i + size])
+    return grams
+
+def levenshtein(a, b, max_distance=None):
+    """
+    Edit distance between two strings
+
+    Parameters:
+    -----------
+    a, b : str
+        Strings to compare
+    max_distance : int
+        Stop early and return ``max_distance + 1`` once the distance is known
+        to exceed this bound (optional)
+
+    Returns:
+    --------
+    int
+        Levenshtein distance, or ``max_distance + 1`` if it exceeds the bound
+    """
+    if len(a) < len(b):
+        a, b = b, a
+    if max_distance is not None and len(a) - len(b) > max_distance:
+        return max_distance + 1
+
+    previous = list(range(len(b) + 1))
+    for i, char_a in enumerate(a, 1):
+        current = [i]
+        for j, char_b in enumerate(b, 1):
+            current.append(min(
+                previous[j] + 1,
+                current[j - 1] + 1,
+                previous[j - 1] + (char_a != char_b)
+            ))
+        if max_distance is not None and min(current) > max_distance:
+            return max_distance + 1
+        previous = current
+    return previous[-1]
+
+def iter_deletes(key, max_distance):
+    """Return every string reachable from ``key`` by up to ``max_distance`` deletions"""
+    deletes = {key}
+    frontier = {key}
+    for _ in range(max_distance):
+        frontier = {word[:i] + word[i + 1:] for word in frontier for i in range(len(word))}
+        deletes |= frontier
+    return deletes
+
+class DeletionIndex:
+    """
+    SymSpell-style deletion index over index keys for bounded edit-distance lookup
+
+    Two keys within ``d`` edits always share a string reachable from both by at
+    most ``d`` deletions, so candidates come from hashing the query's deletions
+    against a sorted array of every key's deletion hashes.
+    """
+
+    def __init__(self, keys, max_distance=MAX_EDIT_DISTANCE):
+        self.keys = keys
+        self.max_distance = max_distance
+
+        hashes = []
+        key_ids = []
+        for key_id, key in enumerate(keys):
+            deletes = iter_deletes(key, max_distance)
+            hashes.extend(hash(word) for word in deletes)
+            key_ids.extend([key_id] * len(deletes))
+
+        # Sorted hashes let a lookup find all keys sharing a deletion with searchsorted
+        hashes = np.array(hashes, dtype=np.int64)
+        order = np.argsort(hashes, kind='stable')
+        self.hashes = hashes[order]
+        self.key_ids = np.array(key_ids, dtype=np.int32)[order]
+
+    def query(self, key, max_distance):
+        """
+        Find every key within ``max_distance`` edits of ``key``
+
+        Returns:
+        --------
+        list
+            ``(distance, key_id)`` tuples sorted by distance
+        """
+        max_distance = min(max_distance, self.max_distance)
+        query_hashes = np.array([hash(word) for word in iter_deletes(key, max_distance)], dtype=np.int64)
+        starts = np.searchsorted(self.hashes, query_hashes, side='left')
+        stops = np.searchsorted(self.hashes, query_hashes, side='right')
+
+        # Hash collisions and deeper deletions only widen the candidate set,
+        # so every candidate is verified with a bounded edit distance
+        candidates = np.unique(np.concatenate(
+            [self.key_ids[start:stop] for start, stop in zip(starts.tolist(), stops.tolist())]
+        ))
+
+        matches = []
+        for key_id in candidates.tolist():
+            distance = levenshtein(key, self.keys[key_id], max_distance)
+            if distance <= max_distance:
+                matches.append((distance, key_id))
+        matches.sort()
+        return matches
+
+class GeneSearchIndex:
+    """Prefix and substring search index over gene symbols and aliases"""
+
+    def __init__(self, genes):
+        """
+        Build the index
+
+        Parameters:
+        -----------
+        genes : dict or list
+            Mapping of gene symbol to aliases, or a plain list of symbols
+        """
+        if not isinstance(genes, dict):
+            genes = {symbol: [] for symbol in genes}
+
+        # Map every normalized key (symbol or alias) to its canonical symbols
+        key_symbols = {}
+        for symbol, aliases in genes.items():
+            for key in [symbol, *aliases]:
+                key = normalize_query(key)
+                if key:
+                    targets = key_symbols.setdefault(key, [])
+                    if symbol not in targets:
+                        targets.append(symbol)
+
+        # Sorted keys support prefix lookup by binary search
+        self.keys = sorted(key_symbols)
+        self.key_symbols = [key_symbols[key] for key in self.keys]
+        self.symbol_count = len(genes)
+
+        # N-gram postings (every length up to NGRAM_SIZE) hold sorted key ids
+        # so substring lookup also covers queries shorter than a trigram
+        postings = {}
+        for key_id, key in enumerate(self.keys):
+            for gram in iter_ngrams(key):
+                postings.setdefault(gram, []).append(key_id)
+        self.postings = {gram: np.array(ids, dtype=np.int32) for gram, ids in postings.items()}
+
+        # The deletion index is only needed for fuzzy lookups; build_gene_search_index
+        # builds it up front, other callers on first use
+        self._deletion_index = None
+
+    def __len__(self):
+        return len(self.keys)
+
+    def prefix_range(self, prefix):
+        """Return the [start, stop) key range that starts with ``prefix``"""
+        start = bisect_left(self.keys, prefix)
+        stop = bisect_left(self.keys, prefix + '\uffff', lo=start)
+        return start, stop
+
+    def substring_ids(self, query):
+        """Return sorted key ids whose key contains ``query``"""
+        if len(query) <= NGRAM_SIZE:
+            return self.postings.get(query, ())
+
+        grams = set(query[i:i + NGRAM_SIZE] for i in range(len(query) - NGRAM_SIZE + 1))
+        lists = []
+        for gram in grams:
+            ids = self.postings.get(gram)
+            if ids is None:
+                return []
+            lists.append(ids)
+
+        # Intersect the shortest posting lists first
+        lists.sort(key=len)
+        candidates = lists[0]
+        for ids in lists[1:]:
+            candidates = np.intersect1d(candidates, ids, assume_unique=True)
+            if len(candidates) == 0:
+                break
+
+        # Trigram co-occurrence is necessary but not sufficient for containment
+        return [key_id for key_id in candidates.tolist() if query in self.keys[key_id]]
+
+    def search(self, query, limit=10):
+        """
+        Search for gene symbols matching a query
+
+        Parameters:
+        -----------
+        query : str
+            Full or partial gene symbol or alias
+        limit : int
+            Maximum number of symbols to return
+
+        Returns:
+        --------
+        list
+            Canonical gene symbols ranked by exact, prefix, then substring match
+        """
+        query = normalize_query(query)
+        results = []
+        seen = set()
+
+        def add(key_id):
+            for symbol in self.key_symbols[key_id]:
+                if symbol not in seen:
+                    seen.add(symbol)
+                    results.append(symbol)
+            return len(results) >= limit
+
+        # Exact and prefix matches share one contiguous range of sorted keys,
+        # with the exact match (if any) sorting first
+        start, stop = self.prefix_range(query)
+        for key_id in range(start, stop):
+            if add(key_id):
+                return results[:limit]
+
+        # Substring matches that are not prefixes
+        if query:
+            for key_id in self.substring_ids(query):
+                if not self.keys[key_id].startswith(query) and add(key_id):
+                    break
+
+        return results[:limit]
+
+    @property
+    def deletion_index(self):
+        """Deletion index over all keys, built on first fuzzy lookup"""
+        if self._deletion_index is None:
+            self._deletion_index = DeletionIndex(self.keys)
+        return self._deletion_index
+
+    def fuzzy_search(self, query, max_distance=2, limit=10):
+        """
+        Find the gene symbols nearest to a query by edit distance
+
+        Parameters:
+        -----------
+        query : str
+            Possibly misspelled gene symbol or alias
+        max_distance : int
+            Largest edit distance to accept (capped at MAX_EDIT_DISTANCE)
+        limit : int
+            Maximum number of symbols to return
+
+        Returns:
+        --------
+        list
+            ``(symbol, distance)`` tuples ordered by distance, then symbol
+        """
+        query = normalize_query(query)
+        if not query:
+            return []
+        max_distance = max(0, min(int(max_distance), MAX_EDIT_DISTANCE))
+
+        # Ties at equal distance prefer keys of similar length
+        matches = self.deletion_index.query(query, max_distance)
+        matches.sort(key=lambda m: (m[0], abs(len(self.keys[m[1]]) - len(query)), self.keys[m[1]]))
+
+        results = []
+        seen = set()
+        for distance, key_id in matches:
+            for symbol in self.key_symbols[key_id]:
+                if symbol not in seen:
+                    seen.add(symbol)
+                    results.append((symbol, distance))
+            if len(results) >= limit:
+                break
+        return results[:limit]
+
+def build_gene_search_index(base_genes, annotation_dir=None, extra_symbols=()):
+    """
+    Build the gene search index from all available symbol sources
+
+    Parameters:
+    -----------
+    base_genes : list
+        Symbols that should always be searchable
+    annotation_dir : Path
+        Directory of ``*.gene_info`` annotation files (optional)
+    extra_symbols : iterable
+        Additional symbols, e.g. the genes present in the expression store
+
+    Returns:
+    --------
+    GeneSearchIndex
+        Search index over every symbol and alias
+    """
+    genes = {symbol: [] for symbol in base_genes}
+    for symbol in extra_symbols:
+        genes.setdefault(str(symbol), [])
+
+    if annotation_dir is not None and Path(annotation_dir).is_dir():
+        for path in sorted(Path(annotation_dir).glob('*.gene_info')):
+            for symbol, aliases in read_gene_info(path).items():
+                genes.setdefault(symbol, []).extend(aliases)
+
+    index = GeneSearchIndex(genes)
+    # Build the fuzzy index now, in the gunicorn master before it forks, so
+    # workers share it instead of each building a copy on its first typo
+    index.deletion_index
+    return index
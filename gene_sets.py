@@ -0,0 +1,188 @@
+#!/usr/bin/env python3
+"""
+Bitset-indexed gene set collection for the IBD RNA-Seq Analysis Platform
+
+Gene sets are read from the GMT files in the gene set directory (one set per
+line: name, description, then member symbols, tab-separated). Every symbol is
+interned to an integer ID and each set is stored as one row of a packed
+uint64 bitset matrix (sets x ceil(genes / 64) words). Overlap counts against a
+query gene list, pathway-pathway overlap matrices and "which sets contain
+gene X" lookups are then bitwise ANDs and popcounts over the whole matrix.
+"""
+
+import numpy as np
+from pathlib import Path
+
+# Define base directories
+BASE_DIR = Path(__file__).resolve().parent
+GENE_SET_DIR = BASE_DIR / 'data' / 'gene_sets'
+
+# Pathways used when no GMT files are available
+DEFAULT_GENE_SETS = {
+    'Inflammatory response': ['IL1B', 'IL6', 'TNF', 'CXCL8', 'CCL2', 'CXCL10', 'PTGS2', 'NLRP3', 'IL18',
+                              'IL1A', 'ICAM1', 'VCAM1', 'SELE', 'TLR4', 'TLR2', 'NFKB1', 'RELA', 'MMP9'],
+    'Cytokine signaling': ['IL1B', 'IL6', 'TNF', 'IL10', 'IL17A', 'IFNG', 'IL4', 'IL5', 'IL13', 'IL12B',
+                           'IL23A', 'IL21', 'IL22', 'TGFB1', 'IL1R1', 'IL6R', 'IL10RA', 'IL10RB', 'SOCS1', 'SOCS3'],
+    'T cell activation': ['CD3E', 'CD4', 'CD8A', 'CD28', 'CTLA4', 'IL2', 'IL2RA', 'LCK', 'ZAP70', 'FOXP3',
+                          'TBX21', 'GATA3', 'RORC', 'IFNG', 'IL17A', 'ICOS', 'PDCD1', 'CD40LG'],
+    'B cell receptor signaling': ['CD19', 'CD79A', 'CD79B', 'BTK', 'SYK', 'LYN', 'BLNK', 'PIK3CD', 'PLCG2',
+                                  'NFKB1', 'RELA', 'MAPK1', 'MAPK3', 'CD22', 'CR2', 'MS4A1'],
+    'NF-kB signaling': ['NFKB1', 'NFKB2', 'RELA', 'RELB', 'REL', 'NFKBIA', 'IKBKB', 'CHUK', 'IKBKG', 'TNF',
+                        'IL1B', 'MYD88', 'TRAF6', 'IRAK4', 'TLR4', 'TNFAIP3', 'BCL2', 'ICAM1'],
+    'TNF signaling': ['TNF', 'TNFRSF1A', 'TNFRSF1B', 'TRADD', 'TRAF2', 'RIPK1', 'NFKB1', 'RELA', 'MAPK14',
+                      'MAPK8', 'CASP8', 'IL6', 'IL1B', 'CXCL10', 'CCL2', 'ICAM1', 'VCAM1', 'MMP9', 'PTGS2'],
+    'IL-17 signaling': ['IL17A', 'IL17F', 'IL17RA', 'IL17RC', 'TRAF6', 'ACT1', 'NFKB1', 'RELA', 'IL6', 'CXCL8',
+                        'CCL20', 'CXCL1', 'MMP9', 'MMP13', 'CSF3', 'CSF2', 'S100A8', 'S100A9', 'LCN2'],
+    'Toll-like receptor signaling': ['TLR1', 'TLR2', 'TLR4', 'TLR5', 'TLR9', 'MYD88', 'TIRAP', 'TICAM1', 'IRAK1',
+                                     'IRAK4', 'TRAF6', 'NFKB1', 'RELA', 'IRF3', 'IRF7', 'TNF', 'IL1B', 'IL6'],
+    'JAK-STAT signaling': ['JAK1', 'JAK2', 'JAK3', 'TYK2', 'STAT1', 'STAT3', 'STAT4', 'STAT5A', 'STAT5B',
+                           'STAT6', 'SOCS1', 'SOCS3', 'IL6', 'IL6R', 'IL10', 'IFNG', 'IL12B', 'IL23A', 'IL23R'],
+    'MAPK signaling': ['MAPK1', 'MAPK3', 'MAPK8', 'MAPK9', 'MAPK14', 'MAP2K1', 'MAP2K2', 'MAP3K7', 'RAF1',
+                       'BRAF', 'KRAS', 'HRAS', 'JUN', 'FOS', 'ELK1', 'TNF', 'IL1B', 'TGFB1']
+}
+
+def read_gmt(path):
+    """
+    Read the gene sets of one GMT file
+
+    Returns:
+    --------
+    list
+        (name, description, member symbols) per gene set
+    """
+    gene_sets = []
+    with open(path) as f:
+        for line in f:
+            fields = line.rstrip('\n').split('\t')
+            if len(fields) < 3:
+                continue
+            members = [g.strip().upper() for g in fields[2:] if g.strip()]
+            gene_sets.append((fields[0], fields[1], members))
+    return gene_sets
+
+def popcount(words):
+    """Number of set bits per element of a uint64 array"""
+    if hasattr(np, 'bitwise_count'):
+        return np.bitwise_count(words)
+    # NumPy < 2.0: count through a byte lookup table
+    table = np.array([bin(i).count('1') for i in range(256)], dtype=np.uint8)
+    as_bytes = np.ascontiguousarray(words).view(np.uint8).reshape(*words.shape, 8)
+    return table[as_bytes].sum(axis=-1, dtype=np.uint8)
+
+class GeneSetCollection:
+    """Gene sets stored as packed bitsets over interned gene IDs"""
+
+    def __init__(self, gene_sets):
+        """
+        Parameters:
+        -----------
+        gene_sets : list
+            (name, description, member symbols) per gene set
+        """
+        self.names = np.array([name for name, _, _ in gene_sets], dtype=str)
+        self.descriptions = np.array([description for _, description, _ in gene_sets], dtype=str)
+        self.set_index = {name: i for i, name in enumerate(self.names.tolist())}
+
+        # Intern every member symbol to an integer ID
+        self.gene_ids = {}
+        set_rows, member_ids = [], []
+        for row, (_, _, members) in enumerate(gene_sets):
+            ids = [self.gene_ids.setdefault(g, len(self.gene_ids)) for g in members]
+            set_rows.append(np.full(len(ids), row, dtype=np.int64))
+            member_ids.append(np.array(ids, dtype=np.int64))
+        self.genes = np.array(list(self.gene_ids), dtype=str)
+        self.n_words = max(1, (len(self.genes) + 63) // 64)
+
+        rows = np.concatenate(set_rows) if set_rows else np.zeros(0, dtype=np.int64)
+        ids = np.concatenate(member_ids) if member_ids else np.zeros(0, dtype=np.int64)
+
+        # Sorted, de-duplicated member IDs per set in CSR layout (set i is indices[indptr[i]:indptr[i + 1]])
+        n_ids = max(1, len(self.genes))
+        pairs = np.unique(rows * n_ids + ids)
+        self.indices = pairs % n_ids
+        self.indptr = np.searchsorted(pairs // n_ids, np.arange(len(gene_sets) + 1))
+
+        # One bit per member in each set's row of words
+        self.bits = np.zeros((len(gene_sets), self.n_words), dtype=np.uint64)
+        np.bitwise_or.at(self.bits, (rows, ids >> 6), np.left_shift(np.uint64(1), (ids & 63).astype(np.uint64)))
+        self.sizes = popcount(self.bits).sum(axis=1, dtype=np.int64)
+
+    def __len__(self):
+        return len(self.names)
+
+    @classmethod
+    def from_gmt_files(cls, paths):
+        """Build one collection from several GMT files (later duplicate names are dropped)"""
+        gene_sets, seen = [], set()
+        for path in paths:
+            for name, description, members in read_gmt(path):
+                if name not in seen:
+                    seen.add(name)
+                    gene_sets.append((name, description, members))
+        return cls(gene_sets)
+
+    def encode(self, genes):
+        """
+        Pack a gene list into one bitset over the collection's gene IDs
+
+        Returns:
+        --------
+        tuple
+            Bitset (n_words uint64) and the number of genes known to the collection
+        """
+        ids = np.unique([self.gene_ids[g] for g in (str(g).upper() for g in genes) if g in self.gene_ids])
+        ids = ids.astype(np.int64)
+        bitset = np.zeros(self.n_words, dtype=np.uint64)
+        np.bitwise_or.at(bitset, ids >> 6, np.left_shift(np.uint64(1), (ids & 63).astype(np.uint64)))
+        return bitset, len(ids)
+
+    def overlap_counts(self, bitset):
+        """Number of genes each set shares with an encoded gene list"""
+        return popcount(self.bits & bitset).sum(axis=1, dtype=np.int64)
+
+    def overlap_matrix(self, rows=None, chunk_words=1 << 22):
+        """
+        Pairwise overlap counts between gene sets
+
+        Parameters:
+        -----------
+        rows : np.ndarray
+            Set indices to compare (optional, defaults to every set)
+        chunk_words : int
+            Upper bound on the words ANDed at once, to bound memory
+
+        Returns:
+        --------
+        np.ndarray
+            Symmetric (sets x sets) matrix of shared gene counts
+        """
+        bits = self.bits if rows is None else self.bits[np.asarray(rows, dtype=np.int64)]
+        n = len(bits)
+        overlaps = np.zeros((n, n), dtype=np.int64)
+        step = max(1, chunk_words // max(1, n * self.n_words))
+        for start in range(0, n, step):
+            block = bits[start:start + step, None, :] & bits[None, :, :]
+            overlaps[start:start + step] = popcount(block).sum(axis=2, dtype=np.int64)
+        return overlaps
+
+    def sets_containing(self, gene):
+        """Names of the gene sets that contain a gene"""
+        gene_id = self.gene_ids.get(str(gene).strip().upper())
+        if gene_id is None:
+            return []
+        word, bit = gene_id >> 6, np.uint64(gene_id & 63)
+        member = (self.bits[:, word] >> bit) & np.uint64(1)
+        return self.names[member.astype(bool)].tolist()
+
+    def members(self, name):
+        """Member symbols of one gene set"""
+        row = self.bits[self.set_index[name]]
+        flags = np.unpackbits(row.view(np.uint8), bitorder='little')[:len(self.genes)]
+        return self.genes[flags.astype(bool)].tolist()
+
+def load_gene_sets(gene_set_dir=GENE_SET_DIR):
+    """Load every GMT file in a directory, or the built-in pathways if there are none"""
+    paths = sorted(Path(gene_set_dir).glob('*.gmt')) if gene_set_dir is not None else []
+    if paths:
+        return GeneSetCollection.from_gmt_files(paths)
+    return GeneSetCollection([(name, '', members) for name, members in DEFAULT_GENE_SETS.items()])
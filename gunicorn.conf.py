@@ -0,0 +1,33 @@
+"""
+Gunicorn configuration for the IBD RNA-Seq Analysis Platform API
+
+Usage: gunicorn -c gunicorn.conf.py api_server:app
+"""
+
+import gc
+import os
+import tempfile
+
+from metrics import METRICS_DIR_ENV, clear_metrics_dir
+
+bind = '0.0.0.0:5000'
+workers = int(os.environ.get('WEB_CONCURRENCY', 4))
+
+# Load the expression store, search index and analysis tables once in the master
+# process; workers inherit them through fork instead of parsing files at boot
+preload_app = os.environ.get('PRELOAD_APP', '1') != '0'
+
+# Workers write per-process metric files here so /metrics can aggregate them
+os.environ.setdefault(METRICS_DIR_ENV, os.path.join(tempfile.gettempdir(), 'ibd_api_metrics'))
+
+def on_starting(server):
+    """Drop metric files left over from a previous run"""
+    clear_metrics_dir(os.environ[METRICS_DIR_ENV])
+
+def when_ready(server):
+    """Move preloaded objects out of the garbage collector's reach before forking"""
+    if preload_app:
+        # Collecting would write to every tracked object's header and copy
+        # the shared pages into each worker
+        gc.collect()
+        gc.freeze()
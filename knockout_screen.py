@@ -0,0 +1,247 @@
+#!/usr/bin/env python3
+"""
+Combinatorial knockout screen for the IBD RNA-Seq Analysis Platform
+
+Every k-subset of the candidate regulators is knocked out on the regulatory
+network and scored by the predicted reduction of a target signature (by
+default IL1B, TNF and IL6): the score is minus the mean effect on the target
+genes, so higher is a stronger anti-inflammatory knockout. Combinations are
+generated in blocks; each block becomes the columns of one perturbation
+matrix, blocks are spread across a process pool, and only each block's top-N
+combinations come back to be merged.
+
+Examples:
+    python knockout_screen.py --size 2 --top 20
+    python knockout_screen.py --size 3 --targets IL1B,TNF,IL6,IL17A --workers 8
+"""
+
+import os
+import math
+import heapq
+import collections
+import argparse
+import itertools
+import numpy as np
+from concurrent.futures import ProcessPoolExecutor
+from pathlib import Path
+
+from knockout_engine import load_network
+
+# Define base directories
+BASE_DIR = Path(__file__).resolve().parent
+NETWORK_FILE = BASE_DIR / 'data' / 'networks' / 'regulatory_network.tsv'
+
+# Inflammatory signature the screen tries to reduce
+DEFAULT_TARGETS = ['IL1B', 'TNF', 'IL6']
+
+# Knockouts propagated together as the columns of one perturbation matrix
+BLOCK_SIZE = 512
+
+# Network shared with pool workers, set once per process by the initializer
+_worker_network = None
+
+def _init_worker(network):
+    global _worker_network
+    _worker_network = network
+
+def iter_combination_blocks(n_candidates, size, block_size=BLOCK_SIZE):
+    """Yield (start, index array of shape (block, size)) blocks of all k-subsets"""
+    combinations = itertools.combinations(range(n_candidates), size)
+    start = 0
+    while True:
+        block = np.array(list(itertools.islice(combinations, block_size)), dtype=np.int64)
+        if not len(block):
+            return
+        yield start, block.reshape(-1, size)
+        start += len(block)
+
+def score_block(network, candidate_rows, target_rows, block, top):
+    """
+    Propagate one block of combinations and keep its best-scoring ones
+
+    Parameters:
+    -----------
+    network : RegulatoryNetwork
+        Network to propagate on
+    candidate_rows : np.ndarray
+        Network row of each candidate regulator
+    target_rows : np.ndarray
+        Network rows of the target signature genes
+    block : np.ndarray
+        Candidate indices, one combination per row
+    top : int
+        Number of combinations to keep
+
+    Returns:
+    --------
+    list
+        (score, combination tuple, target effects) for the block's top combinations
+    """
+    n_genes, n_knockouts = len(network.genes), len(block)
+    perturbation = np.zeros((n_genes, n_knockouts), dtype=np.float64)
+    columns = np.repeat(np.arange(n_knockouts), block.shape[1])
+    perturbation[candidate_rows[block].ravel(), columns] = -1.0
+    effects, _, _ = network.propagate_perturbation(perturbation, perturbation != 0)
+
+    target_effects = effects[target_rows]
+    scores = -target_effects.mean(axis=0)
+    best = np.argsort(-scores, kind='stable')[:top]
+    return [(float(scores[j]), tuple(block[j].tolist()), target_effects[:, j].tolist()) for j in best]
+
+def _score_block_in_worker(args):
+    return score_block(_worker_network, *args)
+
+def screen_executor(network, workers):
+    """Process pool whose workers hold the network, reusable across KnockoutScreen runs"""
+    return ProcessPoolExecutor(max_workers=workers, initializer=_init_worker, initargs=(network,))
+
+def submit_in_order(executor, tasks, in_flight, window):
+    """Yield block results in task order, keeping at most window blocks submitted (tracked in in_flight)"""
+    tasks = iter(tasks)
+    for task in itertools.islice(tasks, window):
+        in_flight.append(executor.submit(_score_block_in_worker, task))
+    while in_flight:
+        result = in_flight[0].result()
+        in_flight.popleft()
+        for task in itertools.islice(tasks, 1):
+            in_flight.append(executor.submit(_score_block_in_worker, task))
+        yield result
+
+class KnockoutScreen:
+    """Screen every k-subset of candidate regulators against a target signature"""
+
+    def __init__(self, network, size=2, targets=DEFAULT_TARGETS, candidates=None, top=20,
+                 workers=None, block_size=BLOCK_SIZE, executor=None):
+        """
+        Parameters:
+        -----------
+        network : RegulatoryNetwork
+            Network to screen
+        size : int
+            Number of genes knocked out together
+        targets : list
+            Target signature genes
+        candidates : list
+            Genes to combine (defaults to every regulator in the network)
+        top : int
+            Number of combinations to keep
+        workers : int
+            Worker processes (defaults to the CPU count; 1 runs in-process)
+        block_size : int
+            Combinations per perturbation matrix
+        executor : ProcessPoolExecutor
+            Long-lived pool from screen_executor for the same network
+            (optional; by default each run starts and stops its own pool)
+        """
+        self.network = network
+        self.size = size
+        # Duplicates would produce combinations that repeat a gene
+        self.candidates = list(dict.fromkeys(g for g in (candidates or network.regulators) if g in network.index))
+        self.targets = list(dict.fromkeys(g for g in targets if g in network.index))
+        self.top = top
+        self.workers = workers or os.cpu_count() or 1
+        self.block_size = block_size
+        self.executor = executor
+        if not self.targets:
+            raise ValueError('None of the target genes are in the regulatory network')
+        if size < 1 or size > len(self.candidates):
+            raise ValueError(f"Combination size must be between 1 and {len(self.candidates)}")
+        if top < 1:
+            raise ValueError('Number of combinations to keep must be at least 1')
+        if block_size < 1:
+            raise ValueError('Block size must be at least 1')
+
+        self.total_combinations = math.comb(len(self.candidates), size)
+        self.total_blocks = math.ceil(self.total_combinations / block_size)
+        self.best = []  # Min-heap of the best (score, combination, effects) seen so far
+
+    def run(self):
+        """Score every block, yielding (completed_blocks, total_blocks) as blocks finish"""
+        candidate_rows = np.array([self.network.index[g] for g in self.candidates], dtype=np.int64)
+        target_rows = np.array([self.network.index[g] for g in self.targets], dtype=np.int64)
+        tasks = ((candidate_rows, target_rows, block, self.top)
+                 for _, block in iter_combination_blocks(len(self.candidates), self.size, self.block_size))
+
+        owned = None
+        if self.executor is not None:
+            executor = self.executor
+        elif self.workers == 1 or self.total_blocks == 1:
+            executor = None
+        else:
+            executor = owned = screen_executor(self.network, self.workers)
+
+        # Blocks go to the pool through a bounded window consumed in order, so a
+        # shared pool is not flooded and an abandoned run cancels only its own blocks
+        in_flight = collections.deque()
+        if executor is None:
+            block_results = (score_block(self.network, *task) for task in tasks)
+        else:
+            block_results = submit_in_order(executor, tasks, in_flight, 2 * self.workers)
+
+        try:
+            for completed, results in enumerate(block_results, start=1):
+                for entry in results:
+                    if len(self.best) < self.top:
+                        heapq.heappush(self.best, entry)
+                    elif entry[0] > self.best[0][0]:
+                        heapq.heapreplace(self.best, entry)
+                yield completed, self.total_blocks
+        finally:
+            for future in in_flight:
+                future.cancel()
+            if owned is not None:
+                owned.shutdown(cancel_futures=True)
+
+    def results(self):
+        """
+        Best combinations found so far
+
+        Returns:
+        --------
+        list
+            Dicts with 'rank', 'knockout', 'score' and per-target 'effects', best first
+        """
+        ranked = sorted(self.best, key=lambda entry: (-entry[0], entry[1]))
+        return [{
+            'rank': rank,
+            'knockout': [self.candidates[i] for i in combination],
+            'score': score,
+            'effects': dict(zip(self.targets, effects))
+        } for rank, (score, combination, effects) in enumerate(ranked, start=1)]
+
+def main():
+    """Main function to run a combinatorial knockout screen"""
+    parser = argparse.ArgumentParser(description='Screen combinations of regulator knockouts')
+    parser.add_argument('--size', type=int, default=2, help='Number of genes knocked out together')
+    parser.add_argument('--targets', default=','.join(DEFAULT_TARGETS), help='Comma-separated target signature genes')
+    parser.add_argument('--candidates', default=None, help='Comma-separated genes to combine (default: all regulators)')
+    parser.add_argument('--top', type=int, default=20, help='Number of combinations to report')
+    parser.add_argument('--workers', type=int, default=None, help='Worker processes (default: CPU count)')
+    parser.add_argument('--block-size', type=int, default=BLOCK_SIZE, help='Knockouts per perturbation matrix')
+    parser.add_argument('--network', type=Path, default=NETWORK_FILE, help='Regulatory network TSV file')
+    parser.add_argument('--output', type=Path, help='Save the ranked combinations as TSV to this file')
+    args = parser.parse_args()
+
+    network = load_network(args.network)
+    targets = [g.strip().upper() for g in args.targets.split(',') if g.strip()]
+    candidates = [g.strip().upper() for g in args.candidates.split(',') if g.strip()] if args.candidates else None
+
+    screen = KnockoutScreen(network, size=args.size, targets=targets, candidates=candidates, top=args.top,
+                            workers=args.workers, block_size=args.block_size)
+    print(f"Screening {screen.total_combinations} combinations of {args.size} from {len(screen.candidates)} genes...")
+    for completed, total in screen.run():
+        print(f"\r{completed}/{total} blocks", end='', flush=True)
+    print()
+
+    lines = ['rank\tknockout\tscore\t' + '\t'.join(screen.targets)]
+    for result in screen.results():
+        effects = '\t'.join(f"{result['effects'][t]:.4f}" for t in screen.targets)
+        lines.append(f"{result['rank']}\t{'+'.join(result['knockout'])}\t{result['score']:.4f}\t{effects}")
+    print('\n'.join(lines))
+
+    if args.output:
+        args.output.write_text('\n'.join(lines) + '\n')
+        print(f"Saved knockout screen results to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,324 @@
+#!/usr/bin/env python3
+"""
+Load-testing harness for the IBD RNA-Seq Analysis Platform API
+
+Replays a recorded request log, or a synthetic mix of the gene expression,
+gene search, pathway analysis, model comparison and target validation
+endpoints, against a running (or locally started) api_server.py. Reports
+p50/p95/p99 latency, throughput and error rate per route and saves the
+results as JSON so runs can be compared.
+
+Examples:
+    python load_test.py --start-server --concurrency 16 --duration 30
+    python load_test.py --url http://localhost:5000 --log access.log --output run.json
+    python load_test.py --start-server --compare baseline.json
+"""
+
+import re
+import sys
+import json
+import time
+import random
+import argparse
+import threading
+import subprocess
+import http.client
+import numpy as np
+from collections import defaultdict
+from pathlib import Path
+from urllib.parse import urlsplit, quote
+
+# Define base directories
+BASE_DIR = Path(__file__).resolve().parent
+
+# Synthetic traffic: route weights and the genes and models requests draw from
+SYNTHETIC_MIX = {
+    'gene_expression': 0.35,
+    'gene_expression_post': 0.05,
+    'search_gene': 0.25,
+    'pathway_analysis': 0.15,
+    'model_comparison': 0.10,
+    'target_validation': 0.10
+}
+GENES = [
+    'IL1B', 'TNF', 'IL6', 'IL17A', 'IFNG', 'FOXP3', 'RORC', 'TBX21', 'GATA3', 'IL10',
+    'IL23A', 'IL12B', 'TGFB1', 'STAT3', 'STAT1', 'NFKB1', 'RELA', 'MAPK1', 'MAPK3', 'JAK1',
+    'JAK2', 'TLR4', 'TLR2', 'MYD88', 'NLRP3', 'IL18', 'IL1A', 'IL4', 'IL5', 'IL13'
+]
+MODELS = ['cd45rb', 'acute_dss', 'chronic_dss', 'il10ko', 'human_uc', 'human_cd']
+PATHWAYS = ['Inflammatory response', 'Cytokine signaling', 'T cell activation', 'NF-kB signaling', 'TNF signaling']
+
+# "METHOD /path HTTP/x" inside common/combined access log lines
+ACCESS_LOG_REQUEST = re.compile(r'"(GET|POST|PUT|DELETE|HEAD) (\S+) HTTP/[\d.]+"')
+
+def synthetic_request(rng):
+    """
+    Draw one request from the synthetic traffic mix
+
+    Returns:
+    --------
+    dict
+        Request with 'method', 'path' and optional 'body'
+    """
+    kind = rng.choices(list(SYNTHETIC_MIX), weights=list(SYNTHETIC_MIX.values()))[0]
+    models = ','.join(rng.sample(MODELS, rng.randint(1, len(MODELS))))
+
+    if kind == 'gene_expression':
+        genes = ','.join(rng.sample(GENES, rng.randint(1, 10)))
+        return {'method': 'GET', 'path': f"/api/gene_expression?genes={genes}&models={models}"}
+    if kind == 'gene_expression_post':
+        genes = [rng.choice(GENES) for _ in range(rng.randint(100, 2000))]
+        return {'method': 'POST', 'path': '/api/gene_expression', 'body': {'genes': genes, 'models': models.split(',')}}
+    if kind == 'search_gene':
+        gene = rng.choice(GENES)
+        return {'method': 'GET', 'path': f"/api/search_gene?query={gene[:rng.randint(1, len(gene))]}"}
+    if kind == 'pathway_analysis':
+        pathway = quote(rng.choice(PATHWAYS))
+        return {'method': 'GET', 'path': f"/api/pathway_analysis?pathway={pathway}&models={models}"}
+    return {'method': 'GET', 'path': f"/api/{kind}"}
+
+def read_request_log(path):
+    """
+    Read a recorded request log
+
+    Each line is either a JSON object with 'method', 'path' and optional
+    'body', or a common/combined-format access log line.
+
+    Returns:
+    --------
+    list
+        Requests in log order
+    """
+    requests = []
+    with open(path) as f:
+        for line in f:
+            line = line.strip()
+            if not line:
+                continue
+            if line.startswith('{'):
+                entry = json.loads(line)
+                requests.append({'method': entry.get('method', 'GET'), 'path': entry['path'], 'body': entry.get('body')})
+                continue
+            match = ACCESS_LOG_REQUEST.search(line)
+            if match:
+                requests.append({'method': match.group(1), 'path': match.group(2)})
+    return requests
+
+def route_of(req):
+    """Route label for a request: method plus path without the query string"""
+    return f"{req['method']} {req['path'].split('?', 1)[0]}"
+
+def start_server(port):
+    """Start api_server.py on a local port and wait until it answers"""
+    # Run without the debug reloader so terminating the process stops the server
+    process = subprocess.Popen(
+        [sys.executable, '-c', f"import api_server; api_server.app.run(host='127.0.0.1', port={port})"],
+        cwd=str(BASE_DIR),
+        stdout=subprocess.DEVNULL,
+        stderr=subprocess.DEVNULL
+    )
+    deadline = time.monotonic() + 30
+    while time.monotonic() < deadline:
+        try:
+            connection = http.client.HTTPConnection('127.0.0.1', port, timeout=1)
+            connection.request('GET', '/api/model_comparison')
+            connection.getresponse().read()
+            return process
+        except OSError:
+            time.sleep(0.2)
+    process.terminate()
+    raise RuntimeError(f"api_server.py did not start on port {port}")
+
+def run_load(base_url, next_request, concurrency, duration, max_requests):
+    """
+    Send requests from several threads and record each one
+
+    Parameters:
+    -----------
+    base_url : str
+        Server URL (e.g., 'http://127.0.0.1:5000')
+    next_request : callable
+        Returns the next request dict, or None when the source is exhausted
+    concurrency : int
+        Number of concurrent client threads (one keep-alive connection each)
+    duration : float
+        Stop after this many seconds
+    max_requests : int
+        Stop after this many requests (None for no limit)
+
+    Returns:
+    --------
+    tuple
+        List of (route, latency_seconds, status, nbytes) records and wall time
+    """
+    url = urlsplit(base_url)
+    records = []
+    lock = threading.Lock()
+    counter = {'sent': 0}
+    deadline = time.monotonic() + duration
+
+    def worker():
+        connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+        while time.monotonic() < deadline:
+            with lock:
+                if max_requests is not None and counter['sent'] >= max_requests:
+                    break
+                req = next_request()
+                if req is None:
+                    break
+                counter['sent'] += 1
+
+            body = None
+            headers = {'Accept-Encoding': 'identity'}
+            if req.get('body') is not None:
+                body = json.dumps(req['body'])
+                headers['Content-Type'] = 'application/json'
+
+            start = time.perf_counter()
+            try:
+                connection.request(req['method'], req['path'], body=body, headers=headers)
+                response = connection.getresponse()
+                nbytes = len(response.read())
+                status = response.status
+            except (OSError, http.client.HTTPException):
+                connection.close()
+                connection = http.client.HTTPConnection(url.hostname, url.port or 80, timeout=60)
+                nbytes, status = 0, 0
+            latency = time.perf_counter() - start
+
+            with lock:
+                records.append((route_of(req), latency, status, nbytes))
+        connection.close()
+
+    started = time.perf_counter()
+    threads = [threading.Thread(target=worker) for _ in range(concurrency)]
+    for thread in threads:
+        thread.start()
+    for thread in threads:
+        thread.join()
+    return records, time.perf_counter() - started
+
+def summarize(records, wall_time):
+    """
+    Latency percentiles, throughput and error rate per route and overall
+
+    Returns:
+    --------
+    dict
+        Summary keyed by route, plus an 'ALL' entry
+    """
+    by_route = defaultdict(list)
+    for record in records:
+        by_route[record[0]].append(record)
+        by_route['ALL'].append(record)
+
+    summary = {}
+    for route, route_records in sorted(by_route.items()):
+        latencies = np.array([r[1] for r in route_records]) * 1000.0
+        errors = sum(1 for r in route_records if r[2] == 0 or r[2] >= 400)
+        p50, p95, p99 = np.percentile(latencies, [50, 95, 99])
+        summary[route] = {
+            'requests': len(route_records),
+            'throughput_rps': len(route_records) / wall_time,
+            'error_rate': errors / len(route_records),
+            'p50_ms': float(p50),
+            'p95_ms': float(p95),
+            'p99_ms': float(p99),
+            'mean_ms': float(latencies.mean()),
+            'bytes': int(sum(r[3] for r in route_records))
+        }
+    return summary
+
+def print_summary(summary, baseline=None):
+    """Print the per-route table, with p99 and throughput changes against a baseline"""
+    header = f"{'route':<40} {'reqs':>7} {'rps':>9} {'err%':>6} {'p50ms':>8} {'p95ms':>8} {'p99ms':>8}"
+    if baseline:
+        header += f" {'Δp99%':>7} {'Δrps%':>7}"
+    print(header)
+    for route, stats in summary.items():
+        line = (f"{route:<40} {stats['requests']:>7} {stats['throughput_rps']:>9.1f} "
+                f"{stats['error_rate'] * 100:>6.2f} {stats['p50_ms']:>8.2f} {stats['p95_ms']:>8.2f} {stats['p99_ms']:>8.2f}")
+        previous = (baseline or {}).get(route)
+        if previous:
+            line += (f" {(stats['p99_ms'] / previous['p99_ms'] - 1) * 100:>+7.1f}"
+                     f" {(stats['throughput_rps'] / previous['throughput_rps'] - 1) * 100:>+7.1f}")
+        print(line)
+
+def main():
+    """Main function to run a load test"""
+    parser = argparse.ArgumentParser(description='Load-test the IBD RNA-Seq Analysis Platform API')
+    parser.add_argument('--url', default=None, help='Server URL (default: start a local server)')
+    parser.add_argument('--start-server', action='store_true', help='Start api_server.py locally for the run')
+    parser.add_argument('--port', type=int, default=5055, help='Port for the locally started server')
+    parser.add_argument('--log', type=Path, help='Replay this request log instead of synthetic traffic')
+    parser.add_argument('--loop', action='store_true', help='Restart the request log when it runs out')
+    parser.add_argument('--concurrency', type=int, default=8, help='Concurrent client connections')
+    parser.add_argument('--duration', type=float, default=20.0, help='Maximum run time in seconds')
+    parser.add_argument('--requests', type=int, default=None, help='Maximum number of requests')
+    parser.add_argument('--seed', type=int, default=42, help='Random seed for the synthetic mix')
+    parser.add_argument('--output', type=Path, help='Save results as JSON to this file')
+    parser.add_argument('--compare', type=Path, help='Compare against a previously saved JSON result')
+    args = parser.parse_args()
+
+    if args.url is None and not args.start_server:
+        args.start_server = True
+
+    # Request source: replayed log or seeded synthetic mix
+    if args.log:
+        logged = read_request_log(args.log)
+        position = {'i': 0}
+
+        def next_request():
+            if position['i'] >= len(logged):
+                if not args.loop or not logged:
+                    return None
+                position['i'] = 0
+            position['i'] += 1
+            return logged[position['i'] - 1]
+    else:
+        rng = random.Random(args.seed)
+
+        def next_request():
+            return synthetic_request(rng)
+
+    server = None
+    base_url = args.url
+    if args.start_server:
+        print(f"Starting api_server.py on port {args.port}...")
+        server = start_server(args.port)
+        base_url = f"http://127.0.0.1:{args.port}"
+
+    try:
+        print(f"Running load test against {base_url} with concurrency {args.concurrency}...")
+        records, wall_time = run_load(base_url, next_request, args.concurrency, args.duration, args.requests)
+    finally:
+        if server is not None:
+            server.terminate()
+            server.wait()
+
+    if not records:
+        print("No requests were sent")
+        return
+
+    summary = summarize(records, wall_time)
+    baseline = None
+    if args.compare:
+        with open(args.compare) as f:
+            baseline = json.load(f)['routes']
+    print_summary(summary, baseline)
+
+    if args.output:
+        result = {
+            'timestamp': time.strftime('%Y-%m-%dT%H:%M:%S'),
+            'url': base_url,
+            'source': str(args.log) if args.log else 'synthetic',
+            'concurrency': args.concurrency,
+            'wall_time_s': wall_time,
+            'routes': summary
+        }
+        with open(args.output, 'w') as f:
+            json.dump(result, f, indent=2)
+        print(f"Saved load test results to {args.output}")
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,281 @@
+#!/usr/bin/env python3
+"""
+Prometheus-style request metrics for the IBD RNA-Seq Analysis Platform API
+
+Every Flask route gets a latency histogram, an in-flight gauge, response byte
+and error counters and response cache hit/miss counters. Each process keeps
+its values in a fixed-layout float64 array; when ``METRICS_DIR`` is set (as it
+is by gunicorn.conf.py) the array is a memory-mapped file in that shared
+directory, and ``/metrics`` sums the files of every worker so the exposition
+covers the whole gunicorn pool. In-flight gauges only count live workers.
+"""
+
+import os
+import time
+import hashlib
+import threading
+import numpy as np
+from pathlib import Path
+from flask import g, request
+
+# Shared directory for per-process metric files (unset: in-process metrics only)
+METRICS_DIR_ENV = 'METRICS_DIR'
+
+# Latency histogram bucket upper bounds in seconds (the +Inf bucket is implicit)
+LATENCY_BUCKETS = [0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0]
+
+# Per-route fields after the histogram buckets
+FIELDS = ['sum', 'count', 'bytes', 'in_flight', 'client_errors', 'server_errors', 'cache_hits', 'cache_misses']
+N_BUCKETS = len(LATENCY_BUCKETS) + 1
+FIELD_OFFSETS = {name: N_BUCKETS + i for i, name in enumerate(FIELDS)}
+ROW_SIZE = N_BUCKETS + len(FIELDS)
+
+# Label for requests that match no route
+UNMATCHED_ROUTE = ('unmatched', '*')
+
+def route_layout(app):
+    """Sorted (route, method) pairs for every rule of the app"""
+    routes = {UNMATCHED_ROUTE}
+    for rule in app.url_map.iter_rules():
+        for method in rule.methods:
+            routes.add((rule.rule, method))
+    return sorted(routes)
+
+def process_alive(pid):
+    """Return True if a process with this pid is running"""
+    try:
+        os.kill(pid, 0)
+    except ProcessLookupError:
+        return False
+    except PermissionError:
+        return True
+    return True
+
+def clear_metrics_dir(metrics_dir):
+    """Remove metric files left over from previous server runs"""
+    metrics_dir = Path(metrics_dir)
+    os.makedirs(metrics_dir, exist_ok=True)
+    for path in metrics_dir.glob('metrics_*.bin'):
+        path.unlink()
+
+class MetricsRegistry:
+    """Per-process metric values, optionally backed by a shared directory"""
+
+    def __init__(self, app, metrics_dir=None):
+        self.app = app
+        self.metrics_dir = Path(metrics_dir) if metrics_dir else None
+        self.lock = threading.Lock()
+        self.routes = None
+        self.route_index = None
+        self.layout_id = None
+        self.values = None
+        self.pid = None
+
+    def ensure_open(self):
+        """Allocate this process's values, reopening after a fork"""
+        if self.values is not None and self.pid == os.getpid():
+            return
+        with self.lock:
+            if self.values is not None and self.pid == os.getpid():
+                return
+
+            # Every worker runs the same code, so the route layout is identical
+            self.routes = route_layout(self.app)
+            self.route_index = {route: i for i, route in enumerate(self.routes)}
+            self.layout_id = hashlib.sha1(repr(self.routes).encode()).hexdigest()[:12]
+            shape = (len(self.routes), ROW_SIZE)
+
+            if self.metrics_dir is None:
+                self.values = np.zeros(shape, dtype=np.float64)
+            else:
+                os.makedirs(self.metrics_dir, exist_ok=True)
+                path = self.metrics_dir / f"metrics_{self.layout_id}_{os.getpid()}.bin"
+                self.values = np.memmap(path, dtype=np.float64, mode='w+', shape=shape)
+            self.pid = os.getpid()
+
+    def row(self, route):
+        """Row index for a (route, method) pair"""
+        return self.route_index.get(route, self.route_index[UNMATCHED_ROUTE])
+
+    def start(self, route):
+        """Record the start of a request"""
+        self.ensure_open()
+        with self.lock:
+            self.values[self.row(route), FIELD_OFFSETS['in_flight']] += 1
+
+    def finish(self, route, duration, status, nbytes, cache_status):
+        """Record the end of a request"""
+        self.ensure_open()
+        row = self.values[self.row(route)]
+        bucket = int(np.searchsorted(LATENCY_BUCKETS, duration, side='left'))
+        with self.lock:
+            row[bucket] += 1
+            row[FIELD_OFFSETS['sum']] += duration
+            row[FIELD_OFFSETS['count']] += 1
+            row[FIELD_OFFSETS['in_flight']] -= 1
+            if nbytes:
+                row[FIELD_OFFSETS['bytes']] += nbytes
+            if 400 <= status < 500:
+                row[FIELD_OFFSETS['client_errors']] += 1
+            elif status >= 500:
+                row[FIELD_OFFSETS['server_errors']] += 1
+            if cache_status == 'HIT':
+                row[FIELD_OFFSETS['cache_hits']] += 1
+            elif cache_status == 'MISS':
+                row[FIELD_OFFSETS['cache_misses']] += 1
+
+    def collect(self):
+        """
+        Sum the values of every process
+
+        Returns:
+        --------
+        np.ndarray
+            Aggregated (route x field) values
+        """
+        self.ensure_open()
+        if self.metrics_dir is None:
+            return np.array(self.values)
+
+        totals = np.zeros((len(self.routes), ROW_SIZE), dtype=np.float64)
+        in_flight = FIELD_OFFSETS['in_flight']
+        for path in self.metrics_dir.glob(f"metrics_{self.layout_id}_*.bin"):
+            pid = int(path.stem.rsplit('_', 1)[1])
+            values = np.fromfile(path, dtype=np.float64).reshape(totals.shape)
+
+            # Counters outlive their worker, gauges do not
+            if not process_alive(pid):
+                values[:, in_flight] = 0
+            totals += values
+        return totals
+
+    def render(self):
+        """Render all metrics in the Prometheus text exposition format"""
+        totals = self.collect()
+        active = [i for i in range(len(self.routes))
+                  if totals[i, FIELD_OFFSETS['count']] > 0 or totals[i, FIELD_OFFSETS['in_flight']] > 0]
+
+        def labels(i, **extra):
+            route, method = self.routes[i]
+            pairs = [('route', route), ('method', method), *extra.items()]
+            return '{' + ','.join(f'{k}="{v}"' for k, v in pairs) + '}'
+
+        lines = [
+            '# HELP http_request_duration_seconds Request latency by route',
+            '# TYPE http_request_duration_seconds histogram'
+        ]
+        for i in active:
+            cumulative = np.cumsum(totals[i, :N_BUCKETS])
+            for bound, count in zip(LATENCY_BUCKETS + ['+Inf'], cumulative):
+                lines.append(f"http_request_duration_seconds_bucket{labels(i, le=bound)} {count:.0f}")
+            lines.append(f"http_request_duration_seconds_sum{labels(i)} {float(totals[i, FIELD_OFFSETS['sum']])!r}")
+            lines.append(f"http_request_duration_seconds_count{labels(i)} {totals[i, FIELD_OFFSETS['count']]:.0f}")
+
+        lines += [
+            '# HELP http_requests_in_flight Requests currently being handled',
+            '# TYPE http_requests_in_flight gauge'
+        ]
+        for i in active:
+            lines.append(f"http_requests_in_flight{labels(i)} {totals[i, FIELD_OFFSETS['in_flight']]:.0f}")
+
+        lines += [
+            '# HELP http_response_bytes_total Response body bytes sent',
+            '# TYPE http_response_bytes_total counter'
+        ]
+        for i in active:
+            lines.append(f"http_response_bytes_total{labels(i)} {totals[i, FIELD_OFFSETS['bytes']]:.0f}")
+
+        lines += [
+            '# HELP http_request_errors_total Requests that ended with a 4xx or 5xx status',
+            '# TYPE http_request_errors_total counter'
+        ]
+        for i in active:
+            lines.append(f"http_request_errors_total{labels(i, status_class='4xx')} {totals[i, FIELD_OFFSETS['client_errors']]:.0f}")
+            lines.append(f"http_request_errors_total{labels(i, status_class='5xx')} {totals[i, FIELD_OFFSETS['server_errors']]:.0f}")
+
+        lines += [
+            '# HELP http_response_cache_total Response cache lookups by result',
+            '# TYPE http_response_cache_total counter'
+        ]
+        for i in active:
+            hits = totals[i, FIELD_OFFSETS['cache_hits']]
+            misses = totals[i, FIELD_OFFSETS['cache_misses']]
+            if hits or misses:
+                lines.append(f"http_response_cache_total{labels(i, result='hit')} {hits:.0f}")
+                lines.append(f"http_response_cache_total{labels(i, result='miss')} {misses:.0f}")
+
+        return '\n'.join(lines) + '\n'
+
+def request_route():
+    """(route, method) label pair for the current request"""
+    if request.url_rule is None:
+        return UNMATCHED_ROUTE
+    return (request.url_rule.rule, request.method)
+
+def instrument_app(app, metrics_dir=None):
+    """
+    Instrument every route of a Flask app and expose ``/metrics``
+
+    Parameters:
+    -----------
+    app : Flask
+        Application to instrument
+    metrics_dir : Path
+        Shared directory for multi-process aggregation (defaults to the
+        METRICS_DIR environment variable; unset means this process only)
+
+    Returns:
+    --------
+    MetricsRegistry
+        Registry holding this process's metrics
+    """
+    registry = MetricsRegistry(app, metrics_dir or os.environ.get(METRICS_DIR_ENV))
+
+    @app.before_request
+    def start_request_timer():
+        g.metrics_route = request_route()
+        g.metrics_start = time.perf_counter()
+        g.metrics_finished = False
+        registry.start(g.metrics_route)
+
+    @app.after_request
+    def record_request_metrics(response):
+        route = g.get('metrics_route')
+        if route is None:
+            return response
+        start = g.metrics_start
+        g.metrics_finished = True
+        status, cache_status = response.status_code, response.headers.get('X-Cache')
+
+        # A streamed body is produced while it is sent, so its bytes are counted
+        # as they go out and the request ends when the server closes the response
+        nbytes = response.calculate_content_length()
+        if nbytes is None and response.is_streamed:
+            sent = [0]
+            response.response = count_streamed_bytes(sent, response.response)
+            response.call_on_close(
+                lambda: registry.finish(route, time.perf_counter() - start, status, sent[0], cache_status)
+            )
+        else:
+            registry.finish(route, time.perf_counter() - start, status, nbytes, cache_status)
+        return response
+
+    @app.teardown_request
+    def record_failed_request(exc):
+        # Unhandled exceptions skip after_request handlers
+        route = g.get('metrics_route')
+        if route is not None and not g.get('metrics_finished'):
+            registry.finish(route, time.perf_counter() - g.metrics_start, 500, 0, None)
+
+    @app.route('/metrics', methods=['GET'])
+    def metrics():
+        """Expose request metrics in Prometheus text format"""
+        return app.response_class(registry.render(), mimetype='text/plain; version=0.0.4')
+
+    return registry
+
+def count_streamed_bytes(sent, chunks):
+    """Pass streamed chunks through while adding their size to sent[0]"""
+    for chunk in chunks:
+        sent[0] += len(chunk.encode('utf-8') if isinstance(chunk, str) else chunk)
+        yield chunk
@@ -0,0 +1,157 @@
+#!/usr/bin/env python3
+"""
+On-demand request profiling for the IBD RNA-Seq Analysis Platform API
+
+A request is profiled when profiling is switched on for every request with the
+``PROFILE_ALL_REQUESTS`` config flag, or when it carries an ``X-Profile-Token``
+header matching the ``PROFILE_TOKEN`` environment variable. A sampling thread
+then records the handler thread's Python stack at a fixed interval and writes
+the samples as collapsed stacks (``frame;frame;frame count`` per line, the
+input format of flamegraph.pl and speedscope) to ``<request_id>.collapsed`` in
+the profile directory. Streamed responses (e.g., NDJSON) are sampled until
+their body has been sent, since the generator does most of the work after the
+handler returns. Unprofiled requests only pay for one header lookup.
+"""
+
+import os
+import re
+import sys
+import hmac
+import time
+import uuid
+import tempfile
+import threading
+from collections import Counter
+from pathlib import Path
+from flask import g, request, jsonify
+
+# Admin header and environment settings
+PROFILE_TOKEN_HEADER = 'X-Profile-Token'
+PROFILE_ID_HEADER = 'X-Profile-Id'
+PROFILE_TOKEN_ENV = 'PROFILE_TOKEN'
+PROFILE_DIR_ENV = 'PROFILE_DIR'
+
+# Seconds between stack samples
+SAMPLE_INTERVAL = 0.001
+
+# Request ids accepted from clients and for profile lookup
+REQUEST_ID_PATTERN = re.compile(r'^[A-Za-z0-9_.-]{1,64}$')
+
+class StackSampler:
+    """Sample one thread's Python stack from a background thread"""
+
+    def __init__(self, thread_id, interval=SAMPLE_INTERVAL):
+        self.thread_id = thread_id
+        self.interval = interval
+        self.stacks = Counter()
+        self.stopped = threading.Event()
+        self.thread = threading.Thread(target=self.run, daemon=True)
+        self.started_at = None
+        self.duration = None
+
+    def start(self):
+        self.started_at = time.perf_counter()
+        self.thread.start()
+
+    def stop(self):
+        self.stopped.set()
+        self.thread.join()
+        self.duration = time.perf_counter() - self.started_at
+
+    def run(self):
+        while not self.stopped.wait(self.interval):
+            frame = sys._current_frames().get(self.thread_id)
+            if frame is None:
+                continue
+
+            # Collapsed stacks list frames from the root to the leaf
+            stack = []
+            while frame is not None:
+                code = frame.f_code
+                stack.append(f"{os.path.basename(code.co_filename)}:{code.co_name}:{frame.f_lineno}")
+                frame = frame.f_back
+            self.stacks[';'.join(reversed(stack))] += 1
+
+    def collapsed(self):
+        """Samples in collapsed-stack text format"""
+        return ''.join(f"{stack} {count}\n" for stack, count in self.stacks.most_common())
+
+def token_matches():
+    """Return True if the request carries the configured profile token (compared in constant time)"""
+    token = os.environ.get(PROFILE_TOKEN_ENV)
+    supplied = request.headers.get(PROFILE_TOKEN_HEADER)
+    return bool(token) and supplied is not None and hmac.compare_digest(supplied.encode(), token.encode())
+
+def profiling_requested(app):
+    """Return True if the current request should be profiled"""
+    return bool(app.config.get('PROFILE_ALL_REQUESTS')) or token_matches()
+
+def install_profiler(app, profile_dir=None):
+    """
+    Register the request profiling hooks and the profile lookup route
+
+    Parameters:
+    -----------
+    app : Flask
+        Application to profile
+    profile_dir : Path
+        Directory for collapsed-stack files, shared by all workers (defaults
+        to the PROFILE_DIR environment variable or a temporary directory)
+
+    Returns:
+    --------
+    Path
+        Directory where profiles are stored
+    """
+    profile_dir = Path(profile_dir or os.environ.get(PROFILE_DIR_ENV)
+                       or Path(tempfile.gettempdir()) / 'ibd_api_profiles')
+
+    @app.before_request
+    def start_profiler():
+        if not profiling_requested(app):
+            return
+        request_id = request.headers.get('X-Request-ID', '')
+        if not REQUEST_ID_PATTERN.match(request_id):
+            request_id = uuid.uuid4().hex
+        g.profile_id = request_id
+        g.profiler = StackSampler(threading.get_ident())
+        g.profiler.start()
+
+    def save_profile(profiler, profile_id):
+        profiler.stop()
+        os.makedirs(profile_dir, exist_ok=True)
+        (profile_dir / f"{profile_id}.collapsed").write_text(profiler.collapsed())
+
+    @app.after_request
+    def stop_profiler(response):
+        profiler = g.pop('profiler', None)
+        if profiler is None:
+            return response
+        response.headers[PROFILE_ID_HEADER] = g.profile_id
+
+        # A streamed body is produced while it is sent, so keep sampling until the server closes it
+        if response.is_streamed:
+            profile_id = g.profile_id
+            response.call_on_close(lambda: save_profile(profiler, profile_id))
+        else:
+            save_profile(profiler, g.profile_id)
+        return response
+
+    @app.teardown_request
+    def discard_profiler(exc):
+        # Stop the sampler if the handler raised before after_request ran
+        profiler = g.pop('profiler', None)
+        if profiler is not None:
+            profiler.stop()
+
+    @app.route('/api/profiles/<profile_id>', methods=['GET'])
+    def get_profile(profile_id):
+        """Return a stored request profile as collapsed stacks"""
+        if not token_matches():
+            return jsonify({'error': 'Profiling is not enabled for this client'}), 403
+        path = profile_dir / f"{profile_id}.collapsed"
+        if not REQUEST_ID_PATTERN.match(profile_id) or not path.exists():
+            return jsonify({'error': f"Profile not found: {profile_id}"}), 404
+        return app.response_class(path.read_text(), mimetype='text/plain')
+
+    return profile_dir
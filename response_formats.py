@@ -0,0 +1,118 @@
+#!/usr/bin/env python3
+"""
+Binary response encodings for the IBD RNA-Seq Analysis Platform API
+
+Payloads are columnar: a list of row labels plus named float columns of equal
+length. Two binary encodings are offered next to JSON:
+
+* ``application/x-float32-columns``: a little-endian uint32 header length, a
+  UTF-8 JSON header describing rows and column offsets, zero padding to an
+  8-byte boundary, then each column as raw little-endian float32 values.
+* ``application/vnd.apache.arrow.stream``: an Arrow IPC stream with one
+  record batch (only when pyarrow is installed).
+"""
+
+import json
+import struct
+import numpy as np
+
+try:
+    import pyarrow as pa
+except ImportError:  # Arrow IPC is only offered when pyarrow is installed
+    pa = None
+
+# Media types
+JSON_MIMETYPE = 'application/json'
+FLOAT32_MIMETYPE = 'application/x-float32-columns'
+ARROW_MIMETYPE = 'application/vnd.apache.arrow.stream'
+
+def available_mimetypes():
+    """Media types the API can produce, JSON first so it stays the default"""
+    mimetypes = [JSON_MIMETYPE, FLOAT32_MIMETYPE]
+    if pa is not None:
+        mimetypes.append(ARROW_MIMETYPE)
+    return mimetypes
+
+def encode_float32_columns(rows, columns, metadata=None):
+    """
+    Encode columns as raw little-endian float32 buffers behind a JSON header
+
+    Parameters:
+    -----------
+    rows : list
+        Row labels (e.g., gene symbols)
+    columns : dict
+        Mapping of column name to 1-D array with one value per row
+    metadata : dict
+        Extra JSON-serializable fields for the header (optional)
+
+    Returns:
+    --------
+    list
+        Byte chunks of the encoded payload, one per column after the header,
+        ready to be written by a WSGI server
+    """
+    buffers = []
+    header_columns = []
+    offset = 0
+    for name, values in columns.items():
+        values = np.ascontiguousarray(values, dtype='<f4')
+        header_columns.append({'name': name, 'offset': offset, 'length': len(values)})
+        buffers.append(values.tobytes())
+        offset += values.nbytes
+
+    header = {
+        'dtype': '<f4',
+        'rows': list(rows),
+        'columns': header_columns,
+        'metadata': metadata or {}
+    }
+    header_bytes = json.dumps(header).encode('utf-8')
+
+    # Pad so the first column starts on an 8-byte boundary
+    padding = (-(4 + len(header_bytes))) % 8
+    prefix = struct.pack('<I', len(header_bytes)) + header_bytes + b'\0' * padding
+    return [prefix, *buffers]
+
+def encode_arrow_ipc(rows, columns, metadata=None, row_name='row'):
+    """
+    Encode columns as an Arrow IPC stream with a single record batch
+
+    Parameters:
+    -----------
+    rows : list
+        Row labels, stored as a string column named ``row_name``
+    columns : dict
+        Mapping of column name to 1-D array with one value per row
+    metadata : dict
+        Extra JSON-serializable fields stored in the schema metadata (optional)
+    row_name : str
+        Name of the row label column
+
+    Returns:
+    --------
+    list
+        Byte chunks of the encoded payload
+    """
+    if pa is None:
+        raise RuntimeError("pyarrow is required for Arrow IPC responses")
+
+    # Contiguous float32 arrays are wrapped by Arrow without copying
+    arrays = [pa.array(list(rows), type=pa.string())]
+    arrays += [pa.array(np.ascontiguousarray(values, dtype=np.float32)) for values in columns.values()]
+    names = [row_name, *columns]
+    schema_metadata = {'metadata': json.dumps(metadata or {})}
+    batch = pa.RecordBatch.from_arrays(arrays, names=names).replace_schema_metadata(schema_metadata)
+
+    sink = pa.BufferOutputStream()
+    with pa.ipc.new_stream(sink, batch.schema) as writer:
+        writer.write_batch(batch)
+    return [sink.getvalue().to_pybytes()]
+
+def encode_columns(mimetype, rows, columns, metadata=None, row_name='row'):
+    """Encode a columnar payload in the given binary media type"""
+    if mimetype == ARROW_MIMETYPE:
+        return encode_arrow_ipc(rows, columns, metadata, row_name=row_name)
+    if mimetype == FLOAT32_MIMETYPE:
+        return encode_float32_columns(rows, columns, metadata)
+    raise ValueError(f"Unsupported binary media type: {mimetype}")
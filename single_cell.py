@@ -0,0 +1,123 @@
+#!/usr/bin/env python3
+"""
+Sparse single-cell expression handling for the IBD RNA-Seq Analysis Platform
+
+Single-cell count matrices (e.g., GSE264408, acute and chronic DSS) are mostly
+zeros, so they stay in scipy.sparse form from ingest to aggregation: a 10x
+Genomics MatrixMarket directory is read as a genes x cells CSC matrix, and
+pseudobulk profiles per (sample, cell type, condition) are one sparse product
+with a cells x groups indicator matrix. Raw counts are summed and the small
+dense genes x groups result is library-size normalized afterwards, as
+pseudobulk DE expects; the cell matrix is never densified.
+"""
+
+import gzip
+import numpy as np
+import pandas as pd
+import scipy.io
+import scipy.sparse as sp
+from pathlib import Path
+
+# Cell metadata columns that define a pseudobulk group
+PSEUDOBULK_KEYS = ('sample', 'cell_type', 'condition')
+
+# Genes detected in fewer cells are dropped at ingest
+MIN_CELLS_PER_GENE = 3
+
+def open_maybe_gzip(path):
+    """Open a text file that may be gzip-compressed"""
+    path = Path(path)
+    return gzip.open(path, 'rt') if path.suffix == '.gz' else open(path)
+
+def find_file(directory, names):
+    """First existing file among names (each also tried with .gz)"""
+    for name in names:
+        for candidate in (Path(directory) / name, Path(directory) / f"{name}.gz"):
+            if candidate.exists():
+                return candidate
+    raise FileNotFoundError(f"None of {', '.join(names)} found in {directory}")
+
+def read_10x_mtx(directory):
+    """
+    Read a 10x Genomics MatrixMarket directory
+
+    Parameters:
+    -----------
+    directory : Path
+        Directory with matrix.mtx, features.tsv (or genes.tsv) and barcodes.tsv
+        (optionally gzip-compressed)
+
+    Returns:
+    --------
+    tuple
+        genes x cells CSC count matrix (float32, exact for per-cell counts
+        below 2^24), gene symbols, cell barcodes
+    """
+    with open_maybe_gzip(find_file(directory, ['matrix.mtx'])) as f:
+        matrix = sp.csc_matrix(scipy.io.mmread(f), dtype=np.float32)
+    with open_maybe_gzip(find_file(directory, ['features.tsv', 'genes.tsv'])) as f:
+        features = [line.rstrip('\n').split('\t') for line in f]
+    with open_maybe_gzip(find_file(directory, ['barcodes.tsv'])) as f:
+        barcodes = [line.strip() for line in f]
+
+    # Use the symbol column when present, else the feature ID
+    genes = np.array([fields[1] if len(fields) > 1 else fields[0] for fields in features], dtype=str)
+    return matrix, genes, np.array(barcodes, dtype=str)
+
+def filter_genes(matrix, genes, min_cells=MIN_CELLS_PER_GENE):
+    """Drop genes detected in fewer than min_cells cells (stored entries per row)"""
+    keep = matrix.getnnz(axis=1) >= min_cells
+    return matrix[keep], genes[keep]
+
+def pseudobulk(matrix, genes, cell_metadata, keys=PSEUDOBULK_KEYS, min_cells=1):
+    """
+    Sum counts per (sample, cell type, condition) group with one sparse product
+
+    Parameters:
+    -----------
+    matrix : scipy.sparse matrix
+        genes x cells counts, columns in cell_metadata order
+    genes : np.ndarray
+        Gene symbols
+    cell_metadata : pd.DataFrame
+        One row per cell with the grouping columns
+    keys : iterable
+        Grouping columns present in cell_metadata
+    min_cells : int
+        Drop groups with fewer cells
+
+    Returns:
+    --------
+    tuple
+        Dense genes x groups expression DataFrame and a group metadata
+        DataFrame (grouping columns plus n_cells) indexed by group label
+    """
+    keys = [k for k in keys if k in cell_metadata.columns]
+    # Cells with a missing grouping value get code -1 and are left out
+    group_codes = cell_metadata.groupby(keys, sort=True, observed=True).ngroup()
+    group_codes = group_codes.fillna(-1).to_numpy(dtype=np.int64)
+    valid = group_codes >= 0
+    n_groups = int(group_codes.max()) + 1 if valid.any() else 0
+
+    # cells x groups indicator; matrix @ indicator sums every group's cells at once,
+    # in float64 so group totals above 2^24 stay exact integers
+    indicator = sp.csr_matrix(
+        (np.ones(valid.sum(), dtype=np.float64), (np.flatnonzero(valid), group_codes[valid])),
+        shape=(len(cell_metadata), n_groups)
+    )
+    sums = (matrix @ indicator).toarray().astype(np.float64, copy=False)
+
+    groups = (cell_metadata[valid].assign(_group=group_codes[valid])
+              .groupby('_group')[keys].first().sort_index())
+    groups['n_cells'] = np.bincount(group_codes[valid], minlength=n_groups)
+    groups.index = ['|'.join(str(v) for v in row) for row in groups[keys].itertuples(index=False)]
+    groups.index.name = 'pseudobulk_id'
+
+    keep = groups['n_cells'].to_numpy() >= min_cells
+    expression = pd.DataFrame(sums[:, keep], index=genes, columns=groups.index[keep])
+    return expression, groups[keep]
+
+def counts_per_million(expression):
+    """Library-size normalize a (small, dense) pseudobulk matrix to counts per million"""
+    totals = expression.sum(axis=0)
+    return expression.div(totals.where(totals > 0, 1), axis=1) * 1e6
@@ -0,0 +1,220 @@
+#!/usr/bin/env python3
+"""
+Content-hashed incremental stage cache for the IBD RNA-Seq Analysis Platform
+
+A stage's key hashes its name, the code version (the source of the analysis
+code), its parameters, the result digests of the stages it consumes and the
+content of its input files. After a stage runs, its result is pickled under
+ANALYSIS_DIR/.stage_cache/ next to a JSON record of the key, the result digest
+and the SHA-256 of each output file. A later run with the same key, and with
+every output still on disk unchanged, loads that result instead of recomputing
+it.
+
+Consumers hash their inputs' result digests rather than their keys, so
+changing one model recomputes only that model's stages and whatever consumes
+them, and a recomputed stage whose result did not change leaves its consumers
+cached.
+"""
+
+import os
+import json
+import pickle
+import inspect
+import hashlib
+from pathlib import Path
+
+# Cache directory created inside ANALYSIS_DIR
+CACHE_DIR_NAME = '.stage_cache'
+
+# Bytes read at a time when hashing input files
+FILE_CHUNK_SIZE = 1 << 20
+
+def file_digest(path):
+    """SHA-256 of a file's content"""
+    digest = hashlib.sha256()
+    with open(path, 'rb') as f:
+        for chunk in iter(lambda: f.read(FILE_CHUNK_SIZE), b''):
+            digest.update(chunk)
+    return digest.hexdigest()
+
+def code_version(paths=(), modules=()):
+    """
+    SHA-256 over the code that implements the stages
+
+    Parameters:
+    -----------
+    paths : list
+        Library source files, hashed whole
+    modules : list
+        Modules whose function and class definitions are hashed, so editing
+        their configuration constants (e.g., one dataset's entry) does not
+        change the code version of every stage
+
+    Returns:
+    --------
+    str
+        Hex SHA-256 code version
+    """
+    digest = hashlib.sha256()
+    for path in sorted(Path(p) for p in paths):
+        digest.update(path.name.encode())
+        digest.update(file_digest(path).encode())
+    for module in modules:
+        for name, obj in sorted(vars(module).items()):
+            if (inspect.isfunction(obj) or inspect.isclass(obj)) and obj.__module__ == module.__name__:
+                digest.update(name.encode())
+                digest.update(inspect.getsource(obj).encode())
+    return digest.hexdigest()
+
+class StageCache:
+    """Stage results keyed by a hash of everything that determines them"""
+
+    def __init__(self, cache_dir, version, enabled=True):
+        """
+        Parameters:
+        -----------
+        cache_dir : Path
+            Directory for the records and pickled results
+        version : str
+            Code version (see code_version) hashed into every key
+        enabled : bool
+            If False every lookup misses (results are still recorded)
+        """
+        self.cache_dir = Path(cache_dir)
+        self.code_version = version
+        self.enabled = enabled
+        self.digests = {}  # Result digest of every stage run or loaded so far
+
+    def paths(self, name):
+        """Record and result file of a stage"""
+        stem = name.replace(':', '__').replace('/', '_')
+        return self.cache_dir / f"{stem}.json", self.cache_dir / f"{stem}.pkl"
+
+    def key(self, name, params=(), dependencies=(), input_files=()):
+        """
+        Hash of everything a stage's result depends on
+
+        Parameters:
+        -----------
+        name : str
+            Stage name
+        params : object
+            Picklable stage parameters
+        dependencies : list
+            Names of the input stages (already run or loaded)
+        input_files : list
+            Files the stage reads directly
+
+        Returns:
+        --------
+        str
+            Hex SHA-256 key
+        """
+        digest = hashlib.sha256()
+        digest.update(name.encode())
+        digest.update(self.code_version.encode())
+        digest.update(pickle.dumps(params, protocol=4))
+        for dependency in dependencies:
+            digest.update(dependency.encode())
+            digest.update(self.digests[dependency].encode())
+        for path in sorted(Path(p) for p in input_files):
+            digest.update(str(path).encode())
+            digest.update(file_digest(path).encode())
+        return digest.hexdigest()
+
+    def load(self, name, key):
+        """
+        Cached result of a stage, if its key matches and its outputs are unchanged
+
+        Raises:
+        -------
+        KeyError
+            If the stage has to be recomputed
+        """
+        record_file, result_file = self.paths(name)
+        if not self.enabled:
+            raise KeyError(name)
+        try:
+            record = json.loads(record_file.read_text())
+        except (OSError, ValueError):
+            raise KeyError(name) from None
+        if record.get('key') != key or not result_file.exists():
+            raise KeyError(name)
+        # Another script (or a person) may have rewritten an output since it was recorded
+        outputs = record.get('outputs')
+        if not isinstance(outputs, dict):
+            raise KeyError(name)
+        for path, recorded in outputs.items():
+            try:
+                unchanged = recorded is not None and file_digest(path) == recorded
+            except OSError:
+                unchanged = False
+            if not unchanged:
+                raise KeyError(name)
+
+        with open(result_file, 'rb') as f:
+            result = pickle.load(f)
+        self.digests[name] = record['digest']
+        return result
+
+    def save(self, name, key, result, outputs=()):
+        """Record a stage's result and output file digests under its key and return the result digest"""
+        data = pickle.dumps(result, protocol=pickle.HIGHEST_PROTOCOL)
+        digest = hashlib.sha256(data).hexdigest()
+        self.digests[name] = digest
+        # A declared output the stage did not write is recorded as None and never matches
+        output_digests = {str(path): file_digest(path) if Path(path).is_file() else None for path in outputs}
+
+        os.makedirs(self.cache_dir, exist_ok=True)
+        record_file, result_file = self.paths(name)
+        # Write to temporary files first so an interrupted run never leaves a matching record
+        for path, content in ((result_file, data),
+                              (record_file, json.dumps({
+                                  'stage': name,
+                                  'key': key,
+                                  'digest': digest,
+                                  'outputs': output_digests
+                              }, indent=2).encode())):
+            temporary = path.with_suffix(path.suffix + '.tmp')
+            temporary.write_bytes(content)
+            os.replace(temporary, path)
+        return digest
+
+    def run(self, name, function, args=(), params=None, dependencies=(), outputs=(), input_files=()):
+        """
+        Call function(*args) unless the stage is up to date
+
+        Parameters:
+        -----------
+        name : str
+            Stage name
+        function : callable
+            Stage function
+        args : tuple
+            Arguments of the call
+        params : object
+            What to hash instead of args (use when args hold data that the
+            dependencies already cover)
+        dependencies : list
+            Names of the stages args were derived from
+        outputs : list
+            Files the stage writes
+        input_files : list
+            Files the stage reads directly
+
+        Returns:
+        --------
+        object
+            The stage result
+        """
+        key = self.key(name, args if params is None else params, dependencies, input_files)
+        try:
+            result = self.load(name, key)
+            print(f"Stage {name} is up to date")
+            return result
+        except KeyError:
+            pass
+
+        result = function(*args)
+        self.save(name, key, result, outputs)
+        return result
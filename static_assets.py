@@ -0,0 +1,160 @@
+#!/usr/bin/env python3
+"""
+Precompressed, fingerprinted static assets for the IBD RNA-Seq Analysis Platform
+
+At server start every file in the web directory is read once, compressed with
+gzip (and brotli when the ``brotli`` package is installed) and, for scripts,
+stylesheets and images, given a content-hash fingerprinted name such as
+``scripts.3f2a9c1b7d4e.js``. HTML pages are rewritten to reference the
+fingerprinted names, so fingerprinted assets can be cached forever while the
+pages themselves are revalidated with ETags.
+"""
+
+import os
+import re
+import gzip
+import hashlib
+import mimetypes
+import posixpath
+from pathlib import Path
+
+try:
+    import brotli
+except ImportError:  # Brotli variants are only built when brotli is installed
+    brotli = None
+
+# Assets that get content-hash fingerprints
+FINGERPRINT_EXTENSIONS = {'.js', '.css', '.json', '.svg', '.png', '.jpg', '.jpeg', '.gif', '.ico', '.woff', '.woff2'}
+
+# Assets worth compressing (images are already compressed)
+COMPRESSIBLE_EXTENSIONS = {'.html', '.js', '.css', '.json', '.svg', '.txt', '.md'}
+
+# Skip tiny files where compression overhead outweighs the savings
+MIN_COMPRESS_BYTES = 256
+
+# Length of the content hash in fingerprinted names
+FINGERPRINT_LENGTH = 12
+
+# Cache-Control values
+IMMUTABLE_CACHE_CONTROL = 'public, max-age=31536000, immutable'
+REVALIDATE_CACHE_CONTROL = 'no-cache'
+
+# Local src/href references in HTML pages
+ASSET_REFERENCE = re.compile(r'''(\b(?:src|href)\s*=\s*["'])([^"'#?:]+)(["'])''')
+
+class StaticAsset:
+    """One static file with its precompressed variants"""
+
+    def __init__(self, path, content):
+        self.path = path
+        self.mimetype = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+        self.digest = hashlib.sha256(content).hexdigest()
+        self.variants = {'identity': content}
+
+        # Keep a compressed variant only when it is actually smaller
+        extension = posixpath.splitext(path)[1].lower()
+        if extension in COMPRESSIBLE_EXTENSIONS and len(content) >= MIN_COMPRESS_BYTES:
+            compressed = gzip.compress(content, compresslevel=9, mtime=0)
+            if len(compressed) < len(content):
+                self.variants['gzip'] = compressed
+            if brotli is not None:
+                compressed = brotli.compress(content, quality=11)
+                if len(compressed) < len(content):
+                    self.variants['br'] = compressed
+
+    def select_encoding(self, accept_encodings):
+        """
+        Pick the smallest variant the client accepts
+
+        Parameters:
+        -----------
+        accept_encodings : werkzeug.datastructures.Accept
+            Parsed Accept-Encoding header
+
+        Returns:
+        --------
+        str
+            'br', 'gzip' or 'identity'
+        """
+        for encoding in ('br', 'gzip'):
+            if encoding in self.variants and accept_encodings[encoding] > 0:
+                return encoding
+        return 'identity'
+
+    def etag(self, encoding):
+        """Strong ETag for one encoded variant"""
+        if encoding == 'identity':
+            return self.digest
+        return f"{self.digest}-{encoding}"
+
+def fingerprinted_name(path, digest):
+    """Insert a content hash before the file extension"""
+    root, extension = posixpath.splitext(path)
+    return f"{root}.{digest[:FINGERPRINT_LENGTH]}{extension}"
+
+class AssetManifest:
+    """All static assets of the web directory, keyed by request path"""
+
+    def __init__(self, web_dir):
+        self.web_dir = Path(web_dir)
+        self.assets = {}
+        self.fingerprints = {}
+        self.immutable = set()
+        self.build()
+
+    def build(self):
+        """Read, fingerprint and compress every file in the web directory"""
+        files = {}
+        for root, dirs, names in os.walk(self.web_dir):
+            dirs[:] = [d for d in dirs if not d.startswith('.')]
+            for name in names:
+                if name.startswith('.'):
+                    continue
+                full_path = Path(root) / name
+                files[full_path.relative_to(self.web_dir).as_posix()] = full_path.read_bytes()
+
+        # Fingerprint assets first so pages can reference the hashed names
+        for path, content in files.items():
+            if posixpath.splitext(path)[1].lower() in FINGERPRINT_EXTENSIONS:
+                asset = StaticAsset(path, content)
+                hashed_path = fingerprinted_name(path, asset.digest)
+                self.assets[path] = asset
+                self.assets[hashed_path] = asset
+                self.fingerprints[path] = hashed_path
+                self.immutable.add(hashed_path)
+
+        # Pages and other files are served under their own names
+        for path, content in files.items():
+            if path in self.assets:
+                continue
+            if path.endswith('.html'):
+                content = self.rewrite_references(path, content)
+            self.assets[path] = StaticAsset(path, content)
+
+    def rewrite_references(self, page_path, content):
+        """Point local src/href references in a page at fingerprinted asset names"""
+        page_dir = posixpath.dirname(page_path)
+
+        def replace(match):
+            reference = match.group(2)
+            target = posixpath.normpath(posixpath.join(page_dir, reference))
+            hashed_path = self.fingerprints.get(target)
+            if hashed_path is None:
+                return match.group(0)
+            hashed_reference = posixpath.join(posixpath.dirname(reference), posixpath.basename(hashed_path))
+            return match.group(1) + hashed_reference + match.group(3)
+
+        text = content.decode('utf-8')
+        return ASSET_REFERENCE.sub(replace, text).encode('utf-8')
+
+    def lookup(self, path):
+        """
+        Find the asset served at a request path
+
+        Returns:
+        --------
+        tuple
+            The StaticAsset (or None) and whether the path is fingerprinted
+        """
+        path = posixpath.normpath(path).lstrip('/')
+        return self.assets.get(path), path in self.immutable
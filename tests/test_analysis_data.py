@@ -0,0 +1,75 @@
+"""Tests for the preloaded, read-only analysis tables"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+from analysis_data import AnalysisData, ResultTable, ScoreMatrix
+
+@pytest.fixture
+def analysis_dir(tmp_path):
+    for name in ('differential_expression', 'pathway_analysis', 'pathway_activity', 'model_comparison'):
+        (tmp_path / name).mkdir()
+    pd.DataFrame({'log2FoldChange': [1.5, -0.2], 'pvalue': [1e-4, 0.6], 'significant': [True, False]},
+                 index=pd.Index(['TNF', 'IL10'], name='gene')).to_csv(
+        tmp_path / 'differential_expression' / 'il10ko_IL10KO_vs_WT_differential_expression.csv')
+    pd.DataFrame({'pathway': ['TNF signaling'], 'pvalue': [0.01], 'gene_count': [4]}).to_csv(
+        tmp_path / 'pathway_analysis' / 'il10ko_IL10KO_vs_WT_pathway_analysis.csv', index=False)
+    pd.DataFrame([[0.1, -0.3]], index=pd.Index(['TNF signaling'], name='pathway'), columns=['S1', 'S2']).to_csv(
+        tmp_path / 'pathway_activity' / 'il10ko_pathway_activity.csv')
+    pd.DataFrame({'model': ['il10ko'], 'overall_similarity_score': [0.7]}).to_csv(
+        tmp_path / 'model_comparison' / 'mouse_model_human_comparison.csv', index=False)
+    pd.DataFrame({'gene': ['TNF'], 'overall_target_score': [0.9]}).to_csv(
+        tmp_path / 'model_comparison' / 'potential_targets.csv', index=False)
+    return tmp_path
+
+def test_columns_are_typed_read_only_arrays():
+    table = ResultTable(pd.DataFrame({'score': [1, 2], 'flag': [True, False], 'name': ['a', None]},
+                                     index=pd.Index(['G1', 'G2'], name='gene')))
+    assert list(table.columns) == ['gene', 'score', 'flag', 'name']
+    assert table['score'].dtype == np.float64 and table['flag'].dtype == bool
+    # Text is fixed-width unicode, so the buffers hold no Python objects
+    assert table['gene'].dtype.kind == 'U' and table['name'].dtype.kind == 'U'
+    assert len(table) == 2 and 'score' in table and 'missing' not in table
+    for array in table.columns.values():
+        assert not array.flags.writeable
+        with pytest.raises(ValueError):
+            array[0] = array[1]
+
+def test_records_follow_the_requested_order():
+    table = ResultTable(pd.DataFrame({'model': ['a', 'b', 'c'], 'score': [0.1, 0.5, 0.3]}))
+    records = table.records(np.argsort(-table['score']))
+    assert [r['model'] for r in records] == ['b', 'c', 'a']
+    assert records[0] == {'model': 'b', 'score': 0.5} and type(records[0]['score']) is float
+    assert ResultTable(pd.DataFrame()).records() == [] and len(ResultTable(pd.DataFrame())) == 0
+
+def test_score_matrix_is_float32_and_read_only():
+    matrix = ScoreMatrix(pd.DataFrame([[1.0, 2.0]], index=['P1'], columns=['S1', 'S2']))
+    assert matrix.values.dtype == np.float32 and matrix.rows.tolist() == ['P1']
+    assert not any(a.flags.writeable for a in (matrix.rows, matrix.columns, matrix.values))
+
+def test_every_artifact_is_loaded(analysis_dir):
+    data = AnalysisData(analysis_dir)
+    table = data.differential_expression['il10ko_IL10KO_vs_WT']
+    assert table['gene'].tolist() == ['TNF', 'IL10'] and table['significant'].dtype == bool
+    assert data.pathway_analysis['il10ko_IL10KO_vs_WT']['gene_count'].tolist() == [4.0]
+    assert data.pathway_activity['il10ko'].columns.tolist() == ['S1', 'S2']
+    assert data.model_comparison['model'].tolist() == ['il10ko']
+    assert data.potential_targets['gene'].tolist() == ['TNF']
+
+def test_reload_swaps_tables_without_touching_held_arrays(analysis_dir):
+    data = AnalysisData(analysis_dir)
+    held = data.differential_expression['il10ko_IL10KO_vs_WT']['pvalue']
+    de_file = analysis_dir / 'differential_expression' / 'il10ko_IL10KO_vs_WT_differential_expression.csv'
+    pd.DataFrame({'log2FoldChange': [3.0], 'pvalue': [1e-9]}, index=pd.Index(['IL6'], name='gene')).to_csv(de_file)
+    (analysis_dir / 'model_comparison' / 'mouse_model_human_comparison.csv').unlink()
+
+    data.reload()
+    assert data.differential_expression['il10ko_IL10KO_vs_WT']['gene'].tolist() == ['IL6']
+    assert data.model_comparison is None
+    # A request still holding the old array keeps reading the old, unchanged values
+    assert held.tolist() == [1e-4, 0.6] and not held.flags.writeable
+
+def test_missing_directory_loads_nothing(tmp_path):
+    data = AnalysisData(tmp_path / 'absent')
+    assert data.differential_expression == {} and data.potential_targets is None
@@ -0,0 +1,53 @@
+"""Tests for the analysis file fingerprint that invalidates cached API responses"""
+
+import time
+from concurrent.futures import ThreadPoolExecutor
+
+import api_server
+
+def test_only_served_directories_change_the_version(tmp_path, monkeypatch):
+    monkeypatch.setattr(api_server, 'ANALYSIS_DIR', tmp_path)
+    version = api_server.analysis_files_version()
+
+    for directory in ('.stage_cache', 'figures', 'model_expression'):
+        (tmp_path / directory).mkdir()
+        (tmp_path / directory / 'file').write_text('x')
+    assert api_server.analysis_files_version() == version
+
+    (tmp_path / 'differential_expression').mkdir()
+    (tmp_path / 'differential_expression' / 'a_differential_expression.csv').write_text('x')
+    assert api_server.analysis_files_version() != version
+
+def test_file_removed_during_the_walk_is_skipped(tmp_path, monkeypatch):
+    monkeypatch.setattr(api_server, 'ANALYSIS_DIR', tmp_path)
+    (tmp_path / 'pathway_analysis').mkdir()
+    (tmp_path / 'pathway_analysis' / 'kept.csv').write_text('x')
+    walk = api_server.os.walk
+
+    def walk_with_vanished_file(top):
+        for root, dirs, files in walk(top):
+            yield root, dirs, files + ['.vanished.tmp']
+
+    monkeypatch.setattr(api_server.os, 'walk', walk_with_vanished_file)
+    with_vanished = api_server.analysis_files_version()
+    monkeypatch.setattr(api_server.os, 'walk', walk)
+    assert with_vanished == api_server.analysis_files_version()
+
+def test_concurrent_checks_reload_once(monkeypatch):
+    monkeypatch.setattr(api_server, 'analysis_state', dict(api_server.analysis_state, version='old', checked_at=0.0))
+    monkeypatch.setattr(api_server, 'analysis_files_version', lambda: 'new')
+    reloads, seen_during_reload = [], []
+
+    def slow_reload():
+        reloads.append(1)
+        seen_during_reload.append(api_server.analysis_state['version'])
+        time.sleep(0.05)
+
+    monkeypatch.setattr(api_server.expression_store, 'reload', slow_reload)
+    monkeypatch.setattr(api_server.analysis_data, 'reload', lambda: None)
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        versions = list(executor.map(lambda _: api_server.current_analysis_version(), range(8)))
+    assert len(reloads) == 1
+    assert seen_during_reload == ['old']
+    # Every caller waited for the reload rather than seeing the new version early or the old one late
+    assert versions == ['new'] * 8
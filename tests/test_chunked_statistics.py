@@ -0,0 +1,66 @@
+"""Tests for differential expression statistics computed in blocks"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_processing_pipeline as pipeline
+from data_processing_pipeline import (chunked_condition_statistics, chunked_statistics_stage, contrast_stage,
+                                      statistics_stage)
+from differential_expression import ConditionStatistics, WelfordAccumulator, stream_condition_statistics
+from expression_store import build_model_store
+
+CONDITIONS = np.array(['Control', 'DSS', 'Control', 'DSS', 'Control', 'DSS', 'Control', 'DSS', 'DSS'])
+
+@pytest.fixture
+def expression():
+    rng = np.random.default_rng(0)
+    values = rng.lognormal(3, 1, size=(40, len(CONDITIONS)))
+    values[:20, CONDITIONS == 'DSS'] *= 3
+    return pd.DataFrame(values, index=[f"Gene_{i}" for i in range(40)],
+                        columns=[f"Sample_{j}" for j in range(len(CONDITIONS))])
+
+@pytest.fixture
+def metadata(expression):
+    return pd.DataFrame({'condition': CONDITIONS}, index=expression.columns)
+
+def assert_same_statistics(actual, expected):
+    assert actual.conditions == expected.conditions
+    np.testing.assert_allclose(actual.counts, expected.counts)
+    for name in ('sums', 'sums_sq', 'base_sums'):
+        np.testing.assert_allclose(getattr(actual, name), getattr(expected, name), rtol=1e-10)
+
+@pytest.mark.parametrize('block', [1, 2, 4, 9])
+def test_welford_merge_matches_one_pass(expression, block):
+    values = expression.to_numpy()
+    accumulator = WelfordAccumulator(len(values), ['Control', 'DSS'])
+    for start in range(0, values.shape[1], block):
+        accumulator.update(values[:, start:start + block], CONDITIONS[start:start + block])
+    assert_same_statistics(accumulator.statistics(), ConditionStatistics.from_matrix(values, CONDITIONS))
+
+@pytest.mark.parametrize('memory_limit', [1, 32 * 9 * 3, 1 << 30])
+def test_streamed_statistics_match_in_memory(expression, memory_limit):
+    # A limit below one row's working copies switches from gene blocks to Welford sample blocks
+    values = expression.to_numpy()
+    statistics = stream_condition_statistics(values, CONDITIONS, memory_limit=memory_limit)
+    assert_same_statistics(statistics, ConditionStatistics.from_matrix(values, CONDITIONS))
+
+def test_chunked_csv_analysis_matches_in_memory(tmp_path, monkeypatch, expression, metadata):
+    (tmp_path / 'differential_expression').mkdir()
+    monkeypatch.setattr(pipeline, 'ANALYSIS_DIR', tmp_path)
+    expression_file = tmp_path / 'model_expression.csv'
+    expression.to_csv(expression_file)
+    chunked = contrast_stage({'statistics:m': chunked_statistics_stage({'load:m': (expression_file, metadata)}, 200)},
+                             'chunked', 'Control', 'DSS')
+    in_memory = contrast_stage({'statistics:m': statistics_stage({'load:m': (expression, metadata)})},
+                               'in_memory', 'Control', 'DSS')
+    pd.testing.assert_frame_equal(chunked, in_memory, rtol=1e-10)
+    assert (tmp_path / 'differential_expression' / 'chunked_DSS_vs_Control_differential_expression.csv').exists()
+
+def test_store_backed_statistics_keep_original_identifiers(tmp_path, expression, metadata):
+    model_dir = build_model_store(expression, tmp_path / 'store', 'model')
+    genes, statistics = chunked_condition_statistics(model_dir, metadata, memory_limit=1)
+    assert sorted(genes) == sorted(expression.index)
+    # The store holds float32 values
+    expected = ConditionStatistics.from_matrix(expression.loc[genes].to_numpy(dtype=np.float32), CONDITIONS)
+    np.testing.assert_allclose(statistics.sums, expected.sums, rtol=1e-6)
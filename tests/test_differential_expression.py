@@ -0,0 +1,106 @@
+"""Tests for moderated and Welch t statistics from per-condition sufficient statistics"""
+
+import numpy as np
+import pytest
+from scipy import stats
+from scipy.special import polygamma
+
+from differential_expression import (ConditionStatistics, all_pairs, contrast_tests, fit_variance_prior,
+                                     log_expression, squeeze_variances, trigamma_inverse)
+
+CONDITIONS = np.array(['A'] * 4 + ['B'] * 5 + ['C'] * 3)
+
+@pytest.fixture
+def values():
+    rng = np.random.default_rng(7)
+    sigma = rng.uniform(0.1, 0.8, size=(300, 1))  # Genes differ in variance, so the prior df is finite
+    values = np.exp(rng.normal(4, sigma, size=(300, len(CONDITIONS))))
+    values[:30, CONDITIONS == 'B'] *= 3
+    return values
+
+@pytest.mark.parametrize('x', [1e-4, 0.05, 0.5, 2.0, 40.0, 1e5])
+def test_trigamma_inverse(x):
+    assert polygamma(1, trigamma_inverse(x)) == pytest.approx(x, rel=1e-6)
+
+def test_variance_prior_recovers_simulated_prior():
+    # s^2 ~ s0^2 * d0 / chi2(d0) a priori, then s^2 | sigma^2 ~ sigma^2 * chi2(df) / df
+    rng = np.random.default_rng(0)
+    d0, s0_sq, df = 8.0, 0.5, 4.0
+    sigma_sq = s0_sq * d0 / rng.chisquare(d0, 50000)
+    variances = sigma_sq * rng.chisquare(df, 50000) / df
+    d0_hat, s0_sq_hat = fit_variance_prior(variances, df)
+    assert d0_hat == pytest.approx(d0, rel=0.1)
+    assert s0_sq_hat == pytest.approx(s0_sq, rel=0.03)
+
+def test_variance_prior_without_excess_spread():
+    # Variances that spread less than chi-square noise would give an infinite prior df
+    variances = np.full(100, 0.7)
+    d0, s0_sq = fit_variance_prior(variances, 6)
+    assert np.isinf(d0)
+    posterior, posterior_df, _ = squeeze_variances(variances, 6)
+    assert np.all(posterior == s0_sq) and np.all(np.isinf(posterior_df))
+
+def test_sufficient_statistics_match_direct_moments(values):
+    statistics = ConditionStatistics.from_matrix(values, CONDITIONS)
+    logged = log_expression(values)
+    for condition in ('A', 'B', 'C'):
+        column = statistics.index[condition]
+        group = logged[:, CONDITIONS == condition]
+        np.testing.assert_allclose(statistics.means()[:, column], group.mean(axis=1), rtol=1e-12)
+        np.testing.assert_allclose(statistics.variances()[:, column], group.var(axis=1, ddof=1), rtol=1e-9)
+
+@pytest.mark.parametrize('reference, compared', all_pairs(['A', 'B', 'C']))
+def test_welch_matches_scipy(values, reference, compared):
+    test = contrast_tests(ConditionStatistics.from_matrix(values, CONDITIONS), [(reference, compared)],
+                          method='welch')[(reference, compared)]
+    logged = log_expression(values)
+    expected = stats.ttest_ind(logged[:, CONDITIONS == compared], logged[:, CONDITIONS == reference],
+                               axis=1, equal_var=False)
+    np.testing.assert_allclose(test['stat'], expected.statistic, rtol=1e-9)
+    np.testing.assert_allclose(test['pvalue'], expected.pvalue, rtol=1e-8)
+
+def test_moderated_t_matches_a_per_gene_reference(values):
+    tests = contrast_tests(ConditionStatistics.from_matrix(values, CONDITIONS), all_pairs(['A', 'B', 'C']))
+    logged = log_expression(values)
+    groups = {c: logged[:, CONDITIONS == c] for c in ('A', 'B', 'C')}
+
+    # One-way ANOVA residual variance, shrunk with the fitted prior (limma's eBayes)
+    residual_df = len(CONDITIONS) - 3
+    residual = sum(((g - g.mean(axis=1, keepdims=True)) ** 2).sum(axis=1) for g in groups.values()) / residual_df
+    d0, s0_sq = fit_variance_prior(residual, residual_df)
+    assert np.isfinite(d0)
+    posterior = (d0 * s0_sq + residual_df * residual) / (d0 + residual_df)
+
+    for (reference, compared), test in tests.items():
+        difference = groups[compared].mean(axis=1) - groups[reference].mean(axis=1)
+        se = np.sqrt(posterior * (1 / groups[compared].shape[1] + 1 / groups[reference].shape[1]))
+        expected_p = 2 * stats.t.sf(np.abs(difference / se), d0 + residual_df)
+        np.testing.assert_allclose(test['log2FoldChange'], difference, rtol=1e-10)
+        np.testing.assert_allclose(test['stat'], difference / se, rtol=1e-9)
+        np.testing.assert_allclose(test['pvalue'], expected_p, rtol=1e-8)
+    significant = tests[('A', 'B')]['padj'] < 0.05
+    assert significant[:30].mean() > 0.5 and significant[30:].mean() < 0.05
+
+def test_contrasts_from_block_statistics_match_one_pass(values):
+    # Statistics of gene blocks are exact, so concatenating them changes nothing
+    whole = ConditionStatistics.from_matrix(values, CONDITIONS)
+    blocks = ConditionStatistics.concatenate([ConditionStatistics.from_matrix(values[i:i + 64], CONDITIONS)
+                                              for i in range(0, len(values), 64)])
+    for method in ('moderated', 'welch'):
+        expected, actual = contrast_tests(whole, [('A', 'C')], method), contrast_tests(blocks, [('A', 'C')], method)
+        for key in ('log2FoldChange', 'stat', 'pvalue', 'padj', 'baseMean'):
+            np.testing.assert_allclose(actual[('A', 'C')][key], expected[('A', 'C')][key], rtol=1e-10)
+
+def test_constant_genes_are_untestable(values):
+    values = values.copy()
+    values[0] = 0.0
+    test = contrast_tests(ConditionStatistics.from_matrix(values, CONDITIONS), [('A', 'B')], 'welch')[('A', 'B')]
+    assert np.isnan(test['stat'][0]) and np.isnan(test['pvalue'][0]) and np.isnan(test['padj'][0])
+    assert not np.isnan(test['padj'][1:]).any()
+
+def test_invalid_contrasts_are_rejected(values):
+    statistics = ConditionStatistics.from_matrix(values[:, :10], CONDITIONS[:10])  # One C sample
+    with pytest.raises(ValueError, match='at least 2 samples'):
+        contrast_tests(statistics, [('A', 'C')])
+    with pytest.raises(ValueError, match='Unknown'):
+        contrast_tests(statistics, [('A', 'B')], method='wilcoxon')
@@ -0,0 +1,151 @@
+"""Tests for the enrichment module"""
+
+import math
+
+import numpy as np
+import pandas as pd
+import pytest
+from scipy import stats
+
+from enrichment import benjamini_hochberg, gsea, hypergeom_log_sf, over_representation, ssgsea
+from gene_sets import GeneSetCollection, load_gene_sets
+
+def test_gsea_without_overlapping_genes():
+    # The pipeline's simulated Gene_i symbols are in no gene set
+    ranking = pd.Series(np.linspace(3, -3, 200), index=[f"Gene_{i}" for i in range(200)])
+    results = gsea(load_gene_sets(None), ranking, n_permutations=20, workers=1)
+    assert results.empty
+    assert list(results.columns) == ['pathway', 'enrichment_score', 'nes', 'pvalue', 'set_size', 'padj']
+
+def test_gsea_with_partial_overlap():
+    collection = GeneSetCollection([('A', '', [f"G{i}" for i in range(20)]),
+                                    ('B', '', ['X1', 'X2'])])
+    ranking = pd.Series(np.linspace(3, -3, 100), index=[f"G{i}" for i in range(100)])
+    results = gsea(collection, ranking, n_permutations=50, workers=1, min_size=15)
+    assert results['pathway'].tolist() == ['A']
+    assert results['enrichment_score'].iloc[0] > 0
+
+def brute_force_score(ranking, members, weight=1.0):
+    # Walk the ranked list one gene at a time, as in Subramanian et al. (2005)
+    hits = np.isin(ranking.index, members)
+    weights = np.abs(ranking.to_numpy()) ** weight
+    step = np.where(hits, weights / weights[hits].sum(), -1.0 / (len(ranking) - hits.sum()))
+    walk = np.cumsum(step)
+    return walk.max() if walk.max() >= -walk.min() else walk.min()
+
+def brute_force_ssgsea(members, column, alpha):
+    # GSVA's ssgsea: sum over ranks of the weighted hit CDF minus the miss CDF
+    ordered = column.sort_values(ascending=False, kind='stable')
+    ranks = np.arange(len(ordered), 0, -1, dtype=np.float64)
+    hits = np.isin(ordered.index, members)
+    hit_cdf = np.cumsum(np.where(hits, ranks ** alpha, 0.0)) / (ranks[hits] ** alpha).sum()
+    miss_cdf = np.cumsum(~hits) / (~hits).sum()
+    return (hit_cdf - miss_cdf).sum()
+
+def log_sf_exact(k, population, set_size, draws):
+    # Exact integer arithmetic, so even tails far below float range are reference values
+    tail = sum(math.comb(set_size, x) * math.comb(population - set_size, draws - x)
+               for x in range(k, min(set_size, draws) + 1))
+    return (math.log(tail) if tail else -math.inf) - math.log(math.comb(population, draws))
+
+@pytest.fixture
+def random_sets():
+    rng = np.random.default_rng(11)
+    genes = [f"G{i}" for i in range(400)]
+    sets = [(f"SET{i}", '', list(rng.choice(genes, size=rng.integers(15, 60), replace=False)))
+            for i in range(12)]
+    sets.append(('UP', '', genes[:30]))  # Concentrated at the top of the ranking
+    return genes, GeneSetCollection(sets)
+
+@pytest.mark.parametrize('k, population, set_size, draws', [
+    (0, 100, 10, 20), (3, 100, 10, 20), (10, 100, 10, 20), (11, 100, 10, 20),
+    (45, 20000, 50, 400), (200, 20000, 300, 250), (1, 20000, 5, 3), (150, 5000, 200, 600)
+])
+def test_hypergeom_log_sf_matches_exact_tail(k, population, set_size, draws):
+    log_sf = hypergeom_log_sf(np.array([k]), population, np.array([set_size]), draws)[0]
+    expected = log_sf_exact(k, population, set_size, draws)
+    if np.isinf(expected):
+        assert log_sf == expected
+    else:
+        assert log_sf == pytest.approx(expected, rel=1e-9, abs=1e-12)
+    if expected > -700:
+        assert np.exp(log_sf) == pytest.approx(stats.hypergeom.sf(k - 1, population, set_size, draws), rel=1e-8)
+
+def test_hypergeom_log_sf_chunks_agree():
+    rng = np.random.default_rng(5)
+    set_sizes = rng.integers(5, 500, 300)
+    overlap = rng.integers(0, 60, 300)
+    together = hypergeom_log_sf(overlap, 10000, set_sizes, 800)
+    chunked = hypergeom_log_sf(overlap, 10000, set_sizes, 800, chunk_size=7)
+    # Rows of a chunk keep summing until all are done, which only adds negligible terms
+    np.testing.assert_allclose(together, chunked, rtol=1e-10)
+    np.testing.assert_allclose(np.exp(together), stats.hypergeom.sf(overlap - 1, 10000, set_sizes, 800),
+                               rtol=1e-7, atol=1e-300)
+
+def test_benjamini_hochberg_matches_a_step_up_loop():
+    rng = np.random.default_rng(2)
+    pvalues = np.concatenate([rng.uniform(0, 1e-3, 20), rng.uniform(0, 1, 80), [0.5, 0.5, 1.0]])
+    rng.shuffle(pvalues)
+    n = len(pvalues)
+    expected = np.empty(n)
+    for i, p in enumerate(pvalues):
+        # padj_i = min over every p_j >= p_i of p_j * n / rank_j
+        ranks = np.array([(pvalues <= q).sum() for q in pvalues])
+        expected[i] = min(1.0, min(pvalues[j] * n / ranks[j] for j in range(n) if pvalues[j] >= p))
+    np.testing.assert_allclose(benjamini_hochberg(pvalues), expected, rtol=1e-12)
+    np.testing.assert_allclose(benjamini_hochberg(np.log(pvalues), log=True), np.log(expected), rtol=1e-10)
+
+def test_benjamini_hochberg_ignores_nan():
+    pvalues = np.array([0.01, np.nan, 0.04, 0.03, np.nan])
+    adjusted = benjamini_hochberg(pvalues)
+    assert np.isnan(adjusted[[1, 4]]).all()
+    np.testing.assert_allclose(adjusted[[0, 2, 3]], benjamini_hochberg(pvalues[[0, 2, 3]]))
+    assert np.isnan(benjamini_hochberg(np.full(3, np.nan))).all()
+
+def test_over_representation_matches_scipy(random_sets):
+    genes, collection = random_sets
+    query = genes[:25] + genes[200:215]
+    results = over_representation(collection, query, genes, min_size=5).set_index('pathway')
+
+    # The universe is restricted to genes in some set
+    universe = {g for name in collection.names for g in collection.members(name)} & set(genes)
+    drawn = set(query) & universe
+    for name, row in results.iterrows():
+        members = set(collection.members(name)) & universe
+        overlap = len(members & drawn)
+        assert row['gene_count'] == overlap and row['set_size'] == len(members)
+        expected = stats.hypergeom.sf(overlap - 1, len(universe), len(members), len(drawn))
+        assert row['pvalue'] == pytest.approx(expected, rel=1e-8)
+    assert results.index[0] == 'UP'
+
+def test_gsea_scores_match_a_running_sum_walk(random_sets):
+    genes, collection = random_sets
+    rng = np.random.default_rng(4)
+    ranking = pd.Series(np.sort(rng.normal(size=len(genes)))[::-1] + rng.normal(0, 0.01, len(genes)), index=genes)
+    ranking = ranking.sort_values(ascending=False)
+    for weight in (0.0, 1.0):
+        results = gsea(collection, ranking, n_permutations=100, workers=1, weight=weight).set_index('pathway')
+        for name, row in results.iterrows():
+            assert row['enrichment_score'] == pytest.approx(
+                brute_force_score(ranking, collection.members(name), weight), abs=1e-12)
+    assert results.loc['UP', 'enrichment_score'] > 0.8
+
+def test_gsea_is_independent_of_worker_count(random_sets):
+    genes, collection = random_sets
+    ranking = pd.Series(np.linspace(2, -2, len(genes)), index=genes)
+    serial = gsea(collection, ranking, n_permutations=300, batch_size=50, workers=1)
+    parallel = gsea(collection, ranking, n_permutations=300, batch_size=50, workers=2)
+    pd.testing.assert_frame_equal(serial, parallel)
+    assert (serial['pvalue'] >= 1 / 301).all()
+
+def test_ssgsea_matches_a_per_sample_walk(random_sets):
+    genes, collection = random_sets
+    rng = np.random.default_rng(9)
+    expression = pd.DataFrame(rng.normal(size=(len(genes), 7)), index=genes, columns=[f"S{i}" for i in range(7)])
+    scores = ssgsea(collection, expression, chunk_size=3, normalize=False)
+    for name in scores.index:
+        for sample in expression.columns:
+            assert scores.loc[name, sample] == pytest.approx(
+                brute_force_ssgsea(collection.members(name), expression[sample], 0.25), rel=1e-9)
+    normalized = ssgsea(collection, expression)
+    np.testing.assert_allclose(normalized, scores / (scores.values.max() - scores.values.min()))
@@ -0,0 +1,41 @@
+"""Tests for the versioned memory-mapped expression store"""
+
+import numpy as np
+import pandas as pd
+
+from data_processing_pipeline import API_MODELS, build_stages
+from expression_store import ExpressionStore, ModelMatrix, build_model_store
+
+def expression(scale):
+    return pd.DataFrame(np.arange(12, dtype=float).reshape(4, 3) * scale,
+                        index=['Il1b', 'Tnf', ' il6', 'Foxp3'], columns=['S1', 'S2', 'S3'])
+
+def test_rebuild_swaps_whole_versions(tmp_path):
+    model_dir = build_model_store(expression(1), tmp_path, 'acute_dss')
+    before = ModelMatrix(model_dir)
+    build_model_store(expression(10), tmp_path, 'acute_dss')
+    after = ModelMatrix(model_dir)
+
+    # A reader opened before the rebuild keeps a consistent view of the old version
+    rows, found = before.rows(['TNF'])
+    assert found.all() and rows.tolist() == [[3, 4, 5]]
+    rows, _ = after.rows(['TNF'])
+    assert rows.tolist() == [[30, 40, 50]]
+    assert list(after.labels) == ['Foxp3', 'Il1b', ' il6', 'Tnf']
+    assert model_dir.is_symlink()
+    assert len([p for p in tmp_path.iterdir() if p.is_dir() and not p.is_symlink()]) == 1
+
+def test_unversioned_store_is_replaced(tmp_path):
+    (tmp_path / 'il10ko').mkdir()
+    (tmp_path / 'il10ko' / 'matrix.npy').write_bytes(b'stale')
+    build_model_store(expression(1), tmp_path, 'il10ko')
+    store = ExpressionStore(tmp_path)
+    assert list(store.models) == ['il10ko']
+    assert store.summarize(['foxp3'], 'il10ko')[0].tolist() == ['foxp3']
+
+def test_every_api_model_is_exported():
+    import api_server
+    assert set(API_MODELS) == set(api_server.MODEL_NAMES)
+    stages = build_stages()
+    assert {name.split(':')[1] for name in stages if name.startswith('export:')} == set(API_MODELS)
+    assert stages['export:human_cd'].dependencies == ['load:human_ibd']
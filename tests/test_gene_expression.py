@@ -0,0 +1,42 @@
+"""Tests for simulated and streamed gene expression"""
+
+import json
+
+import numpy as np
+import pytest
+
+import api_server
+from api_server import simulate_gene_expression_data
+
+GENES = [f"GENE{i}" for i in range(600)]
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(api_server.expression_store, 'models', {})  # Every model is simulated
+    return api_server.app.test_client()
+
+def test_simulated_values_depend_only_on_model_and_gene():
+    together = simulate_gene_expression_data(GENES, ['il10ko', 'human_uc'])['models']
+    alone = simulate_gene_expression_data(['GENE7'], ['il10ko'])['models']['il10ko']
+    assert together['il10ko']['values']['GENE7'] == alone['values']['GENE7']
+    assert together['il10ko']['errors']['GENE7'] == alone['errors']['GENE7']
+    assert together['il10ko']['values']['GENE7'] != together['human_uc']['values']['GENE7']
+    assert simulate_gene_expression_data(['gene7 '], ['il10ko'])['models']['il10ko']['values']['gene7 '] == \
+        alone['values']['GENE7']
+
+def test_simulated_values_follow_the_model_distribution():
+    model = simulate_gene_expression_data([f"G{i}" for i in range(20000)], ['il10ko'])['models']['il10ko']
+    values = np.array(list(model['values'].values()))
+    errors = np.array(list(model['errors'].values()))
+    assert abs(values.mean() - 8.0) < 0.05 and abs(values.std() - 1.0) < 0.05
+    assert errors.min() >= 0.2 and errors.max() <= 1.0 and abs(errors.mean() - 0.6) < 0.01
+
+def test_stream_blocks_do_not_change_values(client):
+    assert len(GENES) > 2 * api_server.STREAM_BLOCK_SIZE
+    response = client.post('/api/gene_expression', json={'genes': GENES, 'models': ['cd45rb']})
+    rows = [json.loads(line) for line in response.get_data(as_text=True).splitlines()]
+    expected = simulate_gene_expression_data(GENES, ['cd45rb'])['models']['cd45rb']
+    assert [row['gene'] for row in rows] == GENES
+    assert all(row['values']['cd45rb'] == expected['values'][row['gene']] for row in rows)
+    # Blocks used to be re-seeded alike, repeating the same values every STREAM_BLOCK_SIZE genes
+    assert rows[0]['values'] != rows[api_server.STREAM_BLOCK_SIZE]['values']
@@ -0,0 +1,79 @@
+"""Tests for gene symbol search"""
+
+import random
+
+import pytest
+
+import api_server
+from gene_search import GeneSearchIndex, build_gene_search_index, levenshtein
+
+GENES = ['IL1B', 'IL1A', 'IL10', 'IL17A', 'TNF', 'FOXP3', 'STAT3', 'STAT1']
+
+@pytest.fixture
+def client():
+    return api_server.app.test_client()
+
+def test_builder_creates_the_fuzzy_index_up_front():
+    assert build_gene_search_index(GENES)._deletion_index is not None
+
+def test_fuzzy_search_matches_brute_force():
+    index = build_gene_search_index(GENES)
+    for query in ('IL1', 'STAT', 'FOXP', 'TNFF', 'IL71A'):
+        expected = sorted((levenshtein(query, gene), gene) for gene in GENES if levenshtein(query, gene) <= 2)
+        assert sorted((d, g) for g, d in index.fuzzy_search(query, limit=len(GENES))) == expected
+
+def test_search_ranks_exact_then_prefix_then_substring():
+    index = build_gene_search_index(GENES)
+    assert index.search('IL1', limit=3) == ['IL10', 'IL17A', 'IL1A']
+    assert index.search('AT') == ['STAT1', 'STAT3']
+
+@pytest.fixture
+def vocabulary():
+    rng = random.Random(3)
+    return sorted({''.join(rng.choices('ABCIL1237', k=rng.randint(2, 7))) for _ in range(2000)})
+
+@pytest.mark.parametrize('query', ['A', 'IL', 'IL1', 'B12', 'CAL7', 'LIL12', 'ZZZ', 'ABCABCA'])
+def test_prefix_and_ngram_lookups_match_brute_force(vocabulary, query):
+    index = GeneSearchIndex(vocabulary)
+    start, stop = index.prefix_range(query)
+    assert index.keys[start:stop] == [key for key in vocabulary if key.startswith(query)]
+    assert [index.keys[i] for i in index.substring_ids(query)] == [key for key in vocabulary if query in key]
+
+def test_search_orders_matches_by_kind(vocabulary):
+    index = GeneSearchIndex(vocabulary)
+    for query in ('IL', 'C7', 'L12'):
+        results = index.search(query, limit=len(vocabulary))
+        prefixes = [key for key in vocabulary if key.startswith(query)]
+        substrings = [key for key in vocabulary if query in key and not key.startswith(query)]
+        assert results == prefixes + substrings
+        assert index.search(query, limit=5) == results[:5]
+
+def test_aliases_resolve_to_their_symbols(tmp_path):
+    (tmp_path / 'human.gene_info').write_text(
+        'GeneID\tSymbol\tSynonyms\n'
+        '3553\tIL1B\tIL-1|IL1F2\n'
+        '7124\tTNF\tTNFA|DIF\n'
+        '3552\tIL1A\tIL-1|IL1F1\n'
+        '0\t\tORPHAN\n'
+        '50943\tFOXP3\t-\n'
+    )
+    index = build_gene_search_index(['STAT3'], annotation_dir=tmp_path)
+    # An alias shared by two genes returns both, and lower case queries are normalized
+    assert index.search('il-1') == ['IL1B', 'IL1A']
+    assert index.search('tnfa') == ['TNF']
+    assert index.search('F1') == ['IL1A']
+    assert index.search('ORPHAN') == []
+    assert index.symbol_count == 5
+    # An empty query matches every key as a prefix, in key order (DIF, FOXP3, IL-1, ...)
+    assert index.search('', limit=3) == ['TNF', 'FOXP3', 'IL1B']
+
+@pytest.mark.parametrize('limit', ['0', '-1', 'ten', str(api_server.MAX_SEARCH_RESULTS + 1)])
+def test_search_rejects_invalid_limits(client, limit):
+    response = client.get(f"/api/search_gene?query=IL&limit={limit}")
+    assert response.status_code == 400
+    assert 'limit' in response.get_json()['error']
+
+def test_search_respects_limit(client):
+    response = client.get('/api/search_gene?query=IL&limit=2')
+    assert response.status_code == 200
+    assert len(response.get_json()['results']) == 2
@@ -0,0 +1,136 @@
+"""Tests for knockout propagation and the /api/knockout endpoint"""
+
+import json
+import numpy as np
+import pytest
+
+from knockout_engine import DEFAULT_NETWORK, RegulatoryNetwork
+
+def dense_propagation(network, knockout, damping=0.5, iterations=100):
+    """Gene-by-gene fixed-point iteration on a dense adjacency matrix"""
+    n = len(network.genes)
+    adjacency = np.zeros((n, n))
+    for regulator, edges in DEFAULT_NETWORK.items():
+        for relation, sign in (('activates', 1.0), ('represses', -1.0)):
+            for target in edges.get(relation, []):
+                adjacency[network.index[target], network.index[regulator]] += sign
+    in_weight = np.abs(adjacency).sum(axis=1)
+    adjacency /= np.where(in_weight > 0, in_weight, 1.0)[:, None]
+
+    clamped = [network.index[g] for g in knockout]
+    effects = np.zeros(n)
+    effects[clamped] = -1.0
+    for _ in range(iterations):
+        updated = np.zeros(n)
+        for i in range(n):
+            updated[i] = min(1.0, max(-1.0, damping * adjacency[i] @ effects))
+        updated[clamped] = -1.0
+        effects = updated
+    return effects
+
+@pytest.fixture(scope='module')
+def network():
+    return RegulatoryNetwork.from_relationships(DEFAULT_NETWORK)
+
+def test_propagation_matches_dense_reference(network):
+    knockouts = [['NFKB1'], ['TNF', 'IL6'], [network.regulators[-1]]]
+    effects, _, converged = network.propagate(knockouts, tolerance=1e-12, max_iterations=500)
+    assert converged
+    for j, knockout in enumerate(knockouts):
+        np.testing.assert_allclose(effects[:, j], dense_propagation(network, knockout, iterations=500), atol=1e-9)
+
+def test_knocked_out_genes_stay_clamped(network):
+    effects, _, _ = network.propagate([['NFKB1', 'TNF']])
+    assert effects[network.index['NFKB1'], 0] == -1.0
+    assert effects[network.index['TNF'], 0] == -1.0
+    assert np.all(np.abs(effects) <= 1.0)
+
+def test_unknown_genes_are_reported(network):
+    effects, _, _ = network.propagate([['NOT_A_GENE']])
+    summary = network.summarize(effects, [['NOT_A_GENE']])
+    assert summary[0]['unknown_genes'] == ['NOT_A_GENE']
+    assert summary[0]['effects'] == []
+
+@pytest.fixture(scope='module')
+def client():
+    import api_server
+    return api_server.app.test_client()
+
+@pytest.mark.parametrize('body', [
+    {'knockouts': [5]},
+    {'knockouts': 'TNF'},
+    {'knockouts': [['TNF', 3]]},
+    {'knockouts': ['TNF'], 'top': 'x'},
+    {'knockouts': ['TNF'], 'top': -1},
+    {'knockouts': ['TNF'], 'top': True},
+    {'knockouts': []},
+])
+def test_knockout_rejects_invalid_input(client, body):
+    response = client.post('/api/knockout', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+def test_knockout_get_rejects_invalid_top(client):
+    assert client.get('/api/knockout?genes=TNF&top=0').status_code == 400
+
+def test_knockout_batch(client):
+    response = client.post('/api/knockout', json={'knockouts': ['TNF', ['IL6', 'NFKB1']], 'top': 3})
+    assert response.status_code == 200
+    results = response.get_json()['results']
+    assert [r['knockout'] for r in results] == [['TNF'], ['IL6', 'NFKB1']]
+    assert all(len(r['effects']) <= 3 for r in results)
+
+def test_screen_rejects_invalid_parameters(network):
+    from knockout_screen import KnockoutScreen
+    with pytest.raises(ValueError):
+        KnockoutScreen(network, size=2, top=-1)
+    with pytest.raises(ValueError):
+        KnockoutScreen(network, size=0)
+
+def test_screen_deduplicates_candidates(network):
+    from knockout_screen import KnockoutScreen
+    screen = KnockoutScreen(network, size=2, candidates=['NFKB1', 'TNF', 'NFKB1'], workers=1)
+    assert screen.candidates == ['NFKB1', 'TNF']
+    assert screen.total_combinations == 1
+
+def screen_results(network, **kwargs):
+    # Driven the way the API and CLI drive it: consume the progress, then rank
+    from knockout_screen import KnockoutScreen
+    screen = KnockoutScreen(network, **kwargs)
+    progress = list(screen.run())
+    assert progress[-1] == (screen.total_blocks, screen.total_blocks)
+    return screen.results()
+
+def test_screen_matches_with_shared_pool(network):
+    from knockout_screen import screen_executor
+    candidates = network.regulators[:12]
+    serial = screen_results(network, size=2, candidates=candidates, top=5, workers=1, block_size=7)
+    executor = screen_executor(network, 2)
+    try:
+        for _ in range(2):
+            pooled = screen_results(network, size=2, candidates=candidates, top=5, workers=2, block_size=7,
+                                    executor=executor)
+            assert [r['knockout'] for r in pooled] == [r['knockout'] for r in serial]
+            np.testing.assert_allclose([r['score'] for r in pooled], [r['score'] for r in serial])
+    finally:
+        executor.shutdown()
+
+@pytest.mark.parametrize('body', [
+    {'top': -1},
+    {'top': 0},
+    {'size': 0},
+    {'size': 'x'},
+    {'targets': 'TNF'},
+    {'candidates': [1, 2]},
+])
+def test_screen_endpoint_rejects_invalid_input(client, body):
+    response = client.post('/api/knockout_screen', json=body)
+    assert response.status_code == 400
+    assert 'error' in response.get_json()
+
+def test_screen_endpoint_streams_results(client):
+    response = client.post('/api/knockout_screen', json={'size': 1, 'top': 3})
+    assert response.status_code == 200
+    lines = [line for line in response.get_data(as_text=True).splitlines() if line]
+    results = [json.loads(line) for line in lines if '"rank"' in line]
+    assert [r['rank'] for r in results] == [1, 2, 3]
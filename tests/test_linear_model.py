@@ -0,0 +1,73 @@
+"""Tests for covariate-adjusted differential expression with a linear model"""
+
+import numpy as np
+import pandas as pd
+import pytest
+
+import data_processing_pipeline as pipeline
+from differential_expression import LinearModelFit, contrast_tests, design_matrix, log_expression
+
+CONDITIONS = ['Control', 'UC', 'CD']
+
+@pytest.fixture
+def dataset():
+    rng = np.random.default_rng(1)
+    conditions = np.repeat(CONDITIONS, 6)
+    batch = np.tile(['Batch1', 'Batch1', 'Batch1', 'Batch1', 'Batch2', 'Batch2'], 3)
+    batch[6:10] = 'Batch2'  # UC is mostly Batch2, so batch and condition are correlated
+    metadata = pd.DataFrame({'condition': conditions, 'batch': batch, 'sex': rng.choice(['F', 'M'], 18)},
+                            index=[f"Sample_{i}" for i in range(18)])
+    values = rng.lognormal(3, 0.3, size=(50, 18))
+    values[:, batch == 'Batch2'] *= 4  # batch effect on every gene, no condition effect on genes 10+
+    values[:10, conditions == 'UC'] *= 2
+    expression = pd.DataFrame(values, index=[f"Gene_{i}" for i in range(50)], columns=metadata.index)
+    return expression, metadata
+
+@pytest.fixture
+def analysis_dir(tmp_path, monkeypatch):
+    (tmp_path / 'differential_expression').mkdir()
+    monkeypatch.setattr(pipeline, 'ANALYSIS_DIR', tmp_path)
+    return tmp_path
+
+def test_qr_fit_matches_least_squares(dataset):
+    expression, metadata = dataset
+    design = design_matrix(metadata, factors=['condition', 'batch', 'sex'])
+    values = log_expression(expression.to_numpy())
+    fit = LinearModelFit(values, design)
+    coefficients, residuals, _, _ = np.linalg.lstsq(design.to_numpy(), values.T, rcond=None)
+    np.testing.assert_allclose(fit.coefficients, coefficients.T, atol=1e-10)
+    np.testing.assert_allclose(fit.residual_variance, residuals / fit.df, rtol=1e-8)
+
+def test_rank_deficient_design_is_rejected(dataset):
+    expression, metadata = dataset
+    metadata = metadata.assign(copy=metadata['condition'])
+    with pytest.raises(ValueError, match='full rank'):
+        LinearModelFit(log_expression(expression.to_numpy()), design_matrix(metadata, factors=['condition', 'copy']))
+
+@pytest.mark.parametrize('reference, compared', [('Control', 'UC'), ('Control', 'CD'), ('UC', 'CD')])
+def test_condition_only_design_matches_two_group_contrast(dataset, analysis_dir, reference, compared):
+    expression, metadata = dataset
+    inputs = {'load:m': (expression, metadata)}
+    statistics = {'statistics:m': pipeline.statistics_stage(inputs)}
+    design = {'design:m': pipeline.design_stage(inputs, [], 'Control')}
+    expected = pipeline.contrast_stage(statistics, 'm', reference, compared)
+    actual = pipeline.design_contrast_stage(design, 'm', reference, compared)
+    pd.testing.assert_frame_equal(actual, expected.loc[actual.index], rtol=1e-8)
+
+def test_covariates_remove_a_confounded_batch_effect(dataset, analysis_dir):
+    expression, metadata = dataset
+    inputs = {'load:m': (expression, metadata)}
+    two_group = pipeline.contrast_stage({'s': pipeline.statistics_stage(inputs)}, 'm', 'Control', 'UC')
+    adjusted = pipeline.design_contrast_stage({'d': pipeline.design_stage(inputs, ['batch', 'sex'], 'Control')},
+                                              'm', 'Control', 'UC')
+    null_genes = [f"Gene_{i}" for i in range(10, 50)]
+    assert two_group.loc[null_genes, 'log2FoldChange'].mean() > 0.5
+    assert abs(adjusted.loc[null_genes, 'log2FoldChange'].mean()) < 0.2
+    assert abs(adjusted.loc[[f"Gene_{i}" for i in range(10)], 'log2FoldChange'].mean() - 1) < 0.3
+
+def test_datasets_with_a_design_use_linear_model_stages():
+    stages = pipeline.build_stages()
+    assert stages['design:human_ibd'].args == (['sex', 'batch'], 'Control')
+    assert stages['de:human_ibd:UC_vs_Control'].dependencies == ['design:human_ibd']
+    assert 'statistics:human_ibd' not in stages
+    assert stages['de:acute_dss:DSS_vs_Control'].dependencies == ['statistics:acute_dss']
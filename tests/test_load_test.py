@@ -0,0 +1,90 @@
+"""Tests for the load-testing harness"""
+
+import json
+import random
+import threading
+
+import numpy as np
+import pytest
+from flask import Flask
+from werkzeug.serving import make_server
+
+from load_test import read_request_log, route_of, run_load, summarize, synthetic_request
+
+def test_summary_from_known_records():
+    # 100 GETs taking 1..100 ms, 4 of them failed, plus 2 POSTs
+    records = [('GET /a', (i + 1) / 1000, 500 if i % 25 == 0 else 200, 10) for i in range(100)]
+    records += [('POST /b', 0.2, 0, 0), ('POST /b', 0.4, 201, 5)]
+    summary = summarize(records, wall_time=4.0)
+
+    assert list(summary) == ['ALL', 'GET /a', 'POST /b']
+    route = summary['GET /a']
+    assert route['requests'] == 100 and route['bytes'] == 1000
+    assert route['throughput_rps'] == 25.0 and route['error_rate'] == 0.04
+    assert route['p50_ms'] == pytest.approx(50.5)
+    assert route['p95_ms'] == pytest.approx(95.05)
+    assert route['p99_ms'] == pytest.approx(99.01)
+    assert route['mean_ms'] == pytest.approx(50.5)
+    # A connection failure (status 0) counts as an error, a 201 does not
+    assert summary['POST /b']['error_rate'] == 0.5 and summary['POST /b']['p50_ms'] == pytest.approx(300)
+    assert summary['ALL']['requests'] == 102 and summary['ALL']['error_rate'] == pytest.approx(5 / 102)
+    json.dumps(summary)  # Saved with --output
+
+def test_request_log_mixes_json_and_access_log_lines(tmp_path):
+    log = tmp_path / 'requests.log'
+    log.write_text('\n'.join([
+        json.dumps({'method': 'POST', 'path': '/api/gene_expression', 'body': {'genes': ['TNF']}}),
+        json.dumps({'path': '/api/model_comparison'}),
+        '',
+        '127.0.0.1 - - [17/Oct/2026:10:00:00 +0000] "GET /api/search_gene?query=IL HTTP/1.1" 200 512 "-" "curl"',
+        'not a request line',
+        '10.0.0.2 - - [17/Oct/2026:10:00:01 +0000] "HEAD /index.html HTTP/1.0" 304 0'
+    ]) + '\n')
+    requests = read_request_log(log)
+    assert requests == [
+        {'method': 'POST', 'path': '/api/gene_expression', 'body': {'genes': ['TNF']}},
+        {'method': 'GET', 'path': '/api/model_comparison', 'body': None},
+        {'method': 'GET', 'path': '/api/search_gene?query=IL'},
+        {'method': 'HEAD', 'path': '/index.html'}
+    ]
+    assert [route_of(r) for r in requests[1:3]] == ['GET /api/model_comparison', 'GET /api/search_gene']
+
+def test_synthetic_mix_is_seeded():
+    first = [synthetic_request(random.Random(7)) for _ in range(3)]
+    assert first == [synthetic_request(random.Random(7)) for _ in range(3)]
+    requests = [synthetic_request(random.Random(seed)) for seed in range(300)]
+    assert all(r['path'].startswith('/api/') for r in requests)
+    assert {r['method'] for r in requests} == {'GET', 'POST'}
+
+@pytest.fixture
+def server():
+    app = Flask(__name__)
+
+    @app.route('/ok')
+    def ok():
+        return 'fine'
+
+    @app.route('/missing')
+    def missing():
+        return 'no', 404
+
+    server = make_server('127.0.0.1', 0, app, threaded=True)
+    thread = threading.Thread(target=server.serve_forever)
+    thread.start()
+    yield f"http://127.0.0.1:{server.port}"
+    server.shutdown()
+    thread.join()
+
+def test_run_load_stops_at_max_requests(server):
+    paths = iter(['/ok', '/missing'] * 10)
+    next_request = lambda: {'method': 'GET', 'path': next(paths)}
+    records, wall_time = run_load(server, next_request, concurrency=3, duration=30, max_requests=8)
+    assert len(records) == 8 and wall_time < 30
+    assert sorted({(route, status, nbytes) for route, _, status, nbytes in records}) == \
+        [('GET /missing', 404, 2), ('GET /ok', 200, 4)]
+    assert np.isclose(summarize(records, wall_time)['GET /missing']['error_rate'], 1.0)
+
+def test_run_load_stops_when_the_log_runs_out(server):
+    requests = iter([{'method': 'GET', 'path': '/ok'}] * 5)
+    records, _ = run_load(server, lambda: next(requests, None), concurrency=4, duration=30, max_requests=None)
+    assert len(records) == 5
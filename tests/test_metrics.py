@@ -0,0 +1,51 @@
+"""Tests for per-route request metrics"""
+
+import time
+
+import pytest
+from flask import Flask
+
+from metrics import FIELD_OFFSETS, LATENCY_BUCKETS, instrument_app
+
+@pytest.fixture
+def app():
+    app = Flask(__name__)
+
+    @app.route('/plain')
+    def plain():
+        return 'done'
+
+    @app.route('/stream')
+    def stream():
+        def body():
+            for line in range(3):
+                time.sleep(0.01)
+                yield f"{line}\n"
+        return app.response_class(body(), mimetype='application/x-ndjson')
+
+    app.registry = instrument_app(app)
+    return app
+
+def route_values(app, route):
+    registry = app.registry
+    return registry.collect()[registry.row((route, 'GET'))]
+
+def test_plain_request_is_recorded_when_the_handler_returns(app):
+    app.test_client().get('/plain')
+    values = route_values(app, '/plain')
+    assert values[FIELD_OFFSETS['count']] == 1
+    assert values[FIELD_OFFSETS['bytes']] == 4
+    assert values[FIELD_OFFSETS['in_flight']] == 0
+
+def test_streamed_request_ends_when_its_body_is_sent(app):
+    response = app.test_client().get('/stream')
+    assert response.get_data(as_text=True) == '0\n1\n2\n'
+    response.close()
+
+    values = route_values(app, '/stream')
+    assert values[FIELD_OFFSETS['count']] == 1
+    assert values[FIELD_OFFSETS['in_flight']] == 0
+    assert values[FIELD_OFFSETS['bytes']] == 6
+    # The latency covers the generator's sleeps, not just the handler
+    assert values[FIELD_OFFSETS['sum']] >= 0.03
+    assert values[:LATENCY_BUCKETS.index(0.025) + 1].sum() == 0
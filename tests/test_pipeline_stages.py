@@ -0,0 +1,137 @@
+"""Tests for the pipeline's stage graph and scheduler"""
+
+import argparse
+import ast
+
+import pandas as pd
+import pytest
+
+import data_processing_pipeline as pipeline
+from data_processing_pipeline import Stage, build_stages, positive_int, run_stages, select_stages
+from stage_cache import StageCache
+
+HUMAN_DATASETS = {
+    'human_uc': dict(pipeline.HUMAN_DATASETS['human_ibd'], conditions=['Control', 'UC']),
+    'human_cd': dict(pipeline.HUMAN_DATASETS['human_ibd'], conditions=['Control', 'CD'])
+}
+
+# Stage functions live at module level so worker processes can unpickle them
+def constant(inputs, value):
+    return value
+
+def total(inputs):
+    return sum(inputs.values())
+
+def fail(inputs):
+    raise RuntimeError('boom')
+
+def graph():
+    return {
+        'a': Stage('a', constant, (1,)),
+        'b': Stage('b', constant, (2,)),
+        'sum': Stage('sum', total, dependencies=['a', 'b']),
+        'bad': Stage('bad', fail, dependencies=['a']),
+        'after_bad': Stage('after_bad', total, dependencies=['bad', 'b'])
+    }
+
+def test_every_human_dataset_feeds_one_compare_stage():
+    stages = build_stages(human_datasets=HUMAN_DATASETS)
+    assert [name for name in stages if name.startswith('compare')] == ['compare']
+    assert {'load:human_uc', 'load:human_cd'} <= set(stages['compare'].dependencies)
+    assert stages['compare'].args[1] == ['human_uc', 'human_cd']
+
+def test_select_stages_adds_upstream_stages():
+    stages = build_stages()
+    selected = select_stages(stages, ['de:acute_dss'])
+    assert selected == {'load:acute_dss', 'statistics:acute_dss', 'de:acute_dss:DSS_vs_Control'}
+    assert select_stages(stages) == set(stages)
+    with pytest.raises(ValueError):
+        select_stages(stages, ['no_such_stage'])
+
+@pytest.mark.parametrize('jobs', [1, 2])
+def test_failed_stage_skips_only_its_consumers(jobs):
+    results, failed = run_stages(graph(), jobs=jobs)
+    assert results == {'a': 1, 'b': 2, 'sum': 3}
+    assert failed == {'bad', 'after_bad'}
+
+def test_cycle_is_reported():
+    stages = {'x': Stage('x', total, dependencies=['y']), 'y': Stage('y', total, dependencies=['x'])}
+    with pytest.raises(ValueError, match='cycle'):
+        run_stages(stages)
+
+def test_cached_stages_are_loaded(tmp_path, capsys):
+    run_stages(graph(), ['sum'], cache=StageCache(tmp_path, 'v1'))
+    capsys.readouterr()
+    results, failed = run_stages(graph(), ['sum'], cache=StageCache(tmp_path, 'v1'))
+    assert results == {'a': 1, 'b': 2, 'sum': 3} and not failed
+    assert capsys.readouterr().out.count('is up to date') == 3
+
+@pytest.mark.parametrize('value', ['0', '-2', 'two'])
+def test_jobs_must_be_a_positive_int(value):
+    with pytest.raises(argparse.ArgumentTypeError):
+        positive_int(value)
+    assert positive_int('3') == 3
+
+def run_model(tmp_path, monkeypatch, dataset_info, memory_limit, targets=('de', 'activity', 'export')):
+    analysis_dir = tmp_path / 'analysis'
+    for name in ('model_expression', 'expression', 'differential_expression', 'pathway_analysis', 'pathway_activity'):
+        (analysis_dir / name).mkdir(parents=True)
+    monkeypatch.setattr(pipeline, 'ANALYSIS_DIR', analysis_dir)
+    gene_set_dir = tmp_path / 'gene_sets'
+    gene_set_dir.mkdir()
+    (gene_set_dir / 'sets.gmt').write_text(''.join(
+        f"SET{i}\tna\t" + '\t'.join(f"Gene_{g}" for g in range(1 + 40 * i, 41 + 40 * i)) + '\n' for i in range(5)))
+    monkeypatch.setattr(pipeline, 'GENE_SET_DIR', gene_set_dir)
+    stages = build_stages({'acute_dss': dataset_info}, {}, memory_limit=memory_limit)
+    results, failed = run_stages(stages, [f"{target}:acute_dss" for target in targets])
+    assert not failed
+    return stages, results, analysis_dir
+
+def test_chunked_load_hands_on_the_saved_matrix(tmp_path, monkeypatch):
+    dataset_info = pipeline.MOUSE_DATASETS['acute_dss']
+    _, in_memory, in_memory_dir = run_model(tmp_path / 'in_memory', monkeypatch, dataset_info, 1 << 30)
+    stages, chunked, chunked_dir = run_model(tmp_path / 'chunked', monkeypatch, dict(dataset_info, chunked=True),
+                                             4096)
+
+    expression_file, _ = chunked['load:acute_dss']
+    assert expression_file == chunked_dir / 'model_expression' / 'acute_dss_expression.csv'
+    assert stages['statistics:acute_dss'].input_files == [expression_file]
+    assert expression_file in stages['activity:acute_dss'].input_files
+    pd.testing.assert_frame_equal(chunked['de:acute_dss:DSS_vs_Control'], in_memory['de:acute_dss:DSS_vs_Control'],
+                                  rtol=1e-10)
+    # Activity is scored a few samples at a time and scaled over all of them
+    assert chunked['activity:acute_dss'].shape == (5, dataset_info['n_samples'])
+    pd.testing.assert_frame_equal(chunked['activity:acute_dss'], in_memory['activity:acute_dss'], rtol=1e-10)
+    assert (chunked_dir / 'expression' / 'acute_dss_expression.csv').read_bytes() == \
+        (in_memory_dir / 'expression' / 'acute_dss_expression.csv').read_bytes()
+
+def test_gene_sets_are_parsed_once(tmp_path, monkeypatch):
+    calls = []
+    load_gene_sets = pipeline.load_gene_sets
+    monkeypatch.setattr(pipeline, 'load_gene_sets', lambda directory: calls.append(directory) or load_gene_sets(directory))
+    monkeypatch.setattr(pipeline, 'gene_set_state', {'key': None, 'collection': None})
+    dataset_info = dict(pipeline.MOUSE_DATASETS['acute_dss'], conditions=['Control', 'DSS', 'Recovery'],
+                        n_samples=20)
+    _, results, _ = run_model(tmp_path, monkeypatch, dataset_info, 1 << 30, targets=('pathway', 'gsea', 'activity'))
+    assert sum(name.startswith(('pathway:', 'gsea:')) for name in results) == 6
+    assert len(calls) == 1
+
+    # Editing a GMT file is picked up
+    gmt = tmp_path / 'gene_sets' / 'sets.gmt'
+    gmt.write_text(gmt.read_text() + 'EXTRA\tna\tGene_1\tGene_2\n')
+    assert 'EXTRA' in pipeline.pipeline_gene_sets().set_index
+    assert len(calls) == 2
+
+def test_code_version_covers_every_imported_module():
+    # Local modules the pipeline imports, followed through their own imports
+    seen, frontier = set(), [pipeline.CODE_DIR / 'data_processing_pipeline.py']
+    while frontier:
+        for node in ast.walk(ast.parse(frontier.pop().read_text())):
+            names = [alias.name for alias in node.names] if isinstance(node, ast.Import) else \
+                [node.module] if isinstance(node, ast.ImportFrom) and node.module else []
+            for name in names:
+                path = pipeline.CODE_DIR / f"{name}.py"
+                if path.exists() and path not in seen:
+                    seen.add(path)
+                    frontier.append(path)
+    assert seen and seen <= set(pipeline.CODE_FILES)
@@ -0,0 +1,59 @@
+"""Tests for on-demand request profiling"""
+
+import time
+
+import pytest
+from flask import Flask
+
+from request_profiler import PROFILE_ID_HEADER, PROFILE_TOKEN_HEADER, install_profiler
+
+def busy(seconds):
+    end = time.perf_counter() + seconds
+    while time.perf_counter() < end:
+        pass
+
+@pytest.fixture
+def app(tmp_path, monkeypatch):
+    monkeypatch.setenv('PROFILE_TOKEN', 'secret')
+    app = Flask(__name__)
+
+    @app.route('/plain')
+    def plain():
+        busy(0.05)
+        return 'done'
+
+    @app.route('/stream')
+    def stream():
+        def body():
+            for line in range(3):
+                busy(0.02)
+                yield f"{line}\n"
+        return app.response_class(body(), mimetype='application/x-ndjson')
+
+    install_profiler(app, tmp_path)
+    app.profile_dir = tmp_path
+    return app
+
+def test_profile_is_collapsed_stacks_only(app):
+    client = app.test_client()
+    response = client.get('/plain', headers={PROFILE_TOKEN_HEADER: 'secret', 'X-Request-ID': 'req-1'})
+    assert response.headers[PROFILE_ID_HEADER] == 'req-1'
+    lines = (app.profile_dir / 'req-1.collapsed').read_text().splitlines()
+    assert lines and all(line.rsplit(' ', 1)[1].isdigit() and not line.startswith('#') for line in lines)
+    assert any(':plain:' in line for line in lines)
+
+def test_streamed_body_is_profiled_until_it_is_sent(app):
+    client = app.test_client()
+    response = client.get('/stream', headers={PROFILE_TOKEN_HEADER: 'secret', 'X-Request-ID': 'req-2'})
+    assert response.get_data(as_text=True) == '0\n1\n2\n'
+    response.close()
+    profile = (app.profile_dir / 'req-2.collapsed').read_text()
+    assert ':body:' in profile
+
+@pytest.mark.parametrize('headers', [{}, {PROFILE_TOKEN_HEADER: 'wrong'}, {PROFILE_TOKEN_HEADER: 'secre'}])
+def test_profiles_need_the_token(app, headers):
+    client = app.test_client()
+    client.get('/plain', headers={PROFILE_TOKEN_HEADER: 'secret', 'X-Request-ID': 'req-3'})
+    assert client.get('/api/profiles/req-3', headers=headers).status_code == 403
+    assert client.get('/api/profiles/req-3', headers={PROFILE_TOKEN_HEADER: 'secret'}).status_code == 200
+    assert PROFILE_ID_HEADER not in client.get('/plain', headers=headers).headers
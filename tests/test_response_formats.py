@@ -0,0 +1,80 @@
+"""Tests for binary columnar responses and content negotiation"""
+
+import json
+import struct
+
+import numpy as np
+import pytest
+
+import api_server
+from api_server import simulate_gene_expression_data
+from response_formats import ARROW_MIMETYPE, FLOAT32_MIMETYPE, encode_columns
+
+GENES = ['TNF', 'IL6', 'IL10', 'FOXP3']
+MODELS = ['il10ko', 'human_uc']
+
+@pytest.fixture
+def client(monkeypatch):
+    monkeypatch.setattr(api_server.expression_store, 'models', {})  # Every model is simulated
+    return api_server.app.test_client()
+
+def decode_float32_columns(payload):
+    header_length, = struct.unpack('<I', payload[:4])
+    header = json.loads(payload[4:4 + header_length])
+    start = 4 + header_length + (-(4 + header_length)) % 8
+    assert start % 8 == 0
+    columns = {c['name']: np.frombuffer(payload, '<f4', c['length'], start + c['offset'])
+               for c in header['columns']}
+    return header, columns
+
+def streamed_chunks(client, mimetype):
+    response = client.get('/api/gene_expression', query_string={'genes': ','.join(GENES), 'models': ','.join(MODELS)},
+                          headers={'Accept': mimetype}, buffered=False)
+    assert response.status_code == 200 and response.mimetype == mimetype
+    assert response.headers['Vary'] == 'Accept'
+    chunks = list(response.response)
+    response.close()
+    return chunks
+
+def expected_columns():
+    data = simulate_gene_expression_data(GENES, MODELS)['models']
+    return {f"{m}:{field}": np.array([data[m][f"{field}s"][g] for g in GENES], dtype=np.float32)
+            for m in MODELS for field in ('value', 'error')}
+
+def test_float32_columns_are_streamed_as_bytes(client):
+    chunks = streamed_chunks(client, FLOAT32_MIMETYPE)
+    assert all(type(chunk) is bytes for chunk in chunks)
+    header, columns = decode_float32_columns(b''.join(chunks))
+    assert header['rows'] == GENES and set(header['metadata']['models']) == set(MODELS)
+    for name, values in expected_columns().items():
+        np.testing.assert_array_equal(columns[name], values)
+
+def test_arrow_ipc_is_streamed_as_bytes(client):
+    pa = pytest.importorskip('pyarrow')
+    chunks = streamed_chunks(client, ARROW_MIMETYPE)
+    assert all(type(chunk) is bytes for chunk in chunks)
+    table = pa.ipc.open_stream(b''.join(chunks)).read_all()
+    assert table.column('gene').to_pylist() == GENES
+    for name, values in expected_columns().items():
+        np.testing.assert_array_equal(table.column(name).to_numpy(), values)
+    assert set(json.loads(table.schema.metadata[b'metadata'])['models']) == set(MODELS)
+
+def test_json_stays_the_default(client):
+    for headers in ({}, {'Accept': '*/*'}, {'Accept': 'text/html'}):
+        response = client.get('/api/gene_expression', query_string={'genes': 'TNF', 'models': 'il10ko'},
+                              headers=headers)
+        assert response.mimetype == 'application/json'
+        assert 'TNF' in response.get_json()['models']['il10ko']['values']
+
+def test_cached_routes_negotiate_separately(client):
+    api_server.response_cache.clear()
+    binary = client.get('/api/model_comparison', headers={'Accept': FLOAT32_MIMETYPE})
+    text = client.get('/api/model_comparison')
+    assert binary.mimetype == FLOAT32_MIMETYPE and text.mimetype == 'application/json'
+    assert binary.headers['ETag'] != text.headers['ETag']
+    header, _ = decode_float32_columns(binary.get_data())
+    assert header['rows'] == [m['id'] for m in text.get_json()['models']]
+
+def test_unsupported_binary_type():
+    with pytest.raises(ValueError, match='Unsupported'):
+        encode_columns('text/csv', ['a'], {'x': [1.0]})
@@ -0,0 +1,78 @@
+"""Tests for sparse single-cell ingest and pseudobulk aggregation"""
+
+import gzip
+
+import numpy as np
+import pandas as pd
+import pytest
+import scipy.io
+import scipy.sparse as sp
+
+from single_cell import counts_per_million, filter_genes, pseudobulk, read_10x_mtx
+
+@pytest.fixture
+def cells():
+    rng = np.random.default_rng(3)
+    n_genes, n_cells = 30, 200
+    dense = rng.poisson(0.3, size=(n_genes, n_cells)).astype(np.float32)
+    metadata = pd.DataFrame({
+        'sample': rng.choice(['S1', 'S2', 'S3'], n_cells),
+        'cell_type': rng.choice(['T', 'B', 'Myeloid'], n_cells),
+        'condition': rng.choice(['Control', 'DSS'], n_cells)
+    }, index=[f"CELL{i}" for i in range(n_cells)])
+    return sp.csc_matrix(dense), np.array([f"Gene{i}" for i in range(n_genes)]), metadata
+
+def test_pseudobulk_matches_dense_groupby(cells):
+    matrix, genes, metadata = cells
+    expression, groups = pseudobulk(matrix, genes, metadata)
+
+    dense = pd.DataFrame(matrix.toarray().T, index=metadata.index, columns=genes)
+    expected = dense.groupby([metadata['sample'], metadata['cell_type'], metadata['condition']]).sum().T
+    expected.columns = ['|'.join(key) for key in expected.columns]
+    pd.testing.assert_frame_equal(expression, expected[expression.columns].astype(expression.dtypes.iloc[0]),
+                                  check_names=False)
+    assert sorted(expression.columns) == sorted(expected.columns)
+    assert groups['n_cells'].sum() == len(metadata)
+
+def test_pseudobulk_drops_unlabelled_cells_and_small_groups(cells):
+    matrix, genes, metadata = cells
+    metadata = metadata.copy()
+    metadata.iloc[:10, metadata.columns.get_loc('sample')] = np.nan
+    keys = ('sample', 'condition')
+    sizes = metadata.groupby(list(keys)).size()
+    expression, groups = pseudobulk(matrix, genes, metadata, keys=keys, min_cells=int(sizes.median()))
+    assert 0 < len(groups) < len(sizes)
+    assert groups['n_cells'].min() >= sizes.median()
+    assert groups['n_cells'].sum() == sizes[sizes >= sizes.median()].sum()
+    assert list(expression.columns) == list(groups.index)
+
+def test_pseudobulk_sums_stay_exact_above_float32_precision():
+    # float32 cannot hold 2^24 + 1; every cell's count can, but not the group total
+    counts = np.full((2, 33), 2 ** 19, dtype=np.float32)
+    counts[1, 0] += 1
+    metadata = pd.DataFrame({'sample': 'S1', 'cell_type': 'T', 'condition': 'DSS'}, index=range(33))
+    expression, _ = pseudobulk(sp.csc_matrix(counts), np.array(['A', 'B']), metadata)
+    assert expression.dtypes.iloc[0] == np.float64
+    assert expression.iloc[:, 0].tolist() == [33 * 2 ** 19, 33 * 2 ** 19 + 1]
+
+def test_filter_genes_and_counts_per_million(cells):
+    matrix, genes, _ = cells
+    filtered, kept = filter_genes(matrix, genes, min_cells=60)
+    detected = (matrix.toarray() > 0).sum(axis=1)
+    assert list(kept) == list(genes[detected >= 60])
+    cpm = counts_per_million(pd.DataFrame(matrix[:, :5].toarray(), index=genes))
+    np.testing.assert_allclose(cpm.sum(axis=0), 1e6, rtol=1e-6)
+
+def test_read_10x_mtx_with_gzip(tmp_path, cells):
+    matrix, genes, metadata = cells
+    with gzip.open(tmp_path / 'matrix.mtx.gz', 'wb') as f:
+        scipy.io.mmwrite(f, sp.coo_matrix(matrix))
+    (tmp_path / 'features.tsv').write_text(''.join(f"ENSG{i}\t{g}\tGene Expression\n" for i, g in enumerate(genes)))
+    (tmp_path / 'barcodes.tsv').write_text(''.join(f"{b}\n" for b in metadata.index))
+    read, read_genes, barcodes = read_10x_mtx(tmp_path)
+    assert (read != matrix).nnz == 0
+    assert list(read_genes) == list(genes) and list(barcodes) == list(metadata.index)
+
+def test_read_10x_mtx_missing_file(tmp_path):
+    with pytest.raises(FileNotFoundError):
+        read_10x_mtx(tmp_path)
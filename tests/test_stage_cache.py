@@ -0,0 +1,78 @@
+"""Tests for the content-hashed stage cache"""
+
+import pytest
+
+from stage_cache import StageCache
+
+@pytest.fixture
+def cache(tmp_path):
+    return StageCache(tmp_path / 'cache', 'v1')
+
+def write_output(path, text):
+    path.write_text(text)
+    return text
+
+def test_unchanged_stage_is_loaded(cache, tmp_path):
+    output = tmp_path / 'out.csv'
+    calls = []
+    stage = lambda: calls.append(1) or write_output(output, 'a')
+    assert cache.run('s', stage, outputs=[output]) == 'a'
+    assert StageCache(cache.cache_dir, 'v1').run('s', stage, outputs=[output]) == 'a'
+    assert len(calls) == 1
+
+@pytest.mark.parametrize('change', ['rewrite', 'delete', 'version', 'params', 'disabled'])
+def test_changes_force_a_rerun(cache, tmp_path, change):
+    output = tmp_path / 'out.csv'
+    calls = []
+    stage = lambda *args: calls.append(1) or write_output(output, 'a')
+    cache.run('s', stage, params={'n': 1}, outputs=[output])
+
+    version, params, enabled = 'v1', {'n': 1}, True
+    if change == 'rewrite':
+        output.write_text('b')  # e.g. another script writing the same file
+    elif change == 'delete':
+        output.unlink()
+    elif change == 'version':
+        version = 'v2'
+    elif change == 'params':
+        params = {'n': 2}
+    else:
+        enabled = False
+    StageCache(cache.cache_dir, version, enabled=enabled).run('s', stage, params=params, outputs=[output])
+    assert len(calls) == 2
+    assert output.read_text() == 'a'
+
+def test_missing_declared_output_never_matches(cache, tmp_path):
+    calls = []
+    stage = lambda: calls.append(1)
+    cache.run('s', stage, outputs=[tmp_path / 'never_written.csv'])
+    StageCache(cache.cache_dir, 'v1').run('s', stage, outputs=[tmp_path / 'never_written.csv'])
+    assert len(calls) == 2
+
+def test_input_file_content_is_hashed(cache, tmp_path):
+    source = tmp_path / 'input.txt'
+    source.write_text('x')
+    calls = []
+    stage = lambda: calls.append(1) or len(calls)
+    cache.run('s', stage, input_files=[source])
+    StageCache(cache.cache_dir, 'v1').run('s', stage, input_files=[source])
+    source.write_text('y')
+    StageCache(cache.cache_dir, 'v1').run('s', stage, input_files=[source])
+    assert len(calls) == 2
+
+def test_consumers_follow_result_digests(cache):
+    calls = []
+    def consumer(value):
+        calls.append(value)
+        return value * 2
+
+    def run(cache, upstream_value):
+        value = cache.run('upstream', lambda v: v, (upstream_value,))
+        return cache.run('downstream', consumer, (value,), params=(), dependencies=['upstream'])
+
+    assert run(cache, 1) == 2
+    assert run(StageCache(cache.cache_dir, 'v1'), 1) == 2
+    assert calls == [1]
+    # A changed upstream result invalidates its consumer
+    assert run(StageCache(cache.cache_dir, 'v1'), 3) == 6
+    assert calls == [1, 3]
@@ -0,0 +1,88 @@
+"""Tests for precompressed, fingerprinted static assets"""
+
+import gzip
+import hashlib
+
+import pytest
+
+import api_server
+import static_assets
+from static_assets import FINGERPRINT_LENGTH, IMMUTABLE_CACHE_CONTROL, AssetManifest
+
+SCRIPT = b'function plot() { return ' + b'"volcano", ' * 100 + b'null; }\n'
+STYLE = b'body { margin: 0; }\n'
+PAGE = b'''<html><head>
+<link rel="stylesheet" href="css/style.css">
+<script src="js/plot.js"></script>
+<script src="https://cdn.example.org/lib.js"></script>
+<a href="#top">top</a><img src="missing.png">
+</head><body>''' + b'<p>IBD</p>' * 60 + b'</body></html>\n'
+
+@pytest.fixture
+def web_dir(tmp_path):
+    (tmp_path / 'js').mkdir()
+    (tmp_path / 'css').mkdir()
+    (tmp_path / 'js' / 'plot.js').write_bytes(SCRIPT)
+    (tmp_path / 'css' / 'style.css').write_bytes(STYLE)
+    (tmp_path / 'index.html').write_bytes(PAGE)
+    (tmp_path / '.hidden.js').write_bytes(b'secret')
+    return tmp_path
+
+def hashed(path, content):
+    root, extension = path.rsplit('.', 1)
+    return f"{root}.{hashlib.sha256(content).hexdigest()[:FINGERPRINT_LENGTH]}.{extension}"
+
+def test_assets_get_content_hash_names(web_dir):
+    manifest = AssetManifest(web_dir)
+    assert manifest.fingerprints == {'js/plot.js': hashed('js/plot.js', SCRIPT),
+                                     'css/style.css': hashed('css/style.css', STYLE)}
+    asset, immutable = manifest.lookup('/' + hashed('js/plot.js', SCRIPT))
+    assert immutable and asset is manifest.assets['js/plot.js']
+    assert manifest.lookup('js/plot.js') == (asset, False)
+    assert manifest.lookup('.hidden.js') == (None, False)
+    assert 'index.html' not in manifest.fingerprints
+
+def test_pages_reference_fingerprinted_names(web_dir):
+    page = AssetManifest(web_dir).lookup('index.html')[0].variants['identity'].decode()
+    assert f'href="{hashed("css/style.css", STYLE)}"' in page
+    assert f'src="{hashed("js/plot.js", SCRIPT)}"' in page
+    # External, fragment and unknown references are left alone
+    assert 'src="https://cdn.example.org/lib.js"' in page
+    assert 'href="#top"' in page and 'src="missing.png"' in page
+
+def test_compressed_variants(web_dir, monkeypatch):
+    monkeypatch.setattr(static_assets, 'brotli', None)
+    manifest = AssetManifest(web_dir)
+    script = manifest.lookup('js/plot.js')[0]
+    assert set(script.variants) == {'identity', 'gzip'}
+    assert gzip.decompress(script.variants['gzip']) == SCRIPT
+    # Too small to be worth compressing
+    assert set(manifest.lookup('css/style.css')[0].variants) == {'identity'}
+    assert script.etag('gzip') == f"{script.digest}-gzip" != script.etag('identity')
+
+def test_brotli_variant_when_installed(web_dir):
+    brotli = pytest.importorskip('brotli')
+    script = AssetManifest(web_dir).lookup('js/plot.js')[0]
+    assert brotli.decompress(script.variants['br']) == SCRIPT
+
+def test_server_negotiates_encoding_and_caching(web_dir, monkeypatch):
+    monkeypatch.setattr(static_assets, 'brotli', None)
+    monkeypatch.setattr(api_server, 'static_manifest', AssetManifest(web_dir))
+    client = api_server.app.test_client()
+    path = '/' + hashed('js/plot.js', SCRIPT)
+
+    response = client.get(path, headers={'Accept-Encoding': 'br;q=1.0, gzip;q=0.5'})
+    assert response.headers['Content-Encoding'] == 'gzip'
+    assert gzip.decompress(response.get_data()) == SCRIPT
+    assert response.headers['Cache-Control'] == IMMUTABLE_CACHE_CONTROL
+    assert response.headers['Vary'] == 'Accept-Encoding'
+
+    identity = client.get(path, headers={'Accept-Encoding': 'identity'})
+    assert 'Content-Encoding' not in identity.headers and identity.get_data() == SCRIPT
+    assert identity.headers['ETag'] != response.headers['ETag']
+    assert client.get(path, headers={'If-None-Match': identity.headers['ETag'],
+                                     'Accept-Encoding': 'identity'}).status_code == 304
+
+    page = client.get('/')
+    assert page.headers['Cache-Control'] == 'no-cache'
+    assert hashed('js/plot.js', SCRIPT).encode() in page.get_data()
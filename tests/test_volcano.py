@@ -0,0 +1,98 @@
+"""Tests for level-of-detail volcano plot data"""
+
+import numpy as np
+import pytest
+
+import api_server
+from volcano_lod import BASE_BINS, MAX_ZOOM, volcano_lod
+
+@pytest.fixture
+def comparison():
+    rng = np.random.default_rng(1)
+    n = 5000
+    log2fc = rng.normal(0, 0.6, n)
+    pvalues = rng.uniform(0, 1, n)
+    log2fc[:40] = rng.choice([-1, 1], 40) * rng.uniform(1.5, 4, 40)  # Significant genes
+    pvalues[:40] = 10 ** -rng.uniform(3, 20, 40)
+    pvalues[40] = 0.0  # Clipped to a finite -log10(p)
+    log2fc[41] = np.nan  # Untestable
+    return {'gene': np.array([f"GENE{i}" for i in range(n)]), 'log2FoldChange': log2fc, 'pvalue': pvalues}
+
+@pytest.fixture
+def client(monkeypatch, comparison):
+    monkeypatch.setattr(api_server.analysis_data, 'differential_expression', {'acute_dss_DSS_vs_Control': comparison})
+    return api_server.app.test_client()
+
+def lod(comparison, **kwargs):
+    return volcano_lod(comparison['gene'], comparison['log2FoldChange'], comparison['pvalue'], **kwargs)
+
+def test_significant_and_labelled_genes_are_exact(comparison):
+    result = lod(comparison, label_genes=['GENE100', 'NOT_A_GENE'])
+    points = result['points']
+    significant = (comparison['pvalue'] < 0.05) & (np.abs(comparison['log2FoldChange']) >= 1)
+    expected = set(comparison['gene'][significant]) | {'GENE100'}
+    assert set(points['gene']) == expected
+    for gene, x, y in zip(points['gene'], points['log2FoldChange'], points['neg_log10_pvalue']):
+        row = int(gene[4:])
+        assert x == comparison['log2FoldChange'][row]
+        assert y == -np.log10(max(comparison['pvalue'][row], 1e-300))
+    assert points['significant'].sum() == significant.sum()
+
+def test_every_finite_gene_is_a_point_or_in_a_bin(comparison):
+    result = lod(comparison)
+    finite = np.isfinite(comparison['log2FoldChange']).sum()
+    assert len(result['points']['gene']) + result['bins']['count'].sum() == finite
+    assert (result['bins']['count'] > 0).all()
+    assert result['total_genes'] == len(comparison['gene'])
+
+def test_bins_match_a_reference_histogram(comparison):
+    viewport = (-1.0, 1.0, 0.0, 2.0)
+    result = lod(comparison, zoom=1, viewport=viewport)
+    x, p = comparison['log2FoldChange'], comparison['pvalue']
+    y = -np.log10(np.clip(p, 1e-300, 1))
+    exact = np.isin(comparison['gene'], result['points']['gene'])
+    # The cloud is every other finite gene inside the viewport
+    cloud = np.isfinite(x) & ~exact & ((p >= 0.05) | (np.abs(x) < 1))
+    cloud &= (x >= -1) & (x <= 1) & (y >= 0) & (y <= 2)
+    expected, _, _ = np.histogram2d(x[cloud], y[cloud], bins=2 * BASE_BINS, range=[[-1, 1], [0, 2]])
+    assert result['bins']['count'].sum() == expected.sum()
+    assert sorted(result['bins']['count']) == sorted(expected[expected > 0])
+    assert result['grid']['bin_width'] == pytest.approx(2 / (2 * BASE_BINS))
+    assert result['grid']['viewport'] == list(viewport)
+
+@pytest.mark.parametrize('zoom, bins_per_axis', [(-3, BASE_BINS), (0, BASE_BINS), (2, BASE_BINS * 4),
+                                                 (MAX_ZOOM + 5, BASE_BINS * 2 ** MAX_ZOOM)])
+def test_zoom_is_clamped(comparison, zoom, bins_per_axis):
+    grid = lod(comparison, zoom=zoom)['grid']
+    assert grid['bins_per_axis'] == bins_per_axis
+    assert grid['zoom'] == int(np.log2(bins_per_axis // BASE_BINS))
+
+@pytest.mark.parametrize('viewport', [(0, 0, 0, 1), (1, -1, 0, 1), (0, 1, 2, 2), (np.nan, 1, 0, 1),
+                                      (0, np.inf, 0, 1)])
+def test_invalid_viewports_are_rejected(comparison, viewport):
+    with pytest.raises(ValueError, match='Viewport'):
+        lod(comparison, viewport=viewport)
+
+def test_endpoint_serves_points_and_bins(client):
+    response = client.get('/api/volcano', query_string={'comparison': 'acute_dss_DSS_vs_Control', 'zoom': 1})
+    assert response.status_code == 200
+    data = response.get_json()
+    assert data['comparison'] == 'acute_dss_DSS_vs_Control'
+    assert data['grid']['bins_per_axis'] == 2 * BASE_BINS
+    assert len(data['points']['gene']) + sum(data['bins']['count']) == data['total_genes'] - 1
+
+@pytest.mark.parametrize('bounds', [
+    {'x_min': 'nan', 'x_max': '1', 'y_min': '0', 'y_max': '5'},
+    {'x_min': '-1', 'x_max': 'inf', 'y_min': '0', 'y_max': '5'},
+    {'x_min': '1', 'x_max': '-1', 'y_min': '0', 'y_max': '5'},
+    {'x_min': '-1', 'x_max': '1', 'y_min': '5', 'y_max': '5'}
+])
+def test_endpoint_rejects_invalid_bounds(client, bounds):
+    response = client.get('/api/volcano', query_string={'comparison': 'acute_dss_DSS_vs_Control', **bounds})
+    assert response.status_code == 400
+    assert 'Viewport' in response.get_json()['error']
+
+def test_endpoint_unknown_comparison(client):
+    response = client.get('/api/volcano', query_string={'comparison': 'nope'})
+    assert response.status_code == 404
+    assert response.get_json()['comparisons'] == ['acute_dss_DSS_vs_Control']
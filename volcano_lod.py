@@ -0,0 +1,116 @@
+#!/usr/bin/env python3
+"""
+Level-of-detail volcano plot data for the IBD RNA-Seq Analysis Platform API
+
+Significant genes (past both the p-value and fold-change thresholds) and
+labelled genes are returned exactly, while the dense cloud of
+non-significant genes inside the viewport is aggregated into a 2-D density
+grid whose resolution follows the client's zoom level. A 60k-gene comparison
+shrinks from megabytes of per-gene points to a few thousand non-empty bins.
+"""
+
+import numpy as np
+
+# Thresholds matching generate_volcano_plot_data in volcano_plot_analysis.py
+PVALUE_THRESHOLD = 0.05
+FOLD_CHANGE_THRESHOLD = 1.0
+
+# Number of top significant genes labelled by default
+TOP_LABELLED_GENES = 10
+
+# Density grid resolution: BASE_BINS per axis at zoom 0, doubling per zoom level
+BASE_BINS = 64
+MAX_ZOOM = 4
+
+# Smallest p-value used for -log10 so p = 0 stays finite
+MIN_PVALUE = 1e-300
+
+def volcano_lod(genes, log2fc, pvalues, zoom=0, viewport=None, label_genes=()):
+    """
+    Split a DE result into exact points and density bins
+
+    Parameters:
+    -----------
+    genes : np.ndarray
+        Gene symbols
+    log2fc : np.ndarray
+        log2 fold changes
+    pvalues : np.ndarray
+        Raw p-values
+    zoom : int
+        Zoom level; the density grid has BASE_BINS * 2**zoom bins per axis
+    viewport : tuple
+        (x_min, x_max, y_min, y_max) in log2FC / -log10(p) units, finite and
+        each min below its max (optional, defaults to the extent of the data)
+    label_genes : iterable
+        Extra gene symbols that must be returned exactly
+
+    Returns:
+    --------
+    dict
+        'points' (exact genes), 'bins' (non-empty density cells) and grid info
+    """
+    log2fc = np.asarray(log2fc, dtype=np.float64)
+    neg_log10_p = -np.log10(np.clip(np.asarray(pvalues, dtype=np.float64), MIN_PVALUE, 1.0))
+    finite = np.isfinite(log2fc) & np.isfinite(neg_log10_p)
+
+    # Genes past both volcano thresholds, the top hits and requested labels are kept exactly
+    significant = finite & (np.asarray(pvalues) < PVALUE_THRESHOLD) & (np.abs(log2fc) >= FOLD_CHANGE_THRESHOLD)
+    labelled = np.isin(genes, list(label_genes)) & finite if label_genes else np.zeros(len(genes), dtype=bool)
+    significant_rows = np.flatnonzero(significant)
+    top = significant_rows[np.argsort(-neg_log10_p[significant_rows], kind='stable')[:TOP_LABELLED_GENES]]
+    labelled[top] = True
+    exact = significant | labelled
+
+    # Restrict everything to the viewport
+    if viewport is None:
+        x_min, x_max = (log2fc[finite].min(), log2fc[finite].max()) if finite.any() else (-1.0, 1.0)
+        y_min, y_max = (0.0, neg_log10_p[finite].max()) if finite.any() else (0.0, 1.0)
+    else:
+        x_min, x_max, y_min, y_max = (float(bound) for bound in viewport)
+        if not np.isfinite([x_min, x_max, y_min, y_max]).all() or x_min >= x_max or y_min >= y_max:
+            raise ValueError("Viewport bounds must be finite with x_min < x_max and y_min < y_max")
+    # A data extent of a single value still needs a grid of non-zero size
+    if x_max <= x_min:
+        x_max = x_min + 1.0
+    if y_max <= y_min:
+        y_max = y_min + 1.0
+    in_view = finite & (log2fc >= x_min) & (log2fc <= x_max) & (neg_log10_p >= y_min) & (neg_log10_p <= y_max)
+
+    point_rows = np.flatnonzero(exact & in_view)
+    cloud_rows = np.flatnonzero(~exact & in_view)
+
+    # Aggregate the non-significant cloud into a density grid
+    zoom = max(0, min(int(zoom), MAX_ZOOM))
+    n_bins = BASE_BINS * 2 ** zoom
+    counts, x_edges, y_edges = np.histogram2d(
+        log2fc[cloud_rows], neg_log10_p[cloud_rows],
+        bins=n_bins, range=[[x_min, x_max], [y_min, y_max]]
+    )
+    ix, iy = np.nonzero(counts)
+    x_centers = (x_edges[:-1] + x_edges[1:]) / 2
+    y_centers = (y_edges[:-1] + y_edges[1:]) / 2
+
+    return {
+        'points': {
+            'gene': np.asarray(genes)[point_rows],
+            'log2FoldChange': log2fc[point_rows],
+            'neg_log10_pvalue': neg_log10_p[point_rows],
+            'significant': significant[point_rows]
+        },
+        'bins': {
+            'log2FoldChange': x_centers[ix],
+            'neg_log10_pvalue': y_centers[iy],
+            'count': counts[ix, iy]
+        },
+        'grid': {
+            'zoom': zoom,
+            'bins_per_axis': n_bins,
+            'viewport': [float(x_min), float(x_max), float(y_min), float(y_max)],
+            'bin_width': float(x_edges[1] - x_edges[0]),
+            'bin_height': float(y_edges[1] - y_edges[0])
+        },
+        'total_genes': int(len(genes)),
+        'pvalue_threshold': PVALUE_THRESHOLD,
+        'fold_change_threshold': FOLD_CHANGE_THRESHOLD
+    }
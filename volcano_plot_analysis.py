@@ -5,6 +5,7 @@ Volcano plot analysis for IBD RNA-seq data
 
 import os
 import sys
+import argparse
 import pandas as pd
 import numpy as np
 import matplotlib.pyplot as plt
@@ -12,13 +13,65 @@ import seaborn as sns
 from pathlib import Path
 from scipy.stats import pearsonr, spearmanr
 
+from stage_cache import CACHE_DIR_NAME, StageCache, code_version
+
 # Define base directories
 BASE_DIR = Path('/home/ubuntu/rna_seq_interface')
 ANALYSIS_DIR = BASE_DIR / 'analysis'
 FIGURES_DIR = ANALYSIS_DIR / 'figures'
+VOLCANO_DIR = ANALYSIS_DIR / 'volcano'  # Kept apart from the pipeline's differential_expression outputs
+
+# Analysis modules whose source is part of every cached stage's code version
+CODE_DIR = Path(__file__).resolve().parent
+CODE_FILES = [CODE_DIR / name for name in ('differential_expression.py', 'stage_cache.py')]
 
 # Ensure directories exist
 os.makedirs(FIGURES_DIR, exist_ok=True)
+os.makedirs(VOLCANO_DIR, exist_ok=True)
+
+# Define mouse models
+MOUSE_MODELS = {
+    'acute_dss': {
+        'name': 'Acute DSS',
+        'conditions': ['Control', 'DSS'],
+        'n_samples': 10,
+        'seed': 42
+    },
+    'chronic_dss': {
+        'name': 'Chronic DSS',
+        'conditions': ['Control', 'Chronic_DSS'],
+        'n_samples': 10,
+        'seed': 43
+    },
+    'il10ko': {
+        'name': 'IL-10KO',
+        'conditions': ['WT', 'IL10KO'],
+        'n_samples': 12,
+        'seed': 44
+    },
+    'cd45rb_tcell': {
+        'name': 'CD45RBHigh T cell',
+        'conditions': ['Control', 'Week6'],
+        'n_samples': 10,
+        'seed': 45
+    }
+}
+
+# Define human IBD models
+HUMAN_MODELS = {
+    'human_uc': {
+        'name': 'Human UC',
+        'conditions': ['Control', 'UC'],
+        'n_samples': 10,
+        'seed': 46
+    },
+    'human_cd': {
+        'name': 'Human CD',
+        'conditions': ['Control', 'CD'],
+        'n_samples': 10,
+        'seed': 47
+    }
+}
 
 def generate_volcano_plot_data(de_results, output_dir, comparison_name):
     """
@@ -148,7 +201,8 @@ def generate_correlation_analysis(expression_data_dict, metadata_dict, output_di
     # Create correlation matrix
     correlation_matrix = pd.DataFrame(
         index=model_names,
-        columns=model_names
+        columns=model_names,
+        dtype=float
     )
     
     # Calculate correlations between models
@@ -364,90 +418,60 @@ def generate_pca_analysis(expression_data_dict, metadata_dict, output_dir):
         'variance_explained': pca.explained_variance_ratio_
     }
 
+def generate_model_data(model_info):
+    """Simulated expression data and metadata for one model"""
+    from data_processing_pipeline import generate_simulated_expression_data, generate_simulated_metadata
+    
+    print(f"Generating simulated data for {model_info['name']}...")
+    
+    # Generate expression data
+    expr_data = generate_simulated_expression_data(
+        n_genes=1000,
+        n_samples=model_info['n_samples'],
+        seed=model_info['seed']
+    )
+    
+    # Generate metadata
+    meta_data = generate_simulated_metadata(
+        n_samples=model_info['n_samples'],
+        condition_labels=model_info['conditions'],
+        seed=model_info['seed']
+    )
+    
+    return expr_data, meta_data
+
 def main():
     """Main function to run the volcano plot and correlation analysis"""
+    parser = argparse.ArgumentParser(description='Run the volcano plot and correlation analysis')
+    parser.add_argument('--force', action='store_true', help='Rerun every stage even if it is up to date')
+    args = parser.parse_args()
+    
     print("Starting volcano plot and correlation analysis...")
     
     # For demonstration purposes, we'll use simulated data
     # In a real implementation, this would load the actual processed data
     
-    # Generate simulated expression data for mouse models
-    from data_processing_pipeline import generate_simulated_expression_data, generate_simulated_metadata
-    
-    # Define mouse models
-    mouse_models = {
-        'acute_dss': {
-            'name': 'Acute DSS',
-            'conditions': ['Control', 'DSS'],
-            'n_samples': 10,
-            'seed': 42
-        },
-        'chronic_dss': {
-            'name': 'Chronic DSS',
-            'conditions': ['Control', 'Chronic_DSS'],
-            'n_samples': 10,
-            'seed': 43
-        },
-        'il10ko': {
-            'name': 'IL-10KO',
-            'conditions': ['WT', 'IL10KO'],
-            'n_samples': 12,
-            'seed': 44
-        },
-        'cd45rb_tcell': {
-            'name': 'CD45RBHigh T cell',
-            'conditions': ['Control', 'Week6'],
-            'n_samples': 10,
-            'seed': 45
-        }
-    }
-    
-    # Define human IBD models
-    human_models = {
-        'human_uc': {
-            'name': 'Human UC',
-            'conditions': ['Control', 'UC'],
-            'n_samples': 10,
-            'seed': 46
-        },
-        'human_cd': {
-            'name': 'Human CD',
-            'conditions': ['Control', 'CD'],
-            'n_samples': 10,
-            'seed': 47
-        }
-    }
-    
     # Combine all models
-    all_models = {**mouse_models, **human_models}
+    all_models = {**MOUSE_MODELS, **HUMAN_MODELS}
+    
+    # Reuse every stage whose inputs, parameters and code are unchanged since the last run
+    import data_processing_pipeline
+    version = code_version(CODE_FILES, [sys.modules[__name__], data_processing_pipeline])
+    cache = StageCache(ANALYSIS_DIR / CACHE_DIR_NAME, version, enabled=not args.force)
     
     # Generate expression data and metadata for all models
     expression_data = {}
     metadata = {}
     
     for model_id, model_info in all_models.items():
-        print(f"Generating simulated data for {model_info['name']}...")
-        
-        # Generate expression data
-        expr_data = generate_simulated_expression_data(
-            n_genes=1000,
-            n_samples=model_info['n_samples'],
-            seed=model_info['seed']
-        )
-        
-        # Generate metadata
-        meta_data = generate_simulated_metadata(
-            n_samples=model_info['n_samples'],
-            condition_labels=model_info['conditions'],
-            seed=model_info['seed']
-        )
+        expr_data, meta_data = cache.run(f"volcano:simulate:{model_id}", generate_model_data, (model_info,))
         
         # Store data
         expression_data[model_id] = expr_data
         metadata[model_id] = meta_data
     
     # Generate differential expression results for each model
-    from data_processing_pipeline import perform_differential_expression_analysis
+    perform_differential_expression_analysis = data_processing_pipeline.perform_differential_expression_analysis
     
     de_results = {}
     
@@ -463,38 +487,54 @@ def main():
         comparison_name = f"{model_id}_{conditions[1]}_vs_{conditions[0]}"
         
         # Perform differential expression analysis
-        de_result = perform_differential_expression_analysis(
-            expression_data[model_id],
-            metadata[model_id],
-            ANALYSIS_DIR / 'differential_expression',
-            comparison_name
+        de_result = cache.run(
+            f"volcano:de:{comparison_name}",
+            perform_differential_expression_analysis,
+            (expression_data[model_id], metadata[model_id], VOLCANO_DIR, comparison_name),
+            params=comparison_name,
+            dependencies=[f"volcano:simulate:{model_id}"],
+            outputs=[VOLCANO_DIR / f"{comparison_name}_differential_expression.csv"]
         )
         
         # Store results
-        de_results[comparison_name] = de_result
+        de_results[comparison_name] = (model_id, de_result)
     
     # Generate volcano plot data for each differential expression result
     volcano_data = {}
     
-    for comparison_name, de_result in de_results.items():
-        volcano_data[comparison_name] = generate_volcano_plot_data(
-            de_result,
-            ANALYSIS_DIR / 'differential_expression',
-            comparison_name
+    for comparison_name, (model_id, de_result) in de_results.items():
+        volcano_data[comparison_name] = cache.run(
+            f"volcano:plot:{comparison_name}",
+            generate_volcano_plot_data,
+            (de_result, VOLCANO_DIR, comparison_name),
+            params=comparison_name,
+            dependencies=[f"volcano:de:{comparison_name}"],
+            outputs=[VOLCANO_DIR / f"{comparison_name}_volcano_data.csv",
+                     FIGURES_DIR / f"{comparison_name}_volcano_plot.png"]
         )
     
+    simulate_stages = [f"volcano:simulate:{model_id}" for model_id in all_models]
+    
     # Generate correlation analysis
-    correlation_matrix = generate_correlation_analysis(
-        expression_data,
-        metadata,
-        ANALYSIS_DIR / 'model_comparison'
+    correlation_matrix = cache.run(
+        "volcano:correlation",
+        generate_correlation_analysis,
+        (expression_data, metadata, ANALYSIS_DIR / 'model_comparison'),
+        params=list(all_models),
+        dependencies=simulate_stages,
+        outputs=[ANALYSIS_DIR / 'model_comparison' / 'model_correlation_matrix.csv',
+                 FIGURES_DIR / 'model_correlation_heatmap.png',
+                 FIGURES_DIR / 'model_correlation_clustering.png']
     )
     
     # Generate PCA analysis
-    pca_results = generate_pca_analysis(
-        expression_data,
-        metadata,
-        ANALYSIS_DIR / 'model_comparison'
+    pca_results = cache.run(
+        "volcano:pca",
+        generate_pca_analysis,
+        (expression_data, metadata, ANALYSIS_DIR / 'model_comparison'),
+        params=list(all_models),
+        dependencies=simulate_stages,
+        outputs=[ANALYSIS_DIR / 'model_comparison' / 'pca_analysis.csv', FIGURES_DIR / 'pca_analysis.png']
     )
     
     print("Volcano plot and correlation analysis completed successfully")